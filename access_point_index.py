@@ -0,0 +1,78 @@
+from itertools import combinations
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from trilateration import AccessPointRegistry
+
+DEFAULT_NUM_ACCESS_POINTS = 5  # Access points used per fix
+MAX_CANDIDATES = 12  # Nearest access points considered when choosing the best geometry
+MAX_RANGE = 60  # Access points further than this (m) plus the position uncertainty are never heard reliably
+MIN_DISTANCE = 0.5  # Clamp so an access point right on top of the device doesn't dominate
+VISIBLE_SEARCH_FACTOR = 4  # Neighbours searched per candidate when filtering to access points currently heard
+
+class AccessPointSpatialIndex:
+    def __init__(self, registry: AccessPointRegistry,
+                       max_candidates: int = MAX_CANDIDATES,
+                       max_range: float = MAX_RANGE) -> None:
+        self._registry = registry
+        self._tree = cKDTree(registry.positions)
+        self._max_candidates = min(max_candidates, len(registry))
+        self._max_range = max_range
+
+        # All starting triples of candidate slots, evaluated together for the best initial geometry
+        self._triples = {count: np.array(list(combinations(range(count), 3)), dtype=int).reshape(-1, 3)
+                         for count in range(3, self._max_candidates + 1)}
+
+    def candidates(self, mean: np.ndarray, cov: np.ndarray | None = None, visible: np.ndarray | None = None) -> np.ndarray:
+        # Nearest access points within range of the (uncertain) position, nearest first
+        position = np.asarray(mean, dtype=float)[:2]
+        radius = self._max_range
+        if cov is not None:
+            radius += 3 * np.sqrt(np.max(np.linalg.eigvalsh(np.asarray(cov, dtype=float)[:2, :2])))
+
+        # Ask for extra neighbours when some will be discarded as not currently heard
+        count = self._max_candidates if visible is None else min(len(self._registry), VISIBLE_SEARCH_FACTOR * self._max_candidates)
+        distances, indices = self._tree.query(position, k=count, distance_upper_bound=radius)
+        indices = np.atleast_1d(indices)[np.isfinite(np.atleast_1d(distances))]
+        if visible is not None:
+            indices = indices[np.asarray(visible, dtype=bool)[indices]]
+        return indices[:self._max_candidates]
+
+    def select(self, mean: np.ndarray,
+                     cov: np.ndarray | None = None,
+                     num_access_points: int = DEFAULT_NUM_ACCESS_POINTS,
+                     visible: np.ndarray | None = None) -> np.ndarray:
+        # Registry indices (ascending) of the access points giving the lowest weighted dilution of precision
+        candidates = self.candidates(mean, cov, visible)
+        if len(candidates) <= 3:
+            return np.sort(candidates)
+
+        # Range errors grow with distance, so each access point contributes u ut / d^2 to the information matrix
+        offsets = self._registry.positions[candidates] - np.asarray(mean, dtype=float)[:2]
+        distances = np.maximum(np.linalg.norm(offsets, axis=1), MIN_DISTANCE)
+        units = offsets / distances[:, np.newaxis]
+        information = np.einsum('ci,cj->cij', units, units) / (distances ** 2)[:, np.newaxis, np.newaxis]
+
+        # Best starting triple, then greedily add whichever access point lowers the dilution of precision the most
+        triples = self._triples[len(candidates)]
+        triple_dop = _dilution_of_precision(information[triples].sum(axis=1))
+        chosen = list(triples[np.argmin(triple_dop)])
+        total = information[chosen].sum(axis=0)
+
+        remaining = np.setdiff1d(np.arange(len(candidates)), chosen)
+        while len(chosen) < num_access_points and len(remaining) > 0:
+            best = np.argmin(_dilution_of_precision(total + information[remaining]))
+            chosen.append(remaining[best])
+            total = total + information[remaining[best]]
+            remaining = np.delete(remaining, best)
+
+        return np.sort(candidates[chosen])
+
+def _dilution_of_precision(information: np.ndarray) -> np.ndarray:
+    # sqrt(trace(I^-1)) for a stack of 2x2 information matrices, inf where the geometry is degenerate
+    a, b, c, d = information[..., 0, 0], information[..., 0, 1], information[..., 1, 0], information[..., 1, 1]
+    det = a * d - b * c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dop = np.sqrt((a + d) / det)
+    return np.where(det > 1e-12 * (a + d) ** 2, dop, np.inf)
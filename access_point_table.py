@@ -0,0 +1,121 @@
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+
+import numpy as np
+
+INITIAL_CAPACITY = 64
+
+# One record per access point slot, times are time.monotonic()
+ACCESS_POINT_DTYPE = np.dtype([
+    ('rssi', np.float32),         # dBm
+    ('frequency', np.int32),      # MHz
+    ('last_updated', np.float64),
+    ('updates', np.uint32),
+])
+
+class AccessPointTable:
+    def __init__(self, capacity: int = INITIAL_CAPACITY) -> None:
+        self._records = self._empty_records(capacity)
+        self._count = 0
+        self._macs = []
+        self._ssids = []
+        self._slots = {}
+
+        # Seqlock - odd while a write is in progress, readers retry if it changed while they copied
+        self._sequence = 0
+        # Writers (sniff thread and scan lookups) are serialized between themselves
+        self._write_lock = Lock()
+
+    @staticmethod
+    def _empty_records(capacity: int) -> np.ndarray:
+        records = np.zeros(capacity, dtype=ACCESS_POINT_DTYPE)
+        records['rssi'] = np.nan
+        records['last_updated'] = -np.inf
+        return records
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, mac: str) -> bool:
+        return mac in self._slots
+
+    def slot(self, mac: str) -> int | None:
+        return self._slots.get(mac)
+
+    @property
+    def macs(self) -> list[str]:
+        return self._macs[:self._count]
+
+    @property
+    def ssids(self) -> list[str]:
+        return self._ssids[:self._count]
+
+    def add(self, mac: str, ssid: str, frequency: int, rssi: float, timestamp: float | None = None) -> int:
+        # Adds (or refreshes) an access point and returns its slot
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._write_lock:
+            self._sequence += 1
+            slot = self._slots.get(mac)
+            if slot is None:
+                if self._count == len(self._records):
+                    # Grow into a new array so readers copying the old one are unaffected
+                    records = self._empty_records(2 * len(self._records))
+                    records[:self._count] = self._records[:self._count]
+                    self._records = records
+                slot = self._count
+                self._macs.append(mac)
+                self._ssids.append(ssid)
+                self._slots[mac] = slot
+                self._count += 1
+            self._write(slot, rssi, timestamp, frequency, ssid)
+            self._sequence += 1
+        return slot
+
+    def update(self, slot: int, rssi: float, timestamp: float | None = None, frequency: int | None = None, ssid: str | None = None) -> None:
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._write_lock:
+            self._sequence += 1
+            self._write(slot, rssi, timestamp, frequency, ssid)
+            self._sequence += 1
+
+    def _write(self, slot: int, rssi: float, timestamp: float, frequency: int | None, ssid: str | None) -> None:
+        records = self._records
+        records['rssi'][slot] = rssi
+        records['last_updated'][slot] = timestamp
+        records['updates'][slot] += 1
+        if frequency is not None:
+            records['frequency'][slot] = frequency
+        if ssid is not None:
+            self._ssids[slot] = ssid
+
+    def snapshot(self, out: np.ndarray | None = None) -> np.ndarray:
+        # Consistent copy of the records, into `out` when it's large enough so a per-tick read doesn't allocate
+        while True:
+            sequence = self._sequence
+            if sequence % 2 == 1:
+                time.sleep(0) # Writer mid-update, yield to it
+                continue
+
+            # Count before records - a concurrent add grows the array before incrementing the count
+            count = self._count
+            records = self._records
+            if out is None or len(out) < count:
+                out = np.empty(len(records), dtype=ACCESS_POINT_DTYPE)
+            np.copyto(out[:count], records[:count])
+
+            if self._sequence == sequence:
+                return out[:count]
+
+    def as_dicts(self) -> dict:
+        # The original WifiSniffer.access_points layout, built from a consistent snapshot
+        records = self.snapshot()
+        now_monotonic = time.monotonic()
+        now = datetime.now()
+        return {mac: {
+                    'MAC Address': mac,
+                    'Frequency': int(record['frequency']),
+                    'Signal Level (RSSI)': float(record['rssi']),
+                    'SSID': ssid,
+                    'Last Updated': now - timedelta(seconds=now_monotonic - float(record['last_updated'])),
+                } for mac, ssid, record in zip(self.macs, self.ssids, records)}
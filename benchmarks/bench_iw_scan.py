@@ -0,0 +1,70 @@
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iw_scan import parse_iw_scan
+
+# The original get_wifi_info pattern
+AP_PATTERN = r"(?s)BSS ([0-9a-f:]+).*?freq: (\d+).*?signal: (-?\d+.\d+) dBm.*?SSID: *([^\r\n]*\S)"
+
+# The original regex backtracks catastrophically on hidden SSIDs, so it's only timed on the smallest hidden dump
+MAX_HIDDEN_REGEX_BSS = 10
+
+def synthetic_scan(num_bss: int, hidden_ssids: bool = False) -> str:
+    # Realistically sized BSS blocks, including the long capability sections that make the lazy spans backtrack
+    blocks = []
+    for i in range(num_bss):
+        frequency = [2412, 2437, 2462, 5180, 5240][i % 5]
+        ssid = "" if hidden_ssids else f"Network {i}"
+        blocks.append(f"""BSS 02:00:00:00:{i // 256:02x}:{i % 256:02x}(on wlan0)
+\tlast seen: {i % 1000} ms ago
+\tTSF: 123456789 usec (0d, 00:02:03)
+\tfreq: {frequency}
+\tbeacon interval: 100 TUs
+\tcapability: ESS Privacy ShortSlotTime (0x0411)
+\tsignal: -{40 + i % 50}.00 dBm
+\tSSID: {ssid}
+\tSupported rates: 1.0* 2.0* 5.5* 11.0* 6.0 9.0 12.0 18.0 
+\tDS Parameter set: channel {(frequency - 2407) // 5 if frequency < 3000 else (frequency - 5000) // 5}
+\tRSN:\t * Version: 1
+\t\t * Group cipher: CCMP
+\t\t * Pairwise ciphers: CCMP
+\t\t * Authentication suites: PSK
+\t\t * Capabilities: 16-PTKSA-RC 1-GTKSA-RC (0x000c)
+\tHT capabilities:
+\t\tCapabilities: 0x1ad
+\t\t\tRX LDPC
+\t\t\tHT20
+\t\t\tSM Power Save disabled
+\t\tMaximum RX AMPDU length 65535 bytes (exponent: 0x003)
+\tHT operation:
+\t\t * primary channel: {(frequency - 2407) // 5 if frequency < 3000 else (frequency - 5000) // 5}
+\t\t * secondary channel offset: no secondary
+\tWPS:\t * Version: 1.0
+\t\t * Manufacturer: Example
+""")
+    return "".join(blocks)
+
+def main():
+    for hidden_ssids in [False, True]:
+        print("Hidden SSIDs" if hidden_ssids else "Visible SSIDs")
+        for num_bss in [10, 100, 1000]:
+            scan = synthetic_scan(num_bss, hidden_ssids)
+            lines = scan.splitlines(keepends=True)
+            number = max(1, 1000 // num_bss)
+
+            streaming = min(timeit.repeat(lambda: list(parse_iw_scan(lines)), number=number, repeat=3)) / number
+            if hidden_ssids and num_bss > MAX_HIDDEN_REGEX_BSS:
+                print(f"{num_bss:>5} BSSes: regex      skipped, streaming {streaming * 1e3:8.2f} ms")
+                continue
+
+            # A single pass is already slow enough with hidden SSIDs
+            number, repeat = (1, 1) if hidden_ssids else (number, 3)
+            regex = min(timeit.repeat(lambda: re.findall(AP_PATTERN, scan, re.DOTALL), number=number, repeat=repeat)) / number
+            print(f"{num_bss:>5} BSSes: regex {regex * 1e3:8.2f} ms, streaming {streaming * 1e3:8.2f} ms ({regex / streaming:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kf import KalmanFilter2D
+
+DT = 0.1
+NUM_CALLS = 100_000
+
+def uncached_predict(kf: KalmanFilter2D, dt: float) -> None:
+    # The original predict, rebuilding F, G and the noise identity every call
+    F = kf.F(dt)
+    G = kf.G(dt)
+    I_meas = np.eye(kf._meas_dims)
+    kf._x = F.dot(kf._x)
+    kf._P = F.dot(kf._P).dot(F.T) + G.dot(kf._acceleration_variance * I_meas).dot(G.T)
+
+def main():
+    kf_uncached = KalmanFilter2D(0.0, 0.0, 0.5, 0.5, 0.75)
+    kf_cached = KalmanFilter2D(0.0, 0.0, 0.5, 0.5, 0.75)
+
+    uncached = min(timeit.repeat(lambda: uncached_predict(kf_uncached, DT), number=NUM_CALLS, repeat=3)) / NUM_CALLS
+    cached = min(timeit.repeat(lambda: kf_cached.predict(DT), number=NUM_CALLS, repeat=3)) / NUM_CALLS
+
+    print(f"Uncached predict: {uncached * 1e6:.2f} us/call")
+    print(f"Cached predict:   {cached * 1e6:.2f} us/call")
+    print(f"Speedup:          {uncached / cached:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kf import KalmanFilter2D
+
+NUM_CALLS = 20_000
+MEAS_VALUE = [0.1, 0.2]
+MEAS_VARIANCE = [[4.0, 2.0], [2.0, 4.0]]
+
+def main():
+    kf = KalmanFilter2D(0.0, 0.0, 0.5, 0.5, 0.75)
+    kf_fast = KalmanFilter2D(0.0, 0.0, 0.5, 0.5, 0.75, fast_update=True)
+
+    pinv = min(timeit.repeat(lambda: kf.update(MEAS_VALUE, MEAS_VARIANCE), number=NUM_CALLS, repeat=3)) / NUM_CALLS
+    fast = min(timeit.repeat(lambda: kf_fast.update(MEAS_VALUE, MEAS_VARIANCE), number=NUM_CALLS, repeat=3)) / NUM_CALLS
+
+    print(f"pinv update: {pinv * 1e6:.2f} us/call")
+    print(f"Fast update: {fast * 1e6:.2f} us/call")
+    print(f"Speedup:     {pinv / fast:.1f}x")
+
+if __name__ == "__main__":
+    main()
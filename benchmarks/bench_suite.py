@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from queue import Queue
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scapy.all import RadioTap, Dot11, Dot11Beacon, Dot11Elt
+
+import wifi_sniffer
+from bench_iw_scan import synthetic_scan
+from kf import ExtendedKalmanFilter2D, KalmanFilter1D, KalmanFilter2D, KalmanFilterBank
+from main import trilaterate
+from pf import ParticleFilter2D
+from trilateration import SIGMA_RSSI, rssi_to_distance, trilaterate_batch
+from wifi_sniffer import WifiSniffer
+
+DEVICES = [1, 100, 10_000]
+ACCESS_POINTS = [3, 30, 300]
+REPEAT = 5
+MIN_TIME = 0.2  # Each repeat runs the case at least this long (s)
+REGRESSION_THRESHOLD = 1.25  # --compare fails cases this many times slower than the baseline
+
+DT = 0.1
+MEAS_VALUE_2D = [0.1, 0.2]
+MEAS_VARIANCE_2D = [[4.0, 2.0], [2.0, 4.0]]
+
+def access_point_layout(num_access_points: int, seed: int = 0) -> tuple[list[str], np.ndarray]:
+    # MACs and positions scattered over a 100m x 100m floor
+    rng = np.random.default_rng(seed)
+    macs = [f"02:00:00:00:{i // 256:02x}:{i % 256:02x}" for i in range(num_access_points)]
+    return macs, rng.uniform(0, 100, size=(num_access_points, 2))
+
+def rssi_matrix(num_devices: int, ap_positions: np.ndarray, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    devices = rng.uniform(0, 100, size=(num_devices, 2))
+    distances = np.maximum(np.linalg.norm(devices[:, np.newaxis] - ap_positions, axis=-1), 0.1)
+    return -40 - 30 * np.log10(distances) + rng.normal(scale=4.0, size=distances.shape)
+
+def beacon(sender: str, rssi: int) -> RadioTap:
+    packet = RadioTap(present='dBm_AntSignal', dBm_AntSignal=rssi) / \
+             Dot11(type=0, subtype=8, addr1="ff:ff:ff:ff:ff:ff", addr2=sender, addr3=sender) / \
+             Dot11Beacon() / Dot11Elt(ID=0, info=b"AP")
+    return RadioTap(bytes(packet))
+
+def kalman_filter_cases():
+    for name, make_filter, meas_value, meas_variance in [
+            ("kf1d", lambda: KalmanFilter1D(0.0, 0.5, 0.75), 0.1, 4.0),
+            ("kf2d", lambda: KalmanFilter2D(0.0, 0.0, 0.5, 0.5, 0.75), MEAS_VALUE_2D, MEAS_VARIANCE_2D),
+            ("kf2d_fast", lambda: KalmanFilter2D(0.0, 0.0, 0.5, 0.5, 0.75, fast_update=True), MEAS_VALUE_2D, MEAS_VARIANCE_2D)]:
+        for num_devices in DEVICES:
+            params = {"devices": num_devices}
+            if num_devices == 1:
+                kf = make_filter()
+                yield f"{name}.predict", params, lambda kf=kf: kf.predict(DT)
+                yield f"{name}.update", params, lambda kf=kf, z=meas_value, R=meas_variance: kf.update(z, R)
+            elif name != "kf2d_fast":
+                # Many devices go through a bank, one batched call for all of them
+                bank = KalmanFilterBank([make_filter() for _ in range(num_devices)])
+                meas_values = np.tile(meas_value, (num_devices, 1))
+                meas_variances = np.tile(meas_variance, (num_devices, 1, 1))
+                yield f"{name}_bank.predict", params, lambda bank=bank: bank.predict(DT)
+                yield f"{name}_bank.update", params, lambda bank=bank, z=meas_values, R=meas_variances: bank.update(z, R)
+
+    ekf = ExtendedKalmanFilter2D(0.0, 0.0, 0.5, 0.5, 0.75)
+    yield "ekf2d.update_range", {"devices": 1}, lambda: ekf.update_range(np.array([10.0, 5.0]), 11.0, 4.0)
+
+    # A device's particle cloud at the maximum particle count. Each update_rssi starts from the same cloud, as at SIGMA_RSSI it
+    # resamples (and shrinks the cloud), so the timing includes resampling and restoring the 10k particles
+    pf = ParticleFilter2D(0.0, 0.0, 0.5, 0.5, 0.75, seed=0)
+    particles, weights = pf.particles.copy(), pf.weights.copy()
+    _, ap_positions = access_point_layout(30)
+    rssi = rssi_matrix(1, ap_positions)[0]
+
+    def pf_update_rssi():
+        pf._particles, pf._weights = particles.copy(), weights.copy()
+        pf.update_rssi(rssi, ap_positions, sigma_rssi=SIGMA_RSSI)
+
+    yield "pf2d.predict", {"particles": len(pf)}, lambda: pf.predict(DT)
+    yield "pf2d.update_rssi", {"particles": len(pf), "aps": 30}, pf_update_rssi
+
+def trilateration_cases():
+    for num_access_points in ACCESS_POINTS:
+        macs, ap_positions = access_point_layout(num_access_points)
+        known_positions = {mac: (position.tolist(), mac) for mac, position in zip(macs, ap_positions)}
+        rssi = rssi_matrix(1, ap_positions)[0]
+        access_points = [{'MAC Address': mac, 'Signal Level (RSSI)': value} for mac, value in zip(macs, rssi)]
+        yield "main.trilaterate", {"aps": num_access_points}, lambda a=access_points, k=known_positions: trilaterate(a, k)
+
+        for num_devices in DEVICES:
+            params = {"devices": num_devices, "aps": num_access_points}
+            rssi = rssi_matrix(num_devices, ap_positions)
+            yield "trilaterate_batch", params, lambda r=rssi, p=ap_positions: trilaterate_batch(r, p)
+            yield "rssi_to_distance", params, lambda r=rssi: rssi_to_distance(r)
+    yield "rssi_to_distance", {"devices": 1, "aps": 1}, lambda: rssi_to_distance(-60.0)
+
+class FakeScan:
+    # Stands in for the `iw dev <interface> scan` subprocess
+    def __init__(self, scan: str) -> None:
+        self.stdout = io.StringIO(scan)
+        self.stderr = io.StringIO()
+
+    def wait(self) -> int:
+        return 0
+
+def sniffer_cases():
+    for num_access_points in ACCESS_POINTS:
+        params = {"aps": num_access_points}
+        scan = synthetic_scan(num_access_points)
+
+        def get_wifi_info(scan=scan):
+            sniffer = WifiSniffer("wlan0", log_every=0)
+            with mock.patch.object(wifi_sniffer.subprocess, 'Popen', lambda *args, **kwargs: FakeScan(scan)), \
+                 contextlib.redirect_stdout(io.StringIO()):
+                sniffer.get_wifi_info()
+        yield "WifiSniffer.get_wifi_info", params, get_wifi_info
+
+        macs, _ = access_point_layout(num_access_points)
+        rng = np.random.default_rng(0)
+        packets = [beacon(macs[i], int(rssi)) for i, rssi in zip(rng.integers(num_access_points, size=256), rng.integers(-90, -30, size=256))]
+        for name, fast_capture in [("_packet_callback", False), ("_fast_packet_callback", True)]:
+            sniffer = WifiSniffer("wlan0", observation_queue=Queue(), fast_capture=fast_capture, known_macs=macs, log_every=0)
+            for mac in macs:
+                sniffer.access_point_table.add(mac, "AP", 2412, -60.0)
+            sniffer.running = True
+            callback = getattr(sniffer, name)
+            frames = itertools.cycle(packets)
+            yield f"WifiSniffer.{name}", params, lambda callback=callback, frames=frames: callback(next(frames))
+
+CASES = [kalman_filter_cases, trilateration_cases, sniffer_cases]
+
+def time_case(function) -> dict:
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * MIN_TIME / max(elapsed, 1e-9)))
+    per_call = np.array(timer.repeat(repeat=REPEAT, number=number)) / number
+    return {"number": number, "repeat": REPEAT, "min": float(per_call.min()), "median": float(np.median(per_call))}
+
+def case_key(result: dict) -> str:
+    params = ",".join(f"{name}={value}" for name, value in result["params"].items())
+    return f"{result['name']}[{params}]"
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compare(results: list[dict], baseline_path: str, threshold: float) -> list[str]:
+    # Cases whose min time per call regressed by more than threshold against the baseline run
+    with open(baseline_path) as file:
+        baseline = {case_key(result): result for result in json.load(file)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(case_key(result))
+        if previous is not None and result["min"] > threshold * previous["min"]:
+            regressions.append(f"{case_key(result)}: {previous['min'] * 1e6:.2f} -> {result['min'] * 1e6:.2f} us/call")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the filter, trilateration and sniffer hot paths")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are written to")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--compare", default=None, help="Baseline JSON results to check for regressions against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    results = []
+    for cases in CASES:
+        for name, params, function in cases():
+            if args.filter not in name:
+                continue
+            result = {"name": name, "params": params, **time_case(function)}
+            results.append(result)
+            print(f"{case_key(result):<55} {result['min'] * 1e6:12.2f} us/call")
+
+    with open(args.output, 'w') as file:
+        json.dump({"environment": environment(), "results": results}, file, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare is not None:
+        regressions = compare(results, args.compare, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
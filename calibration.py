@@ -0,0 +1,103 @@
+import numpy as np
+
+from trilateration import PATH_LOSS_EXPONENT, RSSI_REF, rssi_to_distance
+
+FORGETTING_FACTOR = 0.999  # Older observations are discounted by this per observation, ~1000 observation memory per AP
+INITIAL_VARIANCE = 10.0  # Prior variance of the reference RSSI (dBm²), how quickly the defaults are given up
+MIN_CALIBRATION_DISTANCE = 1.0  # Closer observations are dominated by antenna patterns and are skipped (m)
+MAX_CALIBRATION_POSITION_STD = 2.0  # Positions only calibrate path loss once the filter knows them this well (m)
+MIN_PATH_LOSS_EXPONENT = 1.5
+MAX_PATH_LOSS_EXPONENT = 6.0
+
+class PathLossCalibrator:
+    def __init__(self, num_access_points: int,
+                       rssi_ref: float = RSSI_REF,
+                       path_loss_exponent: float = PATH_LOSS_EXPONENT,
+                       forgetting_factor: float = FORGETTING_FACTOR,
+                       initial_variance: float = INITIAL_VARIANCE) -> None:
+        # Recursive least squares fit per access point of rssi = rssi_ref - 10 n log10(d), linear in theta = (rssi_ref, -10 n)
+        # for the regressor (1, log10(d)). Each access point's theta and 2x2 covariance are columns of compact (K, ) arrays
+        self._rssi_ref = np.full(num_access_points, float(rssi_ref))
+        self._slope = np.full(num_access_points, -10.0 * path_loss_exponent)
+        self._P00 = np.full(num_access_points, float(initial_variance))
+        self._P01 = np.zeros(num_access_points)
+        self._P11 = np.full(num_access_points, initial_variance / 10.0)  # log10(d) spans ~1-2 so the slope has ~10x the leverage
+        self._forgetting_factor = forgetting_factor
+        # Each access point's covariance trace is capped at the prior's. A stationary device only ever sees one distance, so
+        # the forgetting factor would otherwise inflate the unobserved direction without bound until one new distance swings
+        # the fit
+        self._max_trace = initial_variance + initial_variance / 10.0
+        self._observations = np.zeros(num_access_points, dtype=int)
+
+        # (K, 2) rssi_ref and path loss exponent per access point, rewritten in place after every update
+        self._parameters = np.empty((num_access_points, 2))
+        self._write_parameters(slice(None))
+
+    def __len__(self) -> int:
+        return len(self._parameters)
+
+    @property
+    def parameters(self) -> np.ndarray:
+        return self._parameters
+
+    @property
+    def rssi_ref(self) -> np.ndarray:
+        return self._parameters[:, 0]
+
+    @property
+    def path_loss_exponent(self) -> np.ndarray:
+        return self._parameters[:, 1]
+
+    @property
+    def observations(self) -> np.ndarray:
+        return self._observations
+
+    def rssi_to_distance(self, rssi: np.ndarray) -> np.ndarray:
+        # (..., K) RSSI in registry order with each access point's own fit
+        return rssi_to_distance(rssi, self._parameters[:, 0], self._parameters[:, 1])
+
+    def update(self, rssi: np.ndarray, distances: np.ndarray) -> int:
+        # One RLS step for every access point with an (rssi, distance) pair, e.g. all RSSI of a fix against the distances from
+        # the filtered position. NaN RSSI are skipped. O(1) per observation, vectorized over the access points. Returns the
+        # number of access points updated
+        rssi = np.asarray(rssi, dtype=float)
+        distances = np.asarray(distances, dtype=float)
+        observed = np.flatnonzero(np.isfinite(rssi) & (distances >= MIN_CALIBRATION_DISTANCE))
+        if len(observed) == 0:
+            return 0
+
+        log_distance = np.log10(distances[observed])
+        P00, P01, P11 = self._P00[observed], self._P01[observed], self._P11[observed]
+
+        # k = P phi / (lambda + phi' P phi), theta += k (rssi - phi' theta), P = (P - k phi' P) / lambda
+        P_phi_0 = P00 + P01 * log_distance
+        P_phi_1 = P01 + P11 * log_distance
+        gain_0 = P_phi_0 / (self._forgetting_factor + P_phi_0 + P_phi_1 * log_distance)
+        gain_1 = P_phi_1 / (self._forgetting_factor + P_phi_0 + P_phi_1 * log_distance)
+        error = rssi[observed] - (self._rssi_ref[observed] + self._slope[observed] * log_distance)
+        self._rssi_ref[observed] += gain_0 * error
+        self._slope[observed] += gain_1 * error
+        self._P00[observed] = (P00 - gain_0 * P_phi_0) / self._forgetting_factor
+        self._P01[observed] = (P01 - gain_0 * P_phi_1) / self._forgetting_factor
+        self._P11[observed] = (P11 - gain_1 * P_phi_1) / self._forgetting_factor
+        trace = self._P00[observed] + self._P11[observed]
+        scale = np.minimum(1.0, self._max_trace / trace)
+        self._P00[observed] *= scale
+        self._P01[observed] *= scale
+        self._P11[observed] *= scale
+
+        self._observations[observed] += 1
+        self._write_parameters(observed)
+        return len(observed)
+
+    def update_from_estimate(self, rssi: np.ndarray, ap_positions: np.ndarray, mean: np.ndarray, cov: np.ndarray) -> int:
+        # update against each access point's (K, 2) distance from a filter's position estimate, skipped (returns 0) until the
+        # estimate's largest position std is within MAX_CALIBRATION_POSITION_STD. A poor estimate would fit its own error
+        if np.max(np.linalg.eigvalsh(cov[:2, :2])) > MAX_CALIBRATION_POSITION_STD ** 2:
+            return 0
+        return self.update(rssi, np.linalg.norm(ap_positions - mean[:2], axis=1))
+
+    def _write_parameters(self, indices) -> None:
+        # Exponents outside the physically plausible range are clipped, the fit itself is left free to recover
+        self._parameters[indices, 0] = self._rssi_ref[indices]
+        self._parameters[indices, 1] = np.clip(self._slope[indices] / -10.0, MIN_PATH_LOSS_EXPONENT, MAX_PATH_LOSS_EXPONENT)
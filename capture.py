@@ -0,0 +1,239 @@
+import argparse
+import struct
+import time
+from abc import ABC, abstractmethod
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+LINKTYPE_IEEE802_11_RADIOTAP = 127
+
+PCAP_MAGIC_MICROSECONDS = 0xa1b2c3d4
+PCAP_MAGIC_NANOSECONDS = 0xa1b23c4d
+PCAPNG_SECTION_HEADER = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_INTERFACE_DESCRIPTION = 0x00000001
+PCAPNG_SIMPLE_PACKET = 0x00000003
+PCAPNG_ENHANCED_PACKET = 0x00000006
+PCAPNG_OPTION_IF_TSRESOL = 9
+
+# Radiotap fields before the antenna signal (bit 5): (alignment, size) by present bit
+RADIOTAP_FIELDS = [(8, 8), (1, 1), (1, 1), (2, 4), (1, 2)]
+RADIOTAP_CHANNEL = 3
+RADIOTAP_DBM_ANTSIGNAL = 5
+RADIOTAP_EXT = 31
+
+BEACON_FRAME_CONTROL = 0x80  # Management type, beacon subtype
+DOT11_HEADER_LENGTH = 24
+BEACON_FIXED_PARAMETERS_LENGTH = 12
+SSID_ELEMENT_ID = 0
+
+class BeaconFrame(NamedTuple):
+    timestamp: float  # Capture time (s)
+    sender: str  # Transmitter MAC (addr2)
+    rssi: float  # dBm, NaN when the radiotap header has no antenna signal
+    frequency: int  # MHz, 0 when the radiotap header has no channel
+    ssid: str
+
+def parse_radiotap_beacon(packet: bytes, timestamp: float = 0.0) -> BeaconFrame | None:
+    # Reads only the radiotap fields up to the antenna signal and the 802.11 header, None for anything but a beacon
+    if len(packet) < 8:
+        return None
+    radiotap_length = packet[2] | (packet[3] << 8)
+    if len(packet) < radiotap_length + DOT11_HEADER_LENGTH or packet[radiotap_length] != BEACON_FRAME_CONTROL:
+        return None
+
+    present = int.from_bytes(packet[4:8], 'little')
+    offset = 8
+    # Skip any extended present bitmaps
+    extended = present
+    while extended & (1 << RADIOTAP_EXT):
+        extended = int.from_bytes(packet[offset:offset + 4], 'little')
+        offset += 4
+
+    frequency = 0
+    rssi = float('nan')
+    for bit, (alignment, size) in enumerate(RADIOTAP_FIELDS):
+        if present & (1 << bit):
+            offset += -offset % alignment
+            if bit == RADIOTAP_CHANNEL:
+                frequency = packet[offset] | (packet[offset + 1] << 8)
+            offset += size
+    if present & (1 << RADIOTAP_DBM_ANTSIGNAL) and offset < radiotap_length:
+        rssi = float(packet[offset] - 256 if packet[offset] > 127 else packet[offset])
+
+    frame = radiotap_length
+    sender = packet[frame + 10:frame + 16].hex(':')
+
+    # First tagged parameter of a beacon is normally the SSID
+    ssid = ""
+    tag = frame + DOT11_HEADER_LENGTH + BEACON_FIXED_PARAMETERS_LENGTH
+    if tag + 2 <= len(packet) and packet[tag] == SSID_ELEMENT_ID:
+        ssid = packet[tag + 2:tag + 2 + packet[tag + 1]].decode(errors="ignore")
+
+    return BeaconFrame(timestamp, sender, rssi, frequency, ssid)
+
+def _read_pcap(file) -> Iterator[tuple[float, bytes]]:
+    header = file.read(4)
+    magic_le = struct.unpack("<I", header[:4])[0]
+    if magic_le in (PCAP_MAGIC_MICROSECONDS, PCAP_MAGIC_NANOSECONDS):
+        endian = "<"
+    else:
+        endian = ">"
+    magic = struct.unpack(endian + "I", header[:4])[0]
+    resolution = 1e-9 if magic == PCAP_MAGIC_NANOSECONDS else 1e-6
+
+    rest = file.read(20)
+    linktype = struct.unpack(endian + "I", rest[16:20])[0]
+    if linktype != LINKTYPE_IEEE802_11_RADIOTAP:
+        raise ValueError(f"Unsupported pcap link type {linktype}, expected radiotap ({LINKTYPE_IEEE802_11_RADIOTAP})")
+
+    record = struct.Struct(endian + "IIII")
+    while True:
+        record_header = file.read(16)
+        if len(record_header) < 16:
+            return
+        seconds, fraction, captured_length, _ = record.unpack(record_header)
+        yield seconds + fraction * resolution, file.read(captured_length)
+
+def _tsresol(options: bytes, endian: str) -> float:
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack_from(endian + "HH", options, offset)
+        if code == 0:
+            break
+        if code == PCAPNG_OPTION_IF_TSRESOL and length >= 1:
+            value = options[offset + 4]
+            return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+        offset += 4 + length + (-length % 4)
+    return 1e-6
+
+def _read_pcapng(file) -> Iterator[tuple[float, bytes]]:
+    endian = "<"
+    interfaces = []  # (linktype, timestamp resolution) per interface in the current section
+    while True:
+        block_header = file.read(8)
+        if len(block_header) < 8:
+            return
+
+        # The section header block type reads the same in either byte order, its byte order magic sets the section's
+        if struct.unpack("<I", block_header[:4])[0] == PCAPNG_SECTION_HEADER:
+            endian = "<" if struct.unpack("<I", file.read(4))[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            total_length = struct.unpack(endian + "I", block_header[4:8])[0]
+            file.read(total_length - 12)
+            interfaces = []
+            continue
+
+        block_type, total_length = struct.unpack(endian + "II", block_header)
+        body = file.read(total_length - 8)[:-4]
+        if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+            linktype = struct.unpack_from(endian + "H", body)[0]
+            interfaces.append((linktype, _tsresol(body[8:], endian)))
+        elif block_type == PCAPNG_ENHANCED_PACKET:
+            interface, high, low, captured_length, _ = struct.unpack_from(endian + "IIIII", body)
+            linktype, resolution = interfaces[interface]
+            if linktype == LINKTYPE_IEEE802_11_RADIOTAP:
+                yield ((high << 32) | low) * resolution, body[20:20 + captured_length]
+        elif block_type == PCAPNG_SIMPLE_PACKET:
+            # No timestamp in simple packet blocks
+            linktype, _ = interfaces[0]
+            if linktype == LINKTYPE_IEEE802_11_RADIOTAP:
+                yield float('nan'), body[4:]
+
+def read_capture(path: str) -> Iterator[tuple[float, bytes]]:
+    # (timestamp, radiotap packet) from a pcap or pcapng file
+    with open(path, 'rb') as file:
+        magic = struct.unpack("<I", file.read(4))[0]
+        file.seek(0)
+        if magic == PCAPNG_SECTION_HEADER:
+            yield from _read_pcapng(file)
+        else:
+            yield from _read_pcap(file)
+
+class CaptureSource(ABC):
+    @abstractmethod
+    def frames(self) -> Iterator[BeaconFrame]:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class PcapReplaySource(CaptureSource):
+    def __init__(self, path: str, speed: float | None = None) -> None:
+        # speed None replays as fast as possible, 1.0 at real time, 2.0 twice as fast...
+        self._path = path
+        self._speed = speed
+        self.packets_read = 0
+
+    def frames(self) -> Iterator[BeaconFrame]:
+        # Frames without a capture time (pcapng simple packets) take the previous frame's, those before the first timestamp
+        # are held back and given it, so every frame has a finite time
+        start_capture_time = None
+        start_time = time.monotonic()
+        last_timestamp = None
+        held = []
+        for timestamp, packet in read_capture(self._path):
+            self.packets_read += 1
+            frame = parse_radiotap_beacon(packet, timestamp)
+            if frame is None:
+                continue
+
+            if np.isnan(timestamp):
+                if last_timestamp is None:
+                    held.append(frame)
+                    continue
+                frame = frame._replace(timestamp=last_timestamp)
+            else:
+                last_timestamp = timestamp
+                for held_frame in held:
+                    yield held_frame._replace(timestamp=timestamp)
+                held = []
+                if self._speed is not None:
+                    if start_capture_time is None:
+                        start_capture_time = timestamp
+                    delay = (timestamp - start_capture_time) / self._speed - (time.monotonic() - start_time)
+                    if delay > 0:
+                        time.sleep(delay)
+            yield frame
+
+        # A capture without any timestamps is stamped with the time it was read
+        now = time.time()
+        for held_frame in held:
+            yield held_frame._replace(timestamp=now)
+
+def track_capture(source: CaptureSource, tracker) -> list[tuple[float, np.ndarray, np.ndarray]]:
+    # Feeds beacons through the tracker (trilateration + Kalman Filter), returns (timestamp, mean, cov) after each fix
+    fixes = []
+    for frame in source.frames():
+        if not np.isnan(frame.rssi) and tracker.process(frame.timestamp, frame.sender, frame.rssi):
+            fixes.append((frame.timestamp, tracker.kalman_filter.mean, tracker.kalman_filter.cov))
+    source.close()
+    return fixes
+
+if __name__ == "__main__":
+    from access_point_index import AccessPointSpatialIndex
+    from kf import ACCELERATION_VARIANCE, KalmanFilter2D
+    from main import access_point_registry
+    from tracker import EventDrivenTracker
+
+    parser = argparse.ArgumentParser(description="Replay a radiotap pcap/pcapng capture through the tracker")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=None, help="Replay speed, 1.0 for real time (default as fast as possible)")
+    args = parser.parse_args()
+
+    # The tracker starts at the first beacon's capture time
+    first_timestamp = next(PcapReplaySource(args.path).frames()).timestamp
+    x, y = access_point_registry.positions.mean(axis=0)
+    kalman_filter = KalmanFilter2D(initial_x=x, initial_y=y, initial_v_x=0.0, initial_v_y=0.0,
+                                   acceleration_variance=ACCELERATION_VARIANCE, fast_update=True)
+    tracker = EventDrivenTracker(access_point_registry, AccessPointSpatialIndex(access_point_registry), kalman_filter, start_time=first_timestamp)
+
+    source = PcapReplaySource(args.path, speed=args.speed)
+    start = time.monotonic()
+    fixes = track_capture(source, tracker)
+    elapsed = time.monotonic() - start
+
+    print(f"Replayed {source.packets_read} packets into {len(fixes)} fixes in {elapsed:.2f}s")
+    if fixes:
+        _, mean, _ = fixes[-1]
+        print(f"Final position: ({mean[0]:.2f}, {mean[1]:.2f})")
@@ -0,0 +1,156 @@
+import os
+import socket
+import struct
+import subprocess
+import time
+
+import numpy as np
+
+from access_point_table import AccessPointTable
+
+DWELL_SECONDS = 0.1  # Time spent on a channel before choosing the next one
+
+# Netlink / generic netlink / nl80211 constants (linux/netlink.h, linux/genetlink.h, linux/nl80211.h)
+NETLINK_GENERIC = 16
+NLMSG_ERROR = 2
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+NL80211_CMD_SET_WIPHY = 2
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_WIPHY_FREQ = 38
+NL80211_ATTR_WIPHY_CHANNEL_TYPE = 39
+NL80211_CHAN_NO_HT = 0
+
+def frequency_to_channel(frequency: int) -> int | None:
+    # Channel numbers are only unique within a band (6GHz channel 1 is 5955MHz), so they're for display and the channel
+    # hopper works in frequencies. None for frequencies that aren't a channel centre
+    if frequency == 2484:
+        return 14
+    for low, high, base in ((2412, 2472, 2407), (5955, 7115, 5950), (5000, 5900, 5000), (4910, 4980, 4000)):
+        if low <= frequency <= high:
+            channel, offset = divmod(frequency - base, 5)
+            return channel if offset == 0 else None
+    return None
+
+class ChannelScheduler:
+    def __init__(self, table: AccessPointTable, known_macs: list[str] | None = None) -> None:
+        self._table = table
+        self._known_macs = known_macs
+        self._records = None
+        self._last_visit = {}
+
+    def _known_slots(self) -> np.ndarray:
+        macs = self._table.macs if self._known_macs is None else self._known_macs
+        slots = [self._table.slot(mac) for mac in macs]
+        return np.array([slot for slot in slots if slot is not None], dtype=int)
+
+    def next_frequency(self, now: float | None = None) -> int | None:
+        # Frequency (MHz) whose known access points have gone the longest without a fresh RSSI, None if none are known.
+        # An access point can only have been refreshed since its channel was last visited, so staleness is capped by that
+        # (stops a silent access point holding the hopper on its channel)
+        now = time.monotonic() if now is None else now
+        self._records = self._table.snapshot(out=self._records)
+        slots = self._known_slots()
+        slots = slots[slots < len(self._records)]
+        records = self._records[slots]
+        records = records[records['frequency'] > 0]
+        if len(records) == 0:
+            return None
+
+        frequencies = records['frequency'].astype(int)
+        last_visit = np.array([self._last_visit.get(frequency, -np.inf) for frequency in frequencies.tolist()])
+        staleness = np.minimum(now - records['last_updated'], now - last_visit)
+        staleness = np.where(np.isfinite(staleness), staleness, np.finfo(float).max / len(staleness))
+
+        unique_frequencies, frequency_slots = np.unique(frequencies, return_inverse=True)
+        weights = np.bincount(frequency_slots, weights=staleness)
+        frequency = int(unique_frequencies[np.argmax(weights)])
+        self._last_visit[frequency] = now
+        return frequency
+
+class IwChannelSwitcher:
+    # Fallback - a fork of `iw` per hop
+    def __init__(self, interface: str) -> None:
+        self._interface = interface
+
+    def set_frequency(self, frequency: int) -> None:
+        subprocess.run(['iw', 'dev', self._interface, 'set', 'freq', str(frequency)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def close(self) -> None:
+        pass
+
+class Nl80211ChannelSwitcher:
+    # Persistent generic netlink socket sending nl80211 SET_WIPHY (what `iw dev <interface> set freq` does)
+    def __init__(self, interface: str) -> None:
+        self._ifindex = socket.if_nametoindex(interface)
+        self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self._socket.bind((0, 0))
+        self._sequence = 0
+        self._family = self._resolve_family(b"nl80211")
+
+    @staticmethod
+    def _attribute(attribute_type: int, payload: bytes) -> bytes:
+        length = 4 + len(payload)
+        return struct.pack("HH", length, attribute_type) + payload + b"\0" * (-length % 4)
+
+    def _request(self, family: int, command: int, attributes: bytes) -> bytes:
+        # Returns the reply to this request (empty if the command only acknowledges) once its ACK arrives. Messages for
+        # other sequence numbers (late replies to an earlier request) are skipped, a nonzero error raises OSError
+        self._sequence += 1
+        body = struct.pack("BBH", command, 1, 0) + attributes
+        header = struct.pack("IHHII", 16 + len(body), family, NLM_F_REQUEST | NLM_F_ACK, self._sequence, 0)
+        self._socket.send(header + body)
+
+        reply = b""
+        while True:
+            data = self._socket.recv(65536)
+            offset = 0
+            while offset + 16 <= len(data):
+                length, message_type, _, sequence, _ = struct.unpack_from("IHHII", data, offset)
+                if length < 16:
+                    break
+                message = data[offset:offset + length]
+                offset += (length + 3) & ~3
+                if sequence != self._sequence:
+                    continue
+                if message_type == NLMSG_ERROR:
+                    (error,) = struct.unpack_from("i", message, 16)
+                    if error != 0:
+                        raise OSError(-error, f"nl80211 request failed: {os.strerror(-error)}")
+                    return reply
+                reply = message
+
+    def _resolve_family(self, name: bytes) -> int:
+        response = self._request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY, self._attribute(CTRL_ATTR_FAMILY_NAME, name + b"\0"))
+
+        # Walk the attributes after the netlink (16 byte) and generic netlink (4 byte) headers
+        offset = 20
+        while offset + 4 <= len(response):
+            length, attribute_type = struct.unpack_from("HH", response, offset)
+            if length < 4:
+                break
+            if attribute_type == CTRL_ATTR_FAMILY_ID:
+                return struct.unpack_from("H", response, offset + 4)[0]
+            offset += (length + 3) & ~3
+        raise OSError(f"Generic netlink family {name.decode()} not found")
+
+    def set_frequency(self, frequency: int) -> None:
+        attributes = self._attribute(NL80211_ATTR_IFINDEX, struct.pack("I", self._ifindex)) + \
+                     self._attribute(NL80211_ATTR_WIPHY_FREQ, struct.pack("I", frequency)) + \
+                     self._attribute(NL80211_ATTR_WIPHY_CHANNEL_TYPE, struct.pack("I", NL80211_CHAN_NO_HT))
+        self._request(self._family, NL80211_CMD_SET_WIPHY, attributes)
+
+    def close(self) -> None:
+        self._socket.close()
+
+def channel_switcher(interface: str) -> Nl80211ChannelSwitcher | IwChannelSwitcher:
+    try:
+        return Nl80211ChannelSwitcher(interface)
+    except (OSError, AttributeError) as error:
+        # No netlink (not Linux, no such interface or not permitted)
+        print(f"Falling back to 'iw' subprocess channel switching: {error}")
+        return IwChannelSwitcher(interface)
@@ -0,0 +1,134 @@
+import math
+
+import numpy as np
+
+TRUNCATION_SIGMAS = 4.0  # Beyond 4σ a Gaussian is < 0.04% of its peak, well below a visible colour step
+MAX_BATCH_CELLS = 1 << 22  # Window cells evaluated at once when accumulating many Gaussians
+WINDOW_STEP = 8  # Window half sizes are rounded up to a multiple of this many cells
+
+class GaussianHeatmap:
+    def __init__(self, min_x: float, max_x: float, min_y: float, max_y: float, granularity: int = 300,
+                       truncation_sigmas: float = TRUNCATION_SIGMAS) -> None:
+        # Same cell centres as np.meshgrid(np.linspace(min_x, max_x, granularity), np.linspace(min_y, max_y, granularity))
+        self._xs = np.linspace(min_x, max_x, granularity)
+        self._ys = np.linspace(min_y, max_y, granularity)
+        self._cell_x = self._xs[1] - self._xs[0]
+        self._cell_y = self._ys[1] - self._ys[0]
+        self._truncation_sigmas = truncation_sigmas
+        self._grid = np.zeros((granularity, granularity), dtype=np.float32)
+        self._window = (slice(0, 0), slice(0, 0))
+        self._offsets = {}
+
+    @property
+    def extent(self) -> tuple[float, float, float, float]:
+        return self._xs[0], self._xs[-1], self._ys[0], self._ys[-1]
+
+    @property
+    def grid(self) -> np.ndarray:
+        return self._grid
+
+    def _window_slices(self, mean: np.ndarray, cov: np.ndarray) -> tuple[slice, slice]:
+        # Cells within truncation_sigmas standard deviations of the mean along each axis
+        half_width = self._truncation_sigmas * math.sqrt(cov[0, 0])
+        half_height = self._truncation_sigmas * math.sqrt(cov[1, 1])
+        start_x = max(0, math.floor((mean[0] - half_width - self._xs[0]) / self._cell_x))
+        stop_x = min(len(self._xs), math.ceil((mean[0] + half_width - self._xs[0]) / self._cell_x) + 1)
+        start_y = max(0, math.floor((mean[1] - half_height - self._ys[0]) / self._cell_y))
+        stop_y = min(len(self._ys), math.ceil((mean[1] + half_height - self._ys[0]) / self._cell_y) + 1)
+        return slice(start_y, max(start_y, stop_y)), slice(start_x, max(start_x, stop_x))
+
+    def render(self, mean: np.ndarray, cov: np.ndarray) -> np.ndarray:
+        # Peak normalised density of one Gaussian (what multivariate_normal(mean, cov).pdf(space) / max gave), evaluated
+        # analytically over the window around the mean only. Only the previous window is cleared so most cells are untouched
+        self._grid[self._window] = 0.0
+        self._window = rows, columns = self._window_slices(mean, cov)
+
+        dx = self._xs[columns] - mean[0]
+        dy = self._ys[rows, np.newaxis] - mean[1]
+        determinant = cov[0, 0] * cov[1, 1] - cov[0, 1] * cov[1, 0]
+        if dx.size == 0 or dy.size == 0 or determinant <= 0:
+            return self._grid
+
+        # Mahalanobis distance from the closed form 2x2 inverse
+        inverse_xx, inverse_yy = cov[1, 1] / determinant, cov[0, 0] / determinant
+        inverse_xy = -(cov[0, 1] + cov[1, 0]) / (2 * determinant)
+        window = self._grid[self._window]
+        np.exp(-0.5 * (inverse_xx * dx ** 2 + 2 * inverse_xy * dx * dy + inverse_yy * dy ** 2), out=window)
+        peak = window.max()
+        if peak > 0:
+            window /= peak
+        return self._grid
+
+    def _window_offsets(self, half_size: int) -> np.ndarray:
+        offsets = self._offsets.get(half_size)
+        if offsets is None:
+            offsets = self._offsets[half_size] = np.arange(-half_size, half_size + 1)
+        return offsets
+
+    def accumulate(self, means: np.ndarray, covs: np.ndarray, weights: np.ndarray | None = None, density: bool = False) -> np.ndarray:
+        # Sum of many Gaussians (N, 2) means, (N, 2, 2) covs in one batched pass, each truncated to the cells within
+        # truncation_sigmas of its mean. Each is peak normalised (as plot_device drew them) unless density is set, then the
+        # grid is a probability density (× cell area for expected occupancy). Returns a new float32 (granularity, granularity) grid
+        means = np.asarray(means, dtype=float).reshape(-1, 2)
+        covs = np.asarray(covs, dtype=float).reshape(-1, 2, 2)
+        weights = np.ones(len(means)) if weights is None else np.asarray(weights, dtype=float)
+        num_rows, num_columns = self._grid.shape
+
+        determinants = covs[:, 0, 0] * covs[:, 1, 1] - covs[:, 0, 1] * covs[:, 1, 0]
+        valid = (determinants > 0) & np.isfinite(means).all(axis=1)
+        means, covs, weights, determinants = means[valid], covs[valid], weights[valid], determinants[valid]
+        if density:
+            weights = weights / (2 * np.pi * np.sqrt(determinants))
+        # Closed form 2x2 inverses, as float32 (N, 1, 1) to broadcast over the windows
+        inverse_xx = (covs[:, 1, 1] / determinants).astype(np.float32)[:, np.newaxis, np.newaxis]
+        inverse_yy = (covs[:, 0, 0] / determinants).astype(np.float32)[:, np.newaxis, np.newaxis]
+        inverse_xy = (-(covs[:, 0, 1] + covs[:, 1, 0]) / determinants).astype(np.float32)[:, np.newaxis, np.newaxis]
+        weights = weights.astype(np.float32)[:, np.newaxis, np.newaxis]
+
+        # Window half sizes in cells, rounded up to a multiple of WINDOW_STEP so the devices share a few window shapes
+        half_widths = np.ceil(self._truncation_sigmas * np.sqrt(covs[:, 0, 0]) / self._cell_x / WINDOW_STEP)
+        half_heights = np.ceil(self._truncation_sigmas * np.sqrt(covs[:, 1, 1]) / self._cell_y / WINDOW_STEP)
+        half_widths = np.minimum(np.maximum(half_widths, 1) * WINDOW_STEP, num_columns).astype(int)
+        half_heights = np.minimum(np.maximum(half_heights, 1) * WINDOW_STEP, num_rows).astype(int)
+        centre_columns = np.rint((means[:, 0] - self._xs[0]) / self._cell_x).astype(int)
+        centre_rows = np.rint((means[:, 1] - self._ys[0]) / self._cell_y).astype(int)
+        # Only windows overlapping the grid, which then lie within two half sizes of it
+        on_grid = (centre_columns + half_widths >= 0) & (centre_columns - half_widths < num_columns) & \
+                  (centre_rows + half_heights >= 0) & (centre_rows - half_heights < num_rows)
+
+        # Accumulates into a grid padded by the largest window so no window needs clipping
+        padding = 2 * max(half_widths.max(initial=0), half_heights.max(initial=0))
+        stride = num_columns + 2 * padding
+        padded = np.zeros((num_rows + 2 * padding) * stride, dtype=np.float32)
+
+        shapes, shape_members = np.unique(np.stack([half_widths, half_heights], axis=1)[on_grid], axis=0, return_inverse=True)
+        members_on_grid = np.flatnonzero(on_grid)
+        for shape, (half_width, half_height) in enumerate(shapes):
+            offset_columns = self._window_offsets(half_width)
+            offset_rows = self._window_offsets(half_height)
+            members = members_on_grid[shape_members.ravel() == shape]
+            batch_size = max(1, MAX_BATCH_CELLS // (len(offset_columns) * len(offset_rows)))
+            for start in range(0, len(members), batch_size):
+                batch = members[start:start + batch_size]
+                # Offsets from the mean (N, 1, width) and (N, height, 1)
+                dx = ((centre_columns[batch, np.newaxis] + offset_columns) * self._cell_x + (self._xs[0] - means[batch, 0, np.newaxis]))
+                dy = ((centre_rows[batch, np.newaxis] + offset_rows) * self._cell_y + (self._ys[0] - means[batch, 1, np.newaxis]))
+                dx = dx.astype(np.float32)[:, np.newaxis, :]
+                dy = dy.astype(np.float32)[:, :, np.newaxis]
+
+                # -0.5 (dx (a dx + 2b dy) + c dy²), only the sum and its products are full window sized
+                values = inverse_xx[batch] * dx + inverse_xy[batch] * dy
+                values *= dx
+                values += inverse_yy[batch] * dy ** 2
+                values *= -0.5
+                np.exp(values, out=values)
+                values *= weights[batch]
+
+                cells = ((centre_rows[batch, np.newaxis] + offset_rows + padding) * stride)[:, :, np.newaxis] + \
+                        (centre_columns[batch, np.newaxis] + offset_columns + padding)[:, np.newaxis, :]
+                # Windows overlap, so sum by cell over just the span of the grid this batch touches
+                first_cell = cells.min()
+                sums = np.bincount(cells.ravel() - first_cell, weights=values.ravel())
+                padded[first_cell:first_cell + len(sums)] += sums
+
+        return padded.reshape(-1, stride)[padding:padding + num_rows, padding:padding + num_columns].copy()
@@ -0,0 +1,175 @@
+import argparse
+import time
+from typing import NamedTuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from tracking_log import read_tracking_log
+from trilateration import PATH_LOSS_EXPONENT, RSSI_REF
+
+UNHEARD_RSSI = -100.0  # RSSI radio map cells record for an access point that isn't heard there, roughly a receiver's sensitivity (dBm)
+MIN_ACCESS_POINTS = 3  # Access points that must be heard for a fingerprint fix
+DEFAULT_NEIGHBOURS = 4
+PROJECTION_DIMS = 16  # Principal components of the radio map the KD-tree searches in
+CANDIDATE_FACTOR = 8  # Candidates taken from the tree per neighbour, re-ranked on the full RSSI vectors
+MIN_RSSI_DISTANCE = 1e-3  # Keeps an exact match from taking all the weight (dBm)
+
+class RadioMap(NamedTuple):
+    positions: np.ndarray  # (M, 2) cell centres
+    rssi: np.ndarray  # (M, K) float32 expected RSSI per access point, UNHEARD_RSSI where it isn't heard
+    cell_size: float  # (m)
+
+def synthesize_radio_map(ap_positions: np.ndarray,
+                         min_x: float, max_x: float, min_y: float, max_y: float,
+                         cell_size: float = 0.5,
+                         rssi_ref=RSSI_REF,
+                         path_loss_exponent=PATH_LOSS_EXPONENT) -> RadioMap:
+    # Radio map from the log-distance model, rssi_ref and path_loss_exponent can be per AP (K, )
+    xs = np.arange(min_x + cell_size / 2, max_x, cell_size)
+    ys = np.arange(min_y + cell_size / 2, max_y, cell_size)
+    positions = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+    # float32 (M, K) throughout, a 100k cell map of hundreds of access points is already ~100MB
+    ap_positions = np.asarray(ap_positions, dtype=np.float32)
+    squared_distances = np.square(positions[:, 0, np.newaxis].astype(np.float32) - ap_positions[:, 0])
+    squared_distances += np.square(positions[:, 1, np.newaxis].astype(np.float32) - ap_positions[:, 1])
+    np.maximum(squared_distances, (cell_size / 2) ** 2, out=squared_distances)
+    rssi = np.log10(squared_distances, out=squared_distances)
+    rssi *= -5 * np.asarray(path_loss_exponent, dtype=np.float32)
+    rssi += np.asarray(rssi_ref, dtype=np.float32)
+    return RadioMap(positions, np.maximum(rssi, UNHEARD_RSSI, out=rssi), cell_size)
+
+def radio_map_from_log(path: str, cell_size: float = 0.5,
+                       rssi_ref=RSSI_REF,
+                       path_loss_exponent=PATH_LOSS_EXPONENT) -> tuple[RadioMap, list[str]]:
+    # Radio map from a calibration walk recorded as a tracking log whose x, y are the surveyed positions. The logged distances
+    # are turned back into the RSSI they were converted from and averaged per cell, cells never visited are left out
+    records, access_points = read_tracking_log(path)
+    positions = np.stack([records['x'], records['y']], axis=1)
+    known = np.isfinite(positions).all(axis=1)
+    positions = positions[known]
+    rssi = rssi_ref - 10 * np.asarray(path_loss_exponent) * np.log10(records['distances'][known].astype(float))
+
+    cells, cell_index = np.unique(np.floor(positions / cell_size).astype(int), axis=0, return_inverse=True)
+    cell_index = cell_index.ravel()
+    heard = np.isfinite(rssi)
+    counts = np.zeros((len(cells), rssi.shape[1]))
+    sums = np.zeros((len(cells), rssi.shape[1]))
+    np.add.at(counts, cell_index, heard)
+    np.add.at(sums, cell_index, np.where(heard, rssi, 0.0))
+
+    cell_rssi = np.full(sums.shape, UNHEARD_RSSI)
+    np.divide(sums, counts, out=cell_rssi, where=counts > 0)
+    return RadioMap((cells + 0.5) * cell_size, np.maximum(cell_rssi, UNHEARD_RSSI).astype(np.float32), cell_size), access_points
+
+class FingerprintLocator:
+    def __init__(self, radio_map: RadioMap,
+                       num_neighbours: int = DEFAULT_NEIGHBOURS,
+                       projection_dims: int = PROJECTION_DIMS) -> None:
+        self._positions = np.asarray(radio_map.positions, dtype=float)
+        self._rssi = np.ascontiguousarray(radio_map.rssi, dtype=np.float32)
+        self._cell_variance = radio_map.cell_size ** 2 / 12  # Variance of a uniform position within a cell
+        self._num_neighbours = min(num_neighbours, len(self._positions))
+        self._num_candidates = min(len(self._positions), CANDIDATE_FACTOR * self._num_neighbours)
+
+        # Hundreds of access points are too many dimensions for a KD-tree to prune, so it indexes the map's leading principal
+        # components and the candidates it returns are re-ranked on the full vectors
+        self._rssi_mean = self._rssi.mean(axis=0)
+        centred = self._rssi - self._rssi_mean
+        _, eigenvectors = np.linalg.eigh(centred.T.astype(float) @ centred)
+        self._components = np.ascontiguousarray(eigenvectors[:, ::-1][:, :projection_dims], dtype=np.float32)
+        self._tree = cKDTree(centred @ self._components)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def locate(self, rssi: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Single fix from a (K, ) RSSI vector in radio map order, NaN for unheard access points. Same contract as
+        # AccessPointRegistry.trilaterate, so either can feed KalmanFilter2D.update
+        rssi = np.asarray(rssi, dtype=float)
+        if np.count_nonzero(~np.isnan(rssi)) < MIN_ACCESS_POINTS:
+            raise ValueError(f"At least {MIN_ACCESS_POINTS} access points are required for a fingerprint fix")
+        positions, covs = self._match(rssi[np.newaxis])
+        return positions[0], covs[0]
+
+    def locate_batch(self, rssi: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # (N, K) RSSI vectors, returns positions (N, 2) and covariances (N, 2, 2), NaN for rows with too few access points
+        rssi = np.atleast_2d(np.asarray(rssi, dtype=float))
+        positions = np.full((len(rssi), 2), np.nan)
+        covs = np.full((len(rssi), 2, 2), np.nan)
+        enough = np.count_nonzero(~np.isnan(rssi), axis=1) >= MIN_ACCESS_POINTS
+        if np.any(enough):
+            positions[enough], covs[enough] = self._match(rssi[enough])
+        return positions, covs
+
+    def _match(self, rssi: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Unheard (NaN) access points are left out of the match rather than matched as UNHEARD_RSSI, a stale or missed
+        # beacon says nothing about the distance to its access point
+        heard = ~np.isnan(rssi)
+        num_heard = np.count_nonzero(heard, axis=1)
+        centred = np.where(heard, np.maximum(rssi, UNHEARD_RSSI) - self._rssi_mean, 0.0).astype(np.float32)
+        query = centred + self._rssi_mean
+
+        # Principal component coordinates that best fit the heard access points, least squares through the normal equations
+        # Ct C = I - Ct_unheard C_unheard (the components are orthonormal). A plain projection when every one is heard
+        coordinates = centred @ self._components
+        dims = self._components.shape[1]
+        partial = np.flatnonzero((num_heard < rssi.shape[1]) & (num_heard > dims))
+        if len(partial):
+            unheard_components = self._components.T * (~heard[partial])[:, np.newaxis, :].astype(np.float32)
+            gram = np.eye(dims) - unheard_components @ self._components
+            coordinates[partial] = (np.linalg.pinv(gram) @ coordinates[partial, :, np.newaxis])[:, :, 0]
+
+        candidates = np.empty((len(rssi), self._num_candidates), dtype=int)
+        searched = (num_heard == rssi.shape[1]) | (num_heard > dims)
+        if np.any(searched):
+            _, found = self._tree.query(coordinates[searched], k=self._num_candidates)
+            candidates[searched] = found.reshape(np.count_nonzero(searched), -1)
+        for row in np.flatnonzero(~searched):
+            # Too few heard to place in the principal components, every cell is compared on the heard access points instead
+            differences = self._rssi[:, heard[row]] - query[row, heard[row]]
+            distances = np.einsum('mk,mk->m', differences, differences)
+            candidates[row] = np.argpartition(distances, self._num_candidates - 1)[:self._num_candidates]
+
+        # Re-rank on the heard access points' RSSI, keeping the nearest num_neighbours
+        differences = self._rssi[candidates] - query[:, np.newaxis]
+        differences *= heard[:, np.newaxis]
+        distances = np.sqrt(np.einsum('nck,nck->nc', differences, differences))
+        nearest = np.argpartition(distances, self._num_neighbours - 1, axis=1)[:, :self._num_neighbours]
+        neighbours = np.take_along_axis(candidates, nearest, axis=1)
+        distances = np.take_along_axis(distances, nearest, axis=1)
+
+        # Inverse distance weighted mean of the neighbours, their weighted spread (plus the cell size) is the covariance
+        weights = 1.0 / np.maximum(distances, MIN_RSSI_DISTANCE)
+        weights /= weights.sum(axis=1, keepdims=True)
+        neighbour_positions = self._positions[neighbours]
+        positions = np.einsum('nc,nci->ni', weights, neighbour_positions)
+        offsets = neighbour_positions - positions[:, np.newaxis]
+        covs = np.einsum('nc,nci,ncj->nij', weights, offsets, offsets) + self._cell_variance * np.eye(2)
+        return positions, covs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time fingerprint lookups against a synthetic radio map")
+    parser.add_argument("--access-points", type=int, default=300)
+    parser.add_argument("--cells", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    size = 100.0
+    ap_positions = rng.uniform(0, size, size=(args.access_points, 2))
+    cell_size = size / np.sqrt(args.cells)
+    start = time.monotonic()
+    locator = FingerprintLocator(synthesize_radio_map(ap_positions, 0, size, 0, size, cell_size))
+    print(f"Built a {len(locator)} cell radio map of {args.access_points} access points in {time.monotonic() - start:.1f}s")
+
+    devices = rng.uniform(0, size, size=(args.lookups, 2))
+    distances = np.linalg.norm(devices[:, np.newaxis] - ap_positions, axis=-1)
+    rssi = RSSI_REF - 10 * PATH_LOSS_EXPONENT * np.log10(np.maximum(distances, 0.1)) + rng.normal(scale=2.0, size=distances.shape)
+    rssi[rssi < UNHEARD_RSSI] = np.nan
+
+    heard = np.count_nonzero(~np.isnan(rssi), axis=1) >= MIN_ACCESS_POINTS
+    start = time.perf_counter()
+    errors = [np.linalg.norm(locator.locate(row)[0] - device) for row, device in zip(rssi[heard], devices[heard])]
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed / max(1, len(errors)) * 1e3:.3f} ms per lookup, median error {np.median(errors):.2f}m")
@@ -0,0 +1,61 @@
+import re
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from channel_hopper import frequency_to_channel
+
+# Each pattern matches a single line of `iw dev <interface> scan` output
+BSS_PATTERN = re.compile(r"BSS ([0-9a-f]{2}(?::[0-9a-f]{2}){5})")
+FREQUENCY_PATTERN = re.compile(r"\s+freq: (\d+)")
+SIGNAL_PATTERN = re.compile(r"\s+signal: (-?\d+(?:\.\d+)?) dBm")
+LAST_SEEN_PATTERN = re.compile(r"\s+last seen: (\d+) ms ago")
+SSID_PATTERN = re.compile(r"\s+SSID: *(.*\S)?")
+DS_CHANNEL_PATTERN = re.compile(r"\s+DS Parameter set: channel (\d+)")
+PRIMARY_CHANNEL_PATTERN = re.compile(r"\s+\* primary channel: (\d+)")
+
+def _access_point_info(bss: dict) -> dict | None:
+    # Same requirements as the original regex - frequency, signal and a (non hidden) SSID
+    if 'Frequency' not in bss or 'Signal Level (RSSI)' not in bss or not bss.get('SSID'):
+        return None
+    if 'Channel' not in bss:
+        bss['Channel'] = frequency_to_channel(bss['Frequency'])
+    bss.setdefault('Last Seen (ms)', 0)
+    bss['Last Updated'] = datetime.now()
+    return bss
+
+def parse_iw_scan(lines: Iterable[str]) -> Iterator[dict]:
+    # Yields each access point as soon as its BSS block ends, so it can read straight from the subprocess pipe
+    bss = None
+    for line in lines:
+        if line.startswith("BSS "):
+            if bss is not None and (ap_info := _access_point_info(bss)) is not None:
+                yield ap_info
+            match = BSS_PATTERN.match(line)
+            bss = {'MAC Address': match.group(1)} if match else None
+            continue
+        if bss is None:
+            continue
+
+        # Cheap prefix checks on the stripped line before running any pattern
+        stripped = line.lstrip()
+        if stripped.startswith("freq:"):
+            if match := FREQUENCY_PATTERN.match(line):
+                bss['Frequency'] = int(match.group(1)) # Frequency in MHz
+        elif stripped.startswith("signal:"):
+            if match := SIGNAL_PATTERN.match(line):
+                bss['Signal Level (RSSI)'] = float(match.group(1)) # RSSI in dBm
+        elif stripped.startswith("last seen:"):
+            if match := LAST_SEEN_PATTERN.match(line):
+                bss['Last Seen (ms)'] = int(match.group(1))
+        elif stripped.startswith("SSID:"):
+            if 'SSID' not in bss and (match := SSID_PATTERN.match(line)):
+                bss['SSID'] = match.group(1) or ""
+        elif stripped.startswith("DS Parameter set:"):
+            if match := DS_CHANNEL_PATTERN.match(line):
+                bss['Channel'] = int(match.group(1))
+        elif stripped.startswith("* primary channel:"):
+            if 'Channel' not in bss and (match := PRIMARY_CHANNEL_PATTERN.match(line)):
+                bss['Channel'] = int(match.group(1))
+
+    if bss is not None and (ap_info := _access_point_info(bss)) is not None:
+        yield ap_info
@@ -1,11 +1,36 @@
+from bisect import bisect_right
+from collections import OrderedDict, deque
+import math
+
 import numpy as np
 from abc import ABC, abstractmethod
 
+# Default motion model for a person carrying a device, shared by the live tracker, the server and the simulations
+MAX_ACCELERATION = 1.5 # 1.5m/s² is a decent estimate of max acceleration indoors
+ACCELERATION_VARIANCE = MAX_ACCELERATION ** 2 / 3.0
+
+# Number of distinct dt values whose transition matrices are kept per filter (dt is almost always constant)
+TRANSITION_CACHE_SIZE = 8
+
+# Above this condition number the closed form inverse of the innovation covariance S isn't trusted
+MAX_INNOVATION_CONDITION = 1e12
+
+# Updates kept to retrodict late (out of sequence) measurements with, for filters fed by several sniffers
+OOSM_HISTORY_SIZE = 64
+
+# Predicts kept per history entry, a new baseline entry is started after this many so the history stays bounded without updates
+MAX_HISTORY_STEPS = 64
+
+# Range updates are skipped when the estimate is this close to the access point, the Jacobian is undefined on top of it (m)
+MIN_RANGE = 0.1
+
 class BaseKalmanFilter(ABC):
     def __init__(self, state_dims: int, 
                        meas_dims: int,
                        noise_dims: int,
-                       acceleration_variance: float) -> None:
+                       acceleration_variance: float,
+                       fast_update: bool = False,
+                       history_size: int = 0) -> None:
         self._state_dims = state_dims
         self._meas_dims = meas_dims
         self._noise_dims = noise_dims
@@ -18,6 +43,22 @@ class BaseKalmanFilter(ABC):
 
         self._acceleration_variance = acceleration_variance
 
+        # Fast update requires H = [I 0] (the measurement is the first meas_dims states), checked on first use
+        self._fast_update = fast_update
+        self._position_only_H = None
+
+        # dt -> (F, G Gt, Q) with least recently used eviction
+        self._transition_cache = OrderedDict()
+
+        # Preallocated work buffers so predict doesn't allocate
+        self._x_work = np.zeros(self._state_dims)
+        self._P_work = np.zeros((self._state_dims, self._state_dims))
+
+        # Time since construction (sum of the predicted dts) and a ring buffer of the state before each update, the update
+        # itself and the predicts after it, see _record. None when late measurements aren't supported
+        self._time = 0.0
+        self._history = deque(maxlen=history_size) if history_size > 0 else None
+
     @abstractmethod
     def F(self, dt: float) -> np.ndarray:
         F = np.eye(self._state_dims)
@@ -33,17 +74,113 @@ class BaseKalmanFilter(ABC):
         H = np.zeros((self._meas_dims, self._state_dims))
         return H
 
-    def predict(self, dt: float) -> None:
+    def _transition(self, dt: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Keyed on the exact dt, a variable dt (e.g. beacon arrival times) always misses and is built fresh
+        transition = self._transition_cache.get(dt)
+        if transition is not None:
+            self._transition_cache.move_to_end(dt)
+            return transition
+
         F = self.F(dt)
         G = self.G(dt)
-        I_meas = np.eye(self._meas_dims)
+        GGt = G.dot(G.T)
+        # Q = G aI Gt
+        Q = G.dot(self._acceleration_variance * np.eye(self._noise_dims)).dot(G.T)
+        for matrix in (F, GGt, Q):
+            matrix.setflags(write=False)
+
+        transition = (F, GGt, Q)
+        self._transition_cache[dt] = transition
+        if len(self._transition_cache) > TRANSITION_CACHE_SIZE:
+            self._transition_cache.popitem(last=False)
+        return transition
+
+    def predict(self, dt: float) -> None:
+        if self._history is not None:
+            if not self._history or len(self._history[-1][5]) >= MAX_HISTORY_STEPS:
+                self._record(None, ())
+            self._history[-1][5].append(dt)
+        self._time += dt
+        F, _, Q = self._transition(dt)
 
         # x = F x (if there were control inputs add "+ B u" to add input to the state)
-        # P = F P Ft + G aI Gt
-        self._x = F.dot(self._x)
-        self._P = F.dot(self._P).dot(F.T) + G.dot(self._acceleration_variance * I_meas).dot(G.T)
+        # P = F P Ft + Q
+        # x is written to the work buffer and the two swapped rather than copied back
+        np.matmul(F, self._x, out=self._x_work)
+        self._x, self._x_work = self._x_work, self._x
+        np.matmul(F, self._P, out=self._P_work)
+        np.matmul(self._P_work, F.T, out=self._P)
+        self._P += Q
 
     def update(self, meas_value: np.ndarray, meas_variance: np.ndarray) -> None:
+        self._record(self._apply_update, (meas_value, meas_variance))
+        self._apply_update(meas_value, meas_variance)
+
+    def update_delayed(self, meas_value: np.ndarray, meas_variance: np.ndarray, lag: float) -> bool:
+        # Applies a measurement taken `lag` seconds before the current filter time, exactly as if it had arrived in order:
+        # rewinds to the last stored state before it, then replays every later update and predict, splitting the predict
+        # the measurement falls within. Returns False (and leaves the filter unchanged) when it's older than the history or
+        # there is no history
+        if lag <= 0:
+            self.update(meas_value, meas_variance)
+            return True
+        return self._update_delayed(self._apply_update, (meas_value, meas_variance), lag)
+
+    def _record(self, apply, arguments: tuple) -> None:
+        # History entries are (time, x and P before the update, the update method, its arguments, the dts predicted after
+        # it), the update method is None for baseline entries
+        if self._history is not None:
+            self._history.append((self._time, self._x.copy(), self._P.copy(), apply, arguments, []))
+
+    def _update_delayed(self, apply, arguments: tuple, lag: float) -> bool:
+        timestamp = self._time - lag
+        if not self._history or timestamp < self._history[0][0]:
+            return False
+
+        entries = list(self._history)
+        start = bisect_right([entry[0] for entry in entries], timestamp) - 1
+
+        # Rewind to the state before the first replayed update, the replay records the entries again
+        self._time, x, P, _, _, _ = entries[start]
+        self._x = x.copy()
+        self._P = P.copy()
+        for _ in range(len(entries) - start):
+            self._history.pop()
+
+        pending = True
+        for _, _, _, entry_apply, entry_arguments, steps in entries[start:]:
+            self._record(entry_apply, entry_arguments)
+            if entry_apply is not None:
+                entry_apply(*entry_arguments)
+            for dt in steps:
+                if pending and self._time + dt > timestamp:
+                    # The measurement falls within this predict, which is split at it as in order processing would have
+                    end_time = self._time + dt
+                    if timestamp > self._time:
+                        self.predict(timestamp - self._time)
+                    self._record(apply, arguments)
+                    apply(*arguments)
+                    pending = False
+                    dt = end_time - self._time
+                self.predict(dt)
+        if pending:
+            self._record(apply, arguments)
+            apply(*arguments)
+        return True
+
+    @property
+    def time(self) -> float:
+        return self._time
+
+    @property
+    def history_size(self) -> int:
+        return 0 if self._history is None else self._history.maxlen
+
+    def _apply_update(self, meas_value: np.ndarray, meas_variance: np.ndarray) -> None:
+        if self._fast_update:
+            self._update_position_only(meas_value, meas_variance)
+            return
+
         z = np.array(meas_value)
         R = np.array(meas_variance)
         H = self.H()
@@ -60,19 +197,66 @@ class BaseKalmanFilter(ABC):
         self._x = self._x + K.dot(y)
         self._P = (I_state - K.dot(H)).dot(self._P)
 
+    def _inverse_innovation(self, S: np.ndarray) -> np.ndarray:
+        if self._meas_dims == 1:
+            if abs(S[0, 0]) > 1.0 / MAX_INNOVATION_CONDITION:
+                return 1.0 / S
+        elif self._meas_dims == 2:
+            # Analytic 2x2 inverse, cond(S) estimated as ||S||_F^2 / |det(S)|
+            a, b, c, d = S[0, 0], S[0, 1], S[1, 0], S[1, 1]
+            det = a * d - b * c
+            if abs(det) * MAX_INNOVATION_CONDITION > a * a + b * b + c * c + d * d:
+                return np.array([[d, -b], [-c, a]]) / det
+        else:
+            try:
+                L_inv = np.linalg.inv(np.linalg.cholesky(S))
+                return L_inv.T.dot(L_inv)
+            except np.linalg.LinAlgError:
+                pass
+
+        # Ill-conditioned, fall back to the pseudo-inverse
+        return np.linalg.pinv(S)
+
+    def _update_position_only(self, meas_value: np.ndarray, meas_variance: np.ndarray) -> None:
+        if self._position_only_H is None:
+            self._position_only_H = np.array_equal(self.H(), np.eye(self._meas_dims, self._state_dims))
+        if not self._position_only_H:
+            raise ValueError("Fast update requires H to select the first meas_dims states")
+
+        m = self._meas_dims
+        z = np.asarray(meas_value, dtype=float).reshape(m)
+        R = np.asarray(meas_variance, dtype=float).reshape(m, m)
+
+        # With H = [I 0]: H x = x[:m], P Ht = P[:, :m], H P Ht = P[:m, :m]
+        # y = z - H x
+        # S = H P Ht + R
+        # K = P Ht S^-1
+        # x = x + K y
+        # P = P - K S Kt (equal to (I - K H) P), symmetrized to stop rounding errors accumulating
+        y = z - self._x[:m]
+        S = self._P[:m, :m] + R
+        K = self._P[:, :m].dot(self._inverse_innovation(S))
+        self._x += K.dot(y)
+        self._P -= K.dot(S).dot(K.T)
+        self._P += self._P.T
+        self._P *= 0.5
+
+    # Copies, as predict works on the state in place and callers keep these (e.g. a track's history)
     @property
     def mean(self) -> np.ndarray:
-        return self._x
+        return self._x.copy()
 
     @property
     def cov(self) -> np.ndarray:
-        return self._P
+        return self._P.copy()
     
 class KalmanFilter1D(BaseKalmanFilter):
     def __init__(self, initial_x: float, 
                        initial_v: float,
-                       acceleration_variance: float) -> None:
-        super().__init__(state_dims=2, meas_dims=1, noise_dims=1, acceleration_variance=acceleration_variance)
+                       acceleration_variance: float,
+                       fast_update: bool = False,
+                       history_size: int = 0) -> None:
+        super().__init__(state_dims=2, meas_dims=1, noise_dims=1, acceleration_variance=acceleration_variance, fast_update=fast_update, history_size=history_size)
         
         self.iX = 0
         self.iV_X = 1
@@ -110,8 +294,10 @@ class KalmanFilter2D(BaseKalmanFilter):
                        initial_y: float,
                        initial_v_x: float,
                        initial_v_y: float,
-                       acceleration_variance: float) -> None:
-        super().__init__(state_dims=4, meas_dims=2, noise_dims=2, acceleration_variance=acceleration_variance)
+                       acceleration_variance: float,
+                       fast_update: bool = False,
+                       history_size: int = 0) -> None:
+        super().__init__(state_dims=4, meas_dims=2, noise_dims=2, acceleration_variance=acceleration_variance, fast_update=fast_update, history_size=history_size)
         
         self.iX = 0
         self.iY = 1
@@ -158,4 +344,141 @@ class KalmanFilter2D(BaseKalmanFilter):
 
     @property
     def vel_y(self) -> float:
-        return self._x[self.iV_Y]
\ No newline at end of file
+        return self._x[self.iV_Y]
+
+class ExtendedKalmanFilter2D(KalmanFilter2D):
+    # KalmanFilter2D that can also be updated from the range to a single access point, h(x) = ||p - a||, linearised about the
+    # current estimate. Every beacon updates the filter as it arrives rather than waiting for three for a trilateration fix
+    def update_range(self, ap_position: np.ndarray, distance: float, distance_variance: float) -> bool:
+        # Returns False, leaving the state and history unchanged, when the estimate is within MIN_RANGE of the access point
+        arguments = (ap_position, distance, distance_variance)
+        if math.hypot(self._x[self.iX] - ap_position[0], self._x[self.iY] - ap_position[1]) < MIN_RANGE:
+            return False
+        self._record(self._apply_range_update, arguments)
+        return self._apply_range_update(*arguments)
+
+    def update_range_delayed(self, ap_position: np.ndarray, distance: float, distance_variance: float, lag: float) -> bool:
+        # As update_delayed, for a range. A range replayed onto an estimate within MIN_RANGE is skipped by the replay
+        if lag <= 0:
+            return self.update_range(ap_position, distance, distance_variance)
+        return self._update_delayed(self._apply_range_update, (ap_position, distance, distance_variance), lag)
+
+    def _apply_range_update(self, ap_position: np.ndarray, distance: float, distance_variance: float) -> bool:
+        # H = [dx/r dy/r 0 0], the unit vector from the access point
+        # y = z - h(x)
+        # S = H P Ht + R (scalar)
+        # K = P Ht / S
+        # x = x + K y
+        # P = P - K S Kt, symmetrized as in _update_position_only
+        dx = self._x[self.iX] - ap_position[0]
+        dy = self._x[self.iY] - ap_position[1]
+        predicted_range = math.hypot(dx, dy)
+        if predicted_range < MIN_RANGE:
+            return False
+        h_x, h_y = dx / predicted_range, dy / predicted_range
+
+        P_Ht = self._P[:, self.iX] * h_x + self._P[:, self.iY] * h_y
+        S = P_Ht[self.iX] * h_x + P_Ht[self.iY] * h_y + distance_variance
+        K = P_Ht / S
+        self._x += K * (distance - predicted_range)
+        self._P -= np.outer(K, P_Ht)
+        self._P += self._P.T
+        self._P *= 0.5
+        return True
+
+class KalmanFilterBank:
+    def __init__(self, kalman_filters: list[BaseKalmanFilter]) -> None:
+        if len(kalman_filters) == 0:
+            raise ValueError("At least one Kalman filter is required to build a bank")
+
+        # Every filter in the bank must share the same model, the first one is used as the template
+        self._template = kalman_filters[0]
+        if any(type(kalman_filter) is not type(self._template) for kalman_filter in kalman_filters):
+            raise ValueError("All Kalman filters in a bank must be of the same type")
+
+        self._state_dims = self._template._state_dims
+        self._meas_dims = self._template._meas_dims
+        self._acceleration_variance = np.array([kalman_filter._acceleration_variance for kalman_filter in kalman_filters], dtype=float)
+
+        # Stacked mean states (N, state_dims) and covariances (N, state_dims, state_dims)
+        self._x = np.stack([kalman_filter.mean for kalman_filter in kalman_filters]).astype(float)
+        self._P = np.stack([kalman_filter.cov for kalman_filter in kalman_filters]).astype(float)
+
+    def __len__(self) -> int:
+        return self._x.shape[0]
+
+    def _indices(self, mask: np.ndarray | None) -> np.ndarray | slice:
+        if mask is None:
+            return slice(None)
+        mask = np.asarray(mask)
+        if mask.dtype == bool:
+            return np.flatnonzero(mask)
+        return mask
+
+    def append(self, kalman_filter: BaseKalmanFilter) -> int:
+        if type(kalman_filter) is not type(self._template):
+            raise ValueError("All Kalman filters in a bank must be of the same type")
+
+        self._x = np.concatenate([self._x, kalman_filter.mean[np.newaxis]])
+        self._P = np.concatenate([self._P, kalman_filter.cov[np.newaxis]])
+        self._acceleration_variance = np.append(self._acceleration_variance, kalman_filter._acceleration_variance)
+        return len(self) - 1
+
+    def predict(self, dt: float, mask: np.ndarray | None = None) -> None:
+        idx = self._indices(mask)
+        F, GGt, _ = self._template._transition(dt)
+
+        # Same as BaseKalmanFilter.predict but for all selected filters at once
+        # x = F x
+        # P = F P Ft + G aI Gt
+        self._x[idx] = np.einsum('ij,nj->ni', F, self._x[idx])
+        self._P[idx] = F @ self._P[idx] @ F.T + self._acceleration_variance[idx, np.newaxis, np.newaxis] * GGt
+
+    def update(self, meas_values: np.ndarray, meas_variances: np.ndarray, mask: np.ndarray | None = None) -> None:
+        idx = self._indices(mask)
+        x = self._x[idx]
+        P = self._P[idx]
+
+        # One measurement (meas_dims, ) and covariance (meas_dims, meas_dims) per selected filter
+        z = np.asarray(meas_values, dtype=float).reshape(x.shape[0], self._meas_dims)
+        R = np.asarray(meas_variances, dtype=float).reshape(x.shape[0], self._meas_dims, self._meas_dims)
+        H = self._template.H()
+
+        # y = z - H x
+        # S = H P Ht + R
+        # K = P Ht S^-1
+        # x = x + K y
+        # P = (I - K H) P
+        y = z - np.einsum('ij,nj->ni', H, x)
+        PHt = P @ H.T
+        S = H @ PHt + R
+        K = PHt @ self._inverse_innovations(S)
+        self._x[idx] = x + np.einsum('nij,nj->ni', K, y)
+        self._P[idx] = (np.eye(self._state_dims) - K @ H) @ P
+
+    def _inverse_innovations(self, S: np.ndarray) -> np.ndarray:
+        # Stack (N, meas_dims, meas_dims) version of BaseKalmanFilter._inverse_innovation, analytic 1x1 and 2x2 inverses with
+        # the pseudo-inverse only for the (rare) ill-conditioned ones
+        if self._meas_dims == 1:
+            well_conditioned = np.abs(S[:, 0, 0]) > 1.0 / MAX_INNOVATION_CONDITION
+            S_inv = 1.0 / np.where(well_conditioned[:, np.newaxis, np.newaxis], S, 1.0)
+        elif self._meas_dims == 2:
+            a, b, c, d = S[:, 0, 0], S[:, 0, 1], S[:, 1, 0], S[:, 1, 1]
+            det = a * d - b * c
+            well_conditioned = np.abs(det) * MAX_INNOVATION_CONDITION > np.sum(S ** 2, axis=(1, 2))
+            safe_det = np.where(well_conditioned, det, 1.0)
+            S_inv = np.stack([np.stack([d, -b], axis=-1), np.stack([-c, a], axis=-1)], axis=1) / safe_det[:, np.newaxis, np.newaxis]
+        else:
+            return np.linalg.pinv(S)
+
+        if not np.all(well_conditioned):
+            S_inv[~well_conditioned] = np.linalg.pinv(S[~well_conditioned])
+        return S_inv
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self._x
+
+    @property
+    def cov(self) -> np.ndarray:
+        return self._P
@@ -5,10 +5,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 import matplotlib.animation as animation
-import pandas as pd
-from scipy.stats import multivariate_normal
-
+from density import GaussianHeatmap
 from kf import KalmanFilter1D, KalmanFilter2D
+from tracking_log import TrackingLogWriter
+from trilateration import PATH_LOSS_EXPONENT, SIGMA_RSSI
 
 def simulate_kalman_filter_1d():
     plt.figure(figsize=(11.5, 6.5), dpi=110)
@@ -156,7 +156,7 @@ def simulate_kalman_filter_2d():
 
     plt.show()
 
-def plot_device(ax, x, y, cov, space, label_space_x, label_space_y, label):
+def plot_device(ax, x, y, label_space_x, label_space_y, label):
     scatter = ax.scatter(x, y, color='black', s=20)
     text = ax.text(x + label_space_x, 
                    y + label_space_y, 
@@ -165,9 +165,7 @@ def plot_device(ax, x, y, cov, space, label_space_x, label_space_y, label):
                    fontsize=12, 
                    weight='bold', 
                    bbox=dict(facecolor='white', edgecolor='white', boxstyle='round,pad=0.1'))
-    distribution = multivariate_normal(mean=[x, y], cov=cov).pdf(space)
-    distribution /= distribution.max()
-    return scatter, text, distribution
+    return scatter, text
 
 def plot_router(ax, x, y, label_space_x, label_space_y, label):
     scatter = ax.scatter(x, y, marker="^", color="red")
@@ -182,9 +180,7 @@ def plot_router(ax, x, y, label_space_x, label_space_y, label):
 def simulate_static_wifi_2d():
     min_x, max_x, min_y, max_y = 0, 50, 0, 40
     granularity = 300
-    x, y = np.linspace(min_x, max_x, granularity), np.linspace(min_y, max_y, granularity)
-    X, Y = np.meshgrid(x, y)
-    space = np.dstack((X, Y))
+    density = GaussianHeatmap(min_x, max_x, min_y, max_y, granularity)
 
     # Plot the combined Gausians
     _, ax = plt.subplots(figsize=(11.5, 6.5), dpi=110)
@@ -192,14 +188,13 @@ def simulate_static_wifi_2d():
     label_space_y = (max_y - min_y) / 100.0
 
     # Mark and label both means
-    distributions = []
     devices = [(25, 25, [[10, 4], [4, 2]], 'Cam Phone'), 
                (40, 15, [[6, -2], [-2, 8]], 'Cam Laptop')]
-    for dx, dy, cov, label in devices:
-        _, _, device_distribution = plot_device(ax, dx, dy, cov, space, label_space_x, label_space_y, label)
-        distributions.append(device_distribution)
+    for dx, dy, _, label in devices:
+        plot_device(ax, dx, dy, label_space_x, label_space_y, label)
 
-    distribution = np.sum(distributions, axis=0)
+    # Every device's Gaussian in one batched pass
+    distribution = density.accumulate([[dx, dy] for dx, dy, _, _ in devices], [cov for _, _, cov, _ in devices])
     distribution /= distribution.max()
 
     heatmap = ax.imshow(distribution, extent=(min_x, max_x, min_y, max_y), origin='lower', cmap='plasma', alpha=0.7)
@@ -228,9 +223,7 @@ def simulate_kalman_filter_live_2d():
 
     min_x, max_x, min_y, max_y = 0, 60, -5, 40
     granularity = 300
-    x, y = np.linspace(min_x, max_x, granularity), np.linspace(min_y, max_y, granularity)
-    X, Y = np.meshgrid(x, y)
-    space = np.dstack((X, Y))
+    density = GaussianHeatmap(min_x, max_x, min_y, max_y, granularity)
 
     # Initialize the Kalman filter
     x = 0.2
@@ -248,16 +241,14 @@ def simulate_kalman_filter_live_2d():
     DT = 0.1
     NUM_STEPS = 1000
     MEAS_EVERY_STEPS = 10
-    PATH_LOSS_EXPONENT = 3  # Typical values range from 2 to 4
 
     label_space_x = (max_x - min_x) / 100.0
     label_space_y = (max_y - min_y) / 100.0
 
     fig, ax = plt.subplots(figsize=(11.5, 6.5), dpi=110)
 
-    device_scatter, device_text, device_distribution = plot_device(ax, x, y, kf.cov[:2, :2], space, label_space_x, label_space_y, "Cam Phone")
-    
-    data_log = []
+    device_scatter, device_text = plot_device(ax, x, y, label_space_x, label_space_y, "Cam Phone")
+    device_distribution = density.render(kf.mean[:2], kf.cov[:2, :2])
 
     router_scatters = []
     router_texts = []
@@ -279,6 +270,9 @@ def simulate_kalman_filter_live_2d():
 
     distances = {label: 0 for _, label in routers}
 
+    log_label = "wifi_tracking_log_simulated.bin"
+    data_log = TrackingLogWriter(f"live_data/{log_label}", [label for _, label in routers])
+
     def update(frame):
         nonlocal real_x, real_y, real_v_x, real_v_y
         
@@ -322,8 +316,7 @@ def simulate_kalman_filter_live_2d():
             ])
 
             # Measurement noise covariance (assuming small Gaussian noise on RSSI-derived distances)
-            sigma_rssi = 10  # Estimated RSSI noise in dBm
-            distance_noise = (np.log(10) / (10 * PATH_LOSS_EXPONENT)) * noisy_distances * sigma_rssi
+            distance_noise = (np.log(10) / (10 * PATH_LOSS_EXPONENT)) * noisy_distances * SIGMA_RSSI
             R = np.diag(distance_noise ** 2)
 
             J_inv = np.linalg.pinv(J.T @ J) @ J.T  # Pseudo-inverse of J for stability
@@ -340,14 +333,11 @@ def simulate_kalman_filter_live_2d():
         # Update the label position
         device_text.set_position((kf.mean[0] + label_space_x, kf.mean[1] + label_space_y))
 
-        # Update the uncertainty distribution
-        distribution = multivariate_normal(mean=[kf.mean[0], kf.mean[1]], cov=kf.cov[:2, :2]).pdf(space)
-        distribution /= distribution.max()
-        heatmap.set_array(distribution)
+        # Update the uncertainty distribution, only evaluated around the mean
+        heatmap.set_array(density.render(kf.mean[:2], kf.cov[:2, :2]))
         
         # Log data
-        log_entry = {"timestamp": frame, "x": kf.pos_x, "y": kf.pos_y, **distances}
-        data_log.append(log_entry)
+        data_log.append(frame, kf.pos_x, kf.pos_y, kf.cov[:2, :2], distances)
 
         return *router_scatters, *router_texts, device_scatter, device_text, *router_circles, heatmap
 
@@ -362,9 +352,6 @@ def simulate_kalman_filter_live_2d():
     
     plt.show()
 
-    # Save data to CSV
-    df = pd.DataFrame(data_log)
-    csv_label = "wifi_tracking_log_simulated.csv"
-    df.to_csv(f"live_data/{csv_label}", index=False)
-    print(f"Data saved to {csv_label}")
+    data_log.close()
+    print(f"Data saved to {log_label} ({data_log.records_written} records)")
     
\ No newline at end of file
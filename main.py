@@ -1,41 +1,63 @@
 from datetime import datetime, timedelta
+from queue import Queue
 import time
 
 import numpy as np
-import pandas as pd
 
-from kf import KalmanFilter2D
+from access_point_index import AccessPointSpatialIndex
+from calibration import PathLossCalibrator
+from rssi_filter import RssiFilterBank
+from fingerprint import FingerprintLocator, synthesize_radio_map
+from kf import ACCELERATION_VARIANCE, ExtendedKalmanFilter2D, KalmanFilter2D
+from pf import ParticleFilter2D
 from kf_simulation import simulate_kalman_filter_1d, simulate_kalman_filter_2d, simulate_static_wifi_2d, simulate_kalman_filter_live_2d
+from tracker import EventDrivenTracker
+from tracking_log import TrackingLogWriter
+from trilateration import AccessPointRegistry, SIGMA_RSSI, rssi_to_distance, trilaterate_batch
 from wifi_sniffer import WifiSniffer
 
 SIMULATE = True
+EVENT_DRIVEN = True # Update on beacon arrival rather than polling every DT
+RANGE_UPDATES = False # Event driven only - update an Extended Kalman Filter from every beacon's range rather than from three access point fixes
+PARTICLE_FILTER = False # As RANGE_UPDATES with a particle filter, whose position can be multimodal near walls or with two access points
+FAST_CAPTURE = True # Kernel (BPF) filter to beacons from known access points only
+SNIFFER_LOG_EVERY = 100 # Print every n-th captured packet
+ADAPTIVE_HOPPING = True # Only hop between channels hosting known access points
+FINGERPRINTING = False # Match RSSI against a radio map of the access points instead of trilaterating
+RADIO_MAP_CELL_SIZE = 0.5
+RADIO_MAP_MARGIN = 10.0 # Space mapped around the access points (m)
+RSSI_FILTERING = True # Smooth each access point's beacon RSSI and weight its distance by the smoothed RSSI's variance
+PATH_LOSS_CALIBRATION = True # Fit each access point's reference RSSI and path loss exponent online against the filtered positions
 WIFI_INTERFACE = 'wlp3s0'
+OBSERVATION_QUEUE_SIZE = 10000
 
 DT = 0.1
 RUN_TIME_SECONDS = 100
-MAX_ACCELERATION = 1.5 # 1.5m/s² is a decent estimate of max acceleration indoors
-ACCELERATION_VARIANCE = MAX_ACCELERATION ** 2 / 3.0
 
 access_point_known_positions = {
     "84:af:ec:7b:f5:99": ([0, 0], 'SORANOZAWA'),
     "00:25:36:fb:b0:4f": ([0, 35], 'SunshineKyohei1F'),
     "74:03:bd:df:95:b0": ([20, 20], 'Buffalo-G-95BE')
 }
-
-data_log = []
-
-# Constants for RSSI to distance conversion - ML could learn accurate values or fit regression to real data
-RSSI_REF = -40  # Reference RSSI at 1m
-PATH_LOSS_EXPONENT = 3  # Typical values range from 2 to 4
-
-def get_known_access_point_info():
+access_point_registry = AccessPointRegistry(access_point_known_positions)
+access_point_index = AccessPointSpatialIndex(access_point_registry)
+
+def build_fingerprint_locator() -> FingerprintLocator:
+    # Synthesised from the path loss model, radio_map_from_log builds one from a surveyed calibration walk instead
+    (min_x, min_y), (max_x, max_y) = access_point_registry.positions.min(axis=0), access_point_registry.positions.max(axis=0)
+    return FingerprintLocator(synthesize_radio_map(access_point_registry.positions,
+                                                   min_x - RADIO_MAP_MARGIN, max_x + RADIO_MAP_MARGIN,
+                                                   min_y - RADIO_MAP_MARGIN, max_y + RADIO_MAP_MARGIN,
+                                                   RADIO_MAP_CELL_SIZE))
+
+def get_known_access_point_info(sniffer):
     found_access_points = []
     while True:
         print(f"Searching for {len(access_point_known_positions) - len(found_access_points)} remaining known access point details...")
         access_points = sniffer.get_wifi_info()
         for ap in access_points:
-            if ap in access_point_known_positions.keys() and ap not in found_access_points:
-                found_access_points.append(ap)
+            if ap['MAC Address'] in access_point_known_positions.keys() and ap['MAC Address'] not in found_access_points:
+                found_access_points.append(ap['MAC Address'])
         
         if len(access_point_known_positions) == len(found_access_points):
             print(f"Found all {len(found_access_points)} access points")
@@ -43,50 +65,25 @@ def get_known_access_point_info():
         else:
             time.sleep(1)
 
-def rssi_to_distance(rssi):
-    return 10 ** ((RSSI_REF - rssi) / (10 * PATH_LOSS_EXPONENT))
-
 def trilaterate(access_points, access_point_known_positions):
     positions = []
-    distances = []
+    rssis = []
     distances_lookup = {}
     
     for ap in access_points:
         mac = ap['MAC Address']
         if mac in access_point_known_positions:
             positions.append(access_point_known_positions[mac][0])
-            distance = rssi_to_distance(ap['Signal Level (RSSI)'])
-            distances.append(distance)
-            distances_lookup['MAC Address'] = distance
-    
-    positions = np.array(positions)
-    distances = np.array(distances)
+            rssis.append(ap['Signal Level (RSSI)'])
+            distances_lookup[mac] = rssi_to_distance(ap['Signal Level (RSSI)'])
     
     if len(positions) < 3:
         raise ValueError("At least three access points are required for 2D trilateration")
 
-    # Constructing A and b for least squares Ax = b
-    A = -2 * (positions[:-1] - positions[-1])
-    b = distances[:-1]**2 - distances[-1]**2 + np.sum(positions[-1]**2) - np.sum(positions[:-1]**2, axis=1)
-    
-    # Least squares solution - considered scipy.optimize.least_squares but this is faster for a linear solution
-    estimated_position = np.linalg.lstsq(A, b, rcond=None)[0]
-
-    # Compute Jacobian
-    J = np.array([
-        [2 * (estimated_position[0] - x), 2 * (estimated_position[1] - y)]
-        for x, y in positions
-    ])
+    # A single row of the batch solver, see trilateration.trilaterate_batch
+    estimated_positions, covs = trilaterate_batch(np.array([rssis]), np.array(positions, dtype=float))
 
-    # Measurement noise covariance (assuming small Gaussian noise on RSSI-derived distances)
-    sigma_rssi = 10  # Estimated RSSI noise in dBm
-    distance_noise = (np.log(10) / (10 * PATH_LOSS_EXPONENT)) * distances * sigma_rssi
-    R = np.diag(distance_noise ** 2)
-
-    J_inv = np.linalg.pinv(J.T @ J) @ J.T  # Pseudo-inverse of J for stability
-    cov = J_inv @ R @ J_inv.T
-
-    return estimated_position[0], estimated_position[1], cov, distances_lookup
+    return estimated_positions[0, 0], estimated_positions[0, 1], covs[0], distances_lookup
 
 if __name__ == "__main__":
     if SIMULATE:
@@ -95,46 +92,105 @@ if __name__ == "__main__":
         # simulate_static_wifi_2d()
         simulate_kalman_filter_live_2d()
     else:
-        sniffer = WifiSniffer(WIFI_INTERFACE)
+        observation_queue = Queue(maxsize=OBSERVATION_QUEUE_SIZE) if EVENT_DRIVEN else None
+        sniffer = WifiSniffer(WIFI_INTERFACE,
+                              observation_queue=observation_queue,
+                              fast_capture=FAST_CAPTURE,
+                              known_macs=access_point_registry.macs,
+                              log_every=SNIFFER_LOG_EVERY,
+                              adaptive_hopping=ADAPTIVE_HOPPING)
         get_known_access_point_info(sniffer)
 
-        current_known_access_points = [ap for ap in sniffer.access_points.values() if ap['MAC Address'] in access_point_known_positions.keys()]
-        x, y, _ = trilaterate(current_known_access_points, access_point_known_positions)
-        my_device = KalmanFilter2D(initial_x=x, 
-                                   initial_y=x, 
-                                   initial_v_x=0.0, 
-                                   initial_v_y=0.0, 
-                                   acceleration_variance=ACCELERATION_VARIANCE)
+        locate = build_fingerprint_locator().locate if FINGERPRINTING else None
+        calibrator = PathLossCalibrator(len(access_point_registry)) if PATH_LOSS_CALIBRATION else None
+        rssi_filter = RssiFilterBank(len(access_point_registry)) if RSSI_FILTERING else None
+        # Per access point rssi_ref and path_loss_exponent views, the calibrator updates them in place
+        path_loss = {} if calibrator is None else {"rssi_ref": calibrator.rssi_ref, "path_loss_exponent": calibrator.path_loss_exponent}
+        (x, y), cov = (locate or access_point_registry.trilaterate)(access_point_registry.rssi_vector(sniffer.access_points.values()))
+        distances = np.full(len(access_point_registry), np.nan)
+        if PARTICLE_FILTER:
+            kalman_filter_type = ParticleFilter2D
+        else:
+            kalman_filter_type = ExtendedKalmanFilter2D if RANGE_UPDATES else KalmanFilter2D
+        my_device = kalman_filter_type(initial_x=x, 
+                                       initial_y=y, 
+                                       initial_v_x=0.0, 
+                                       initial_v_y=0.0, 
+                                       acceleration_variance=ACCELERATION_VARIANCE)
+
+        # Records are streamed to disk as they're logged, see tracking_log.read_tracking_log to load them
+        log_label = f"wifi_tracking_log_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.bin"
+        data_log = TrackingLogWriter(f"live_data/{log_label}", access_point_registry.macs)
 
         sniffer.start_sniffing()
-        start_time = datetime.now()
-        end_time = start_time + timedelta(seconds=RUN_TIME_SECONDS)
-        last_updated = datetime.now()
-
-        while True:
-            current_known_access_points = [ap for ap in sniffer.access_points.values() if ap['MAC Address'] in access_point_known_positions.keys()]
-            # Updated within the last second (recent data) and after the last update (new data)
-            new_update_access_points = [ap for ap in current_known_access_points if 
-                                        ap['Last Updated'] > datetime.now() - timedelta(seconds=1) and
-                                        ap['Last Updated'] > last_updated]
-            
-            my_device.predict(DT)
-            if len(new_update_access_points) >= 3:
-                x, y, cov, distances = trilaterate(current_known_access_points, access_point_known_positions)
-                my_device.update([x, y], cov)
-            
-            # Log data
-            log_entry = {"timestamp": datetime.now(), "x": x, "y": y, **distances}
-            data_log.append(log_entry)
-
-            if end_time < datetime.now():
-                sniffer.stop_sniffing()
-                break
-
-            time.sleep(DT)
+
+        if EVENT_DRIVEN:
+            def log_fix(tracker):
+                (x, y), cov, rssi = tracker.last_fix
+                data_log.append(time.time(), x, y, cov, rssi_to_distance(rssi, **path_loss))
+
+            tracker = EventDrivenTracker(access_point_registry, access_point_index, my_device, observation_queue, locate=locate, calibrator=calibrator, rssi_filter=rssi_filter)
+            tracker.run(end_time=time.monotonic() + RUN_TIME_SECONDS, on_update=log_fix)
+            sniffer.stop_sniffing()
+            print(f"Sniffer saw {sniffer.packets_seen} packets ({sniffer.packets_per_second:.0f}/s), dropped {sniffer.observations_dropped} observations")
+        else:
+            start_time = datetime.now()
+            end_time = start_time + timedelta(seconds=RUN_TIME_SECONDS)
+            last_updated = time.monotonic()
+            last_tick = -np.inf
+
+            table = sniffer.access_point_table
+            records = None
+            table_to_registry = access_point_registry.indices(table.macs)
+
+            while True:
+                # Consistent copy of the sniffer's access point table, reusing the previous tick's buffer
+                records = table.snapshot(out=records)
+                if len(records) != len(table_to_registry):
+                    table_to_registry = access_point_registry.indices(table.macs[:len(records)])
+                known = table_to_registry >= 0
+                # Updated within the last second (recent data) and after the last update (new data)
+                new_update = known & (records['last_updated'] > time.monotonic() - 1) & (records['last_updated'] > last_updated)
+                
+                if rssi_filter is not None:
+                    # Each access point's latest reading since the previous tick
+                    for slot in np.flatnonzero(known & (records['last_updated'] > last_tick)):
+                        rssi_filter.update(table_to_registry[slot], float(records['rssi'][slot]), float(records['last_updated'][slot]))
+                    last_tick = records['last_updated'].max(initial=last_tick)
+
+                my_device.predict(DT)
+                if np.count_nonzero(new_update) >= 3:
+                    rssi = np.full(len(access_point_registry), np.nan)
+                    if rssi_filter is not None:
+                        rssi[table_to_registry[known]] = rssi_filter.rssi[table_to_registry[known]]
+                    else:
+                        rssi[table_to_registry[known]] = records['rssi'][known]
+                    try:
+                        if locate is not None:
+                            (x, y), cov = locate(rssi)
+                        else:
+                            # Only trilaterate against the nearby access points with the best geometry
+                            selected = access_point_index.select(my_device.mean, my_device.cov, visible=~np.isnan(rssi))
+                            rssi[np.setdiff1d(np.arange(len(rssi)), selected)] = np.nan
+                            (x, y), cov = access_point_registry.trilaterate(rssi, SIGMA_RSSI if rssi_filter is None else rssi_filter.std, **path_loss)
+                    except ValueError:
+                        # Not enough of the recent access points are in range of the current estimate, skip this tick's update
+                        pass
+                    else:
+                        distances = rssi_to_distance(rssi, **path_loss)
+                        my_device.update([x, y], cov)
+                        if calibrator is not None:
+                            calibrator.update_from_estimate(rssi, access_point_registry.positions, my_device.mean, my_device.cov)
+                        last_updated = time.monotonic()
+                
+                # Log data
+                data_log.append(time.time(), x, y, cov, distances)
+
+                if end_time < datetime.now():
+                    sniffer.stop_sniffing()
+                    break
+
+                time.sleep(DT)
         
-        # Save data to CSV
-        df = pd.DataFrame(data_log)
-        csv_label = f"wifi_tracking_log_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.csv"
-        df.to_csv(f"live_data/{csv_label}", index=False)
-        print(f"Data saved to {csv_label}")
+        data_log.close()
+        print(f"Data saved to {log_label} ({data_log.records_written} records)")
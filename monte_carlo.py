@@ -0,0 +1,137 @@
+import argparse
+import time
+from typing import NamedTuple
+
+import numpy as np
+from scipy.stats import chi2
+
+from kf import ACCELERATION_VARIANCE, KalmanFilter2D, KalmanFilterBank
+from trilateration import PATH_LOSS_EXPONENT, RSSI_REF, SIGMA_RSSI, trilaterate_batch
+
+DT = 0.1
+NUM_STEPS = 300
+MEAS_EVERY_STEPS = 10
+MIN_DISTANCE = 0.1  # Closest a device gets to an access point when generating RSSI (m)
+BURN_IN_STEPS = 50  # Steps left out of the summary while the filters converge from their initial state
+CONSISTENCY_PROBABILITY = 0.95
+
+# The routers from kf_simulation's WiFi simulations
+ACCESS_POINT_POSITIONS = np.array([[5.0, 5.0], [10.0, 35.0], [45.0, 10.0]])
+
+class Scenario(NamedTuple):
+    dt: float
+    meas_every_steps: int
+    ap_positions: np.ndarray  # (K, 2)
+    states: np.ndarray  # (num_steps, num_runs, 4) true x, y, v_x, v_y
+    rssi: np.ndarray  # (num_steps // meas_every_steps, num_runs, K) dBm, measured at steps 0, meas_every_steps, ...
+
+class MonteCarloResult(NamedTuple):
+    position_errors: np.ndarray  # (num_steps, num_runs) distance from the filtered to the true position (m)
+    nees: np.ndarray  # (num_steps, num_runs) normalised estimation error squared of the position (2 degrees of freedom)
+    fix_errors: np.ndarray  # (num_measurements, num_runs) trilateration error (m), NaN without a fix
+
+def simulate_scenario(num_runs: int,
+                      num_steps: int = NUM_STEPS,
+                      seed: int = 0,
+                      dt: float = DT,
+                      meas_every_steps: int = MEAS_EVERY_STEPS,
+                      ap_positions: np.ndarray = ACCESS_POINT_POSITIONS,
+                      acceleration_variance: float = ACCELERATION_VARIANCE,
+                      rssi_ref: float = RSSI_REF,
+                      path_loss_exponent: float = PATH_LOSS_EXPONENT,
+                      sigma_rssi: float = SIGMA_RSSI) -> Scenario:
+    # True trajectories of the Kalman filter's own motion model (white noise acceleration) inside the access points' bounding
+    # box, bouncing off its edges, and the RSSI heard from every access point on each measurement step. All runs at once
+    rng = np.random.default_rng(seed)
+    ap_positions = np.asarray(ap_positions, dtype=float)
+    low, high = ap_positions.min(axis=0), ap_positions.max(axis=0)
+
+    states = np.empty((num_steps, num_runs, 4))
+    position = rng.uniform(low, high, size=(num_runs, 2))
+    velocity = rng.normal(scale=0.5, size=(num_runs, 2))
+    accelerations = rng.normal(scale=np.sqrt(acceleration_variance), size=(num_steps, num_runs, 2))
+    for step in range(num_steps):
+        position = position + dt * velocity + 0.5 * dt**2 * accelerations[step]
+        velocity = velocity + dt * accelerations[step]
+
+        # Reflect off the edges of the box
+        for edge, outside in [(low, position < low), (high, position > high)]:
+            position = np.where(outside, 2 * edge - position, position)
+            velocity = np.where(outside, -velocity, velocity)
+        states[step, :, :2] = position
+        states[step, :, 2:] = velocity
+
+    measured = states[::meas_every_steps, :, np.newaxis, :2]
+    distances = np.maximum(np.linalg.norm(measured - ap_positions, axis=-1), MIN_DISTANCE)
+    rssi = rssi_ref - 10 * path_loss_exponent * np.log10(distances) + rng.normal(scale=sigma_rssi, size=distances.shape)
+    return Scenario(dt, meas_every_steps, ap_positions, states, rssi)
+
+def evaluate(scenario: Scenario,
+             acceleration_variance: float = ACCELERATION_VARIANCE,
+             rssi_ref: float = RSSI_REF,
+             path_loss_exponent: float = PATH_LOSS_EXPONENT,
+             sigma_rssi: float = SIGMA_RSSI,
+             cov_inflation: float = 1.0) -> MonteCarloResult:
+    # Runs a bank of Kalman filters (one per run) fed by batched trilateration with these filter parameters
+    num_steps, num_runs, _ = scenario.states.shape
+    x, y = scenario.ap_positions.mean(axis=0)
+    bank = KalmanFilterBank([KalmanFilter2D(initial_x=x, initial_y=y, initial_v_x=0.0, initial_v_y=0.0,
+                                            acceleration_variance=acceleration_variance) for _ in range(num_runs)])
+
+    position_errors = np.empty((num_steps, num_runs))
+    nees = np.empty((num_steps, num_runs))
+    fix_errors = np.full(scenario.rssi.shape[:2], np.nan)
+    for step in range(num_steps):
+        bank.predict(scenario.dt)
+        true_positions = scenario.states[step, :, :2]
+        if step % scenario.meas_every_steps == 0:
+            measurement = step // scenario.meas_every_steps
+            positions, covs = trilaterate_batch(scenario.rssi[measurement], scenario.ap_positions, rssi_ref, path_loss_exponent, sigma_rssi)
+            fixed = np.isfinite(positions).all(axis=1) & np.isfinite(covs).all(axis=(1, 2))
+            fix_errors[measurement, fixed] = np.linalg.norm(positions[fixed] - true_positions[fixed], axis=1)
+            bank.update(positions[fixed], covs[fixed] * cov_inflation, mask=fixed)
+
+        errors = bank.mean[:, :2] - true_positions
+        position_errors[step] = np.linalg.norm(errors, axis=1)
+        nees[step] = np.einsum('ni,ni->n', errors, np.linalg.solve(bank.cov[:, :2, :2], errors[:, :, np.newaxis])[:, :, 0])
+    return MonteCarloResult(position_errors, nees, fix_errors)
+
+def summarize(result: MonteCarloResult, burn_in_steps: int = BURN_IN_STEPS) -> dict:
+    # RMSE (and the median error, less swayed by the heavy tailed fixes) of the filter and of the raw fixes, average NEES
+    # (2 for a consistent filter) and the fraction of steps whose average NEES over the runs lies inside its two sided
+    # CONSISTENCY_PROBABILITY chi-squared interval
+    position_errors = result.position_errors[burn_in_steps:]
+    nees = result.nees[burn_in_steps:]
+    num_runs = nees.shape[1]
+    tail = (1 - CONSISTENCY_PROBABILITY) / 2
+    low, high = chi2.ppf([tail, 1 - tail], df=2 * num_runs) / num_runs
+    average_nees = nees.mean(axis=1)
+    return {
+        "rmse": float(np.sqrt(np.mean(position_errors ** 2))),
+        "fix_rmse": float(np.sqrt(np.nanmean(result.fix_errors ** 2))),
+        "median_error": float(np.median(position_errors)),
+        "fix_median_error": float(np.nanmedian(result.fix_errors)),
+        "fix_rate": float(np.mean(np.isfinite(result.fix_errors))),
+        "anees": float(average_nees.mean()),
+        "consistent_fraction": float(np.mean((low <= average_nees) & (average_nees <= high))),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo accuracy of trilateration + Kalman filter tracking")
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=NUM_STEPS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--acceleration-variance", type=float, default=ACCELERATION_VARIANCE, help="Filter's acceleration variance")
+    parser.add_argument("--rssi-ref", type=float, default=RSSI_REF, help="Filter's reference RSSI at 1m")
+    parser.add_argument("--path-loss-exponent", type=float, default=PATH_LOSS_EXPONENT, help="Filter's path loss exponent")
+    parser.add_argument("--sigma-rssi", type=float, default=SIGMA_RSSI, help="Filter's RSSI noise (dBm)")
+    parser.add_argument("--cov-inflation", type=float, default=1.0, help="Factor the trilateration covariance is scaled by")
+    parser.add_argument("--true-sigma-rssi", type=float, default=SIGMA_RSSI, help="RSSI noise the scenario is generated with (dBm)")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    scenario = simulate_scenario(args.runs, args.steps, seed=args.seed, sigma_rssi=args.true_sigma_rssi)
+    result = evaluate(scenario, args.acceleration_variance, args.rssi_ref, args.path_loss_exponent, args.sigma_rssi, args.cov_inflation)
+    print(f"{args.runs} runs of {args.steps} steps in {time.monotonic() - start:.1f}s")
+    for name, value in summarize(result).items():
+        print(f"{name:>20}: {value:.3f}")
@@ -0,0 +1,187 @@
+import math
+
+import numpy as np
+
+from trilateration import PATH_LOSS_EXPONENT, RSSI_REF, SIGMA_RSSI
+
+MAX_PARTICLES = 10_000
+MIN_PARTICLES = 500
+INITIAL_STD = 10.0  # Spread of the initial particles, as the Kalman filters' initial P = 100I
+RESAMPLE_THRESHOLD = 0.5  # Resample once the effective sample size drops below this fraction of the particles
+ROUGHENING = 0.2  # Jitter added after resampling, as a fraction of each state's spread scaled by P^(-1/4), so duplicated particles spread out
+
+# KLD sampling - enough particles that the KL divergence between the sampled and true posterior is below KLD_EPSILON with
+# probability 0.99 (KLD_Z is its standard normal quantile), measured over position bins of KLD_BIN_SIZE
+KLD_EPSILON = 0.05
+KLD_Z = 2.326
+KLD_BIN_SIZE = 0.5  # (m)
+
+class ParticleFilter2D:
+    def __init__(self, initial_x: float,
+                       initial_y: float,
+                       initial_v_x: float,
+                       initial_v_y: float,
+                       acceleration_variance: float,
+                       max_particles: int = MAX_PARTICLES,
+                       min_particles: int = MIN_PARTICLES,
+                       initial_std: float = INITIAL_STD,
+                       seed: int | None = None) -> None:
+        # Same constant velocity white noise acceleration model and surface as KalmanFilter2D, but the posterior is a cloud of
+        # weighted particles so it can be multimodal (e.g. either side of a wall, or the two intersections of two ranges)
+        self.iX = 0
+        self.iY = 1
+        self.iV_X = 2
+        self.iV_Y = 3
+
+        self._rng = np.random.default_rng(seed)
+        self._acceleration_std = math.sqrt(acceleration_variance)
+        self._max_particles = max_particles
+        self._min_particles = min(min_particles, max_particles)
+
+        # (P, 4) x, y, v_x, v_y particles and their normalised weights
+        initial = np.array([initial_x, initial_y, initial_v_x, initial_v_y], dtype=np.float32)
+        self._particles = initial + self._rng.normal(scale=initial_std, size=(max_particles, 4)).astype(np.float32)
+        self._weights = np.full(max_particles, 1.0 / max_particles)
+
+    def __len__(self) -> int:
+        return len(self._particles)
+
+    def predict(self, dt: float) -> None:
+        # x += v dt + a dt²/2, v += a dt for a random acceleration per particle
+        acceleration = self._rng.standard_normal(size=(len(self._particles), 2), dtype=np.float32)
+        acceleration *= np.float32(self._acceleration_std)
+        positions = self._particles[:, :2]
+        velocities = self._particles[:, 2:]
+        positions += np.float32(dt) * velocities
+        positions += np.float32(0.5 * dt**2) * acceleration
+        velocities += np.float32(dt) * acceleration
+
+    def update(self, meas_value: np.ndarray, meas_variance: np.ndarray) -> None:
+        # Gaussian position fix, as KalmanFilter2D.update
+        z = np.asarray(meas_value, dtype=float).reshape(2)
+        R = np.asarray(meas_variance, dtype=float).reshape(2, 2)
+        determinant = R[0, 0] * R[1, 1] - R[0, 1] * R[1, 0]
+        if not determinant > 0:
+            return
+        # Mahalanobis distance from the closed form 2x2 inverse
+        dx = self._particles[:, self.iX] - np.float32(z[0])
+        dy = self._particles[:, self.iY] - np.float32(z[1])
+        inverse_xx, inverse_yy = R[1, 1] / determinant, R[0, 0] / determinant
+        inverse_xy = -(R[0, 1] + R[1, 0]) / (2 * determinant)
+        self._reweight(-0.5 * (inverse_xx * dx ** 2 + 2 * inverse_xy * dx * dy + inverse_yy * dy ** 2))
+
+    def update_range(self, ap_position: np.ndarray, distance: float, distance_variance: float) -> bool:
+        # Range to a single access point, as ExtendedKalmanFilter2D.update_range but without linearising (so never skipped)
+        ranges = np.hypot(self._particles[:, self.iX] - np.float32(ap_position[0]), self._particles[:, self.iY] - np.float32(ap_position[1]))
+        self._reweight(-0.5 * (ranges - np.float32(distance)) ** 2 / distance_variance)
+        return True
+
+    def update_rssi(self, rssi: np.ndarray, ap_positions: np.ndarray,
+                          rssi_ref=RSSI_REF,
+                          path_loss_exponent=PATH_LOSS_EXPONENT,
+                          sigma_rssi=SIGMA_RSSI) -> None:
+        # (K, ) RSSI of the access points at ap_positions (K, 2), NaN where not heard. Each particle's likelihood is taken over
+        # every heard access point at once in the RSSI domain, where the noise is Gaussian. rssi_ref, path_loss_exponent and
+        # sigma_rssi can be per AP (K, )
+        rssi = np.asarray(rssi, dtype=float)
+        heard = np.flatnonzero(~np.isnan(rssi))
+        if len(heard) == 0:
+            return
+        ap_positions = np.asarray(ap_positions, dtype=np.float32)[heard]
+        rssi_ref, path_loss_exponent, sigma_rssi = (np.broadcast_to(np.asarray(value, dtype=np.float32), rssi.shape)[heard]
+                                                    for value in (rssi_ref, path_loss_exponent, sigma_rssi))
+
+        # (P, K) expected RSSI, log10 of the squared distance halves the work of a square root
+        squared_distances = np.square(self._particles[:, self.iX, np.newaxis] - ap_positions[:, 0])
+        squared_distances += np.square(self._particles[:, self.iY, np.newaxis] - ap_positions[:, 1])
+        np.maximum(squared_distances, np.float32(1e-2), out=squared_distances)
+        residuals = np.log10(squared_distances, out=squared_distances)
+        residuals *= -5 * path_loss_exponent
+        residuals += rssi_ref - rssi[heard].astype(np.float32)
+        residuals /= sigma_rssi
+        self._reweight(-0.5 * np.einsum('pk,pk->p', residuals, residuals))
+
+    def _reweight(self, log_likelihood: np.ndarray) -> None:
+        # Weights are kept normalised, the likelihood is shifted by its max so exp doesn't underflow for every particle
+        log_likelihood = log_likelihood.astype(float)
+        log_likelihood -= log_likelihood.max()
+        self._weights *= np.exp(log_likelihood)
+        total = self._weights.sum()
+        if not total > 0:
+            # Every particle is incompatible with the measurement, keep the prior rather than collapse
+            self._weights[:] = 1.0 / len(self._weights)
+            return
+        self._weights /= total
+
+        effective_sample_size = 1.0 / np.dot(self._weights, self._weights)
+        if effective_sample_size < RESAMPLE_THRESHOLD * len(self._weights):
+            self._resample()
+
+    def _resample(self) -> None:
+        # Systematic resampling of max_particles draws in a random order, then KLD sampling keeps only as many as the number of
+        # position bins they occupy calls for
+        positions = (self._rng.random() + np.arange(self._max_particles)) / self._max_particles
+        cumulative = np.cumsum(self._weights)
+        cumulative[-1] = 1.0
+        indices = np.searchsorted(cumulative, positions)
+        indices = indices[self._rng.permutation(self._max_particles)]
+
+        num_particles = self._kld_particles(self._particles[indices, :2])
+        particles = self._particles[indices[:num_particles]]
+        spread = (particles.max(axis=0) - particles.min(axis=0)) * np.float32(ROUGHENING * num_particles ** -0.25)
+        particles += self._rng.standard_normal(size=particles.shape, dtype=np.float32) * spread
+        self._particles = particles
+        self._weights = np.full(num_particles, 1.0 / num_particles)
+
+    def _kld_particles(self, positions: np.ndarray) -> int:
+        # Smallest n where the first n draws satisfy n >= (k - 1) / 2e (1 - 2/9(k - 1) + sqrt(2/9(k - 1)) z)³ for the k bins
+        # they occupy, the KLD sampling bound evaluated for every n at once
+        # Each (x, y) bin as one integer, a 1D unique is far quicker than a row-wise one
+        bins = np.floor(positions / np.float32(KLD_BIN_SIZE)).astype(np.int64)
+        bins = (bins[:, 0] << 32) + bins[:, 1]
+        _, first_draws = np.unique(bins, return_index=True)
+        n = np.arange(1, len(positions) + 1)
+        k = np.searchsorted(np.sort(first_draws), n)  # Bins occupied by the first n draws
+        a = 2.0 / (9.0 * np.maximum(k - 1, 1))
+        required = (k - 1) / (2 * KLD_EPSILON) * (1 - a + np.sqrt(a) * KLD_Z) ** 3
+        enough = np.flatnonzero((n >= required) & (n >= self._min_particles))
+        return int(n[enough[0]]) if len(enough) else len(positions)
+
+    @property
+    def particles(self) -> np.ndarray:
+        return self._particles
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self._weights
+
+    @property
+    def history_size(self) -> int:
+        # Late measurements can't be retrodicted, see BaseKalmanFilter.update_delayed
+        return 0
+
+    # Weighted moments of the particles, as KalmanFilter2D.mean and cov (a multimodal posterior's mean can lie between modes)
+    @property
+    def mean(self) -> np.ndarray:
+        return self._weights.dot(self._particles.astype(float))
+
+    @property
+    def cov(self) -> np.ndarray:
+        offsets = self._particles.astype(float) - self.mean
+        return (offsets * self._weights[:, np.newaxis]).T.dot(offsets)
+
+    @property
+    def pos_x(self) -> float:
+        return self.mean[self.iX]
+
+    @property
+    def pos_y(self) -> float:
+        return self.mean[self.iY]
+
+    @property
+    def vel_x(self) -> float:
+        return self.mean[self.iV_X]
+
+    @property
+    def vel_y(self) -> float:
+        return self.mean[self.iV_Y]
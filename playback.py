@@ -0,0 +1,177 @@
+import argparse
+import itertools
+import shutil
+import subprocess
+import time
+from typing import Callable, Iterator
+
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+import matplotlib.animation as animation
+
+from density import GaussianHeatmap
+from kf_simulation import plot_router
+from tracking_log import read_tracking_log, tracking_log_dtype
+
+CSV_POSITION_VARIANCE = 1.0  # CSV logs have no covariance, each fix is drawn with this variance (m²)
+EXTENT_MARGIN = 5.0  # Space left around the positions and access points when the extent isn't given (m)
+
+def load_log(path: str) -> tuple[np.ndarray, list[str]]:
+    # Tracking log records (memory mapped for binary logs), CSV logs are converted to the same layout
+    if not path.endswith(".csv"):
+        return read_tracking_log(path)
+
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    access_points = [column for column in df.columns if column not in ("timestamp", "x", "y")]
+    records = np.zeros(len(df), dtype=tracking_log_dtype(len(access_points)))
+    timestamps = df["timestamp"]
+    if timestamps.dtype == object:
+        # datetime.now() strings from the original live logs
+        timestamps = pd.to_datetime(timestamps).astype('int64') / 1e9
+    records['timestamp'] = timestamps
+    records['x'] = df["x"]
+    records['y'] = df["y"]
+    records['cov'] = np.eye(2) * CSV_POSITION_VARIANCE
+    records['distances'] = df[access_points].to_numpy(dtype=np.float32)
+    return records, access_points
+
+def log_extent(records: np.ndarray, access_point_positions: np.ndarray) -> tuple[float, float, float, float]:
+    xs = np.concatenate([records['x'], access_point_positions[:, 0]])
+    ys = np.concatenate([records['y'], access_point_positions[:, 1]])
+    return np.nanmin(xs) - EXTENT_MARGIN, np.nanmax(xs) + EXTENT_MARGIN, np.nanmin(ys) - EXTENT_MARGIN, np.nanmax(ys) + EXTENT_MARGIN
+
+def render_frames(fig, animated_artists: list, update: Callable[[int], object], num_frames: int) -> Iterator[np.ndarray]:
+    # RGB frames drawn headless - the static parts of the figure (axes, ticks, colour bar, routers) are drawn once and only the
+    # artists that change are drawn over them each frame
+    for artist in animated_artists:
+        artist.set_animated(True)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    for frame in range(num_frames):
+        update(frame)
+        fig.canvas.restore_region(background)
+        for artist in animated_artists:
+            fig.draw_artist(artist)
+        yield np.asarray(fig.canvas.buffer_rgba())[..., :3]
+
+def save_frames(frames: Iterator[np.ndarray], output: str, fps: float) -> int:
+    # Streams the frames through ffmpeg (.mp4 or .gif), Pillow is the fallback for GIFs but holds every frame until the end
+    first = next(frames, None)
+    if first is None:
+        return 0
+    height, width, _ = first.shape
+
+    if shutil.which("ffmpeg") is None:
+        if not output.endswith(".gif"):
+            raise RuntimeError(f"ffmpeg is needed to render {output}")
+        from PIL import Image
+
+        # Every frame shares the first frame's palette, far quicker than quantizing each one from scratch
+        palette = Image.fromarray(first).quantize()
+        images = [Image.fromarray(frame).quantize(palette=palette, dither=Image.Dither.NONE) for frame in itertools.chain([first], frames)]
+        images[0].save(output, save_all=True, append_images=images[1:], duration=1000 / fps, loop=0)
+        return len(images)
+
+    command = ['ffmpeg', '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{width}x{height}", '-r', str(fps), '-i', '-']
+    if output.endswith(".mp4"):
+        # H.264 needs even dimensions
+        command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-vcodec', 'libx264', '-pix_fmt', 'yuv420p']
+    process = subprocess.Popen(command + [output], stdin=subprocess.PIPE)
+    num_frames = 0
+    for frame in itertools.chain([first], frames):
+        process.stdin.write(frame.tobytes())
+        num_frames += 1
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to render {output}")
+    return num_frames
+
+def playback(path: str, access_point_positions: dict,
+             skip: int = 1,
+             fps: float = 10.0,
+             output: str | None = None,
+             granularity: int = 300,
+             extent: tuple[float, float, float, float] | None = None) -> None:
+    # Animates every `skip`-th record of a log, shown live or saved to a GIF/MP4 when `output` is given
+    records, access_points = load_log(path)
+    frames = records[::skip]
+    # Access points in the log with a known position, (log column, position, label)
+    routers = [(i, np.array(access_point_positions[access_point], dtype=float), access_point)
+               for i, access_point in enumerate(access_points) if access_point in access_point_positions]
+    if extent is None:
+        extent = log_extent(frames, np.array([position for _, position, _ in routers]).reshape(-1, 2))
+    min_x, max_x, min_y, max_y = extent
+    heatmap = GaussianHeatmap(min_x, max_x, min_y, max_y, granularity)
+
+    fig, ax = plt.subplots(figsize=(11.5, 6.5), dpi=110)
+    label_space_x = (max_x - min_x) / 100.0
+    label_space_y = (max_y - min_y) / 100.0
+
+    router_artists = []
+    router_circles = []
+    for _, position, label in routers:
+        router_artists.extend(plot_router(ax, position[0], position[1], label_space_x, label_space_y, label))
+        router_circle = patches.Circle(position, radius=0, color='red', fill=False)
+        ax.add_patch(router_circle)
+        router_circles.append(router_circle)
+
+    image = ax.imshow(heatmap.grid, extent=heatmap.extent, origin='lower', cmap='plasma', alpha=0.7, vmin=0.0, vmax=1.0)
+    plt.colorbar(image, label='Probability Density')
+    device_scatter = ax.scatter([], [], color='black', s=20)
+    time_text = ax.text(0.01, 0.99, "", transform=ax.transAxes, va='top', fontsize=12,
+                        bbox=dict(facecolor='white', edgecolor='white', boxstyle='round,pad=0.1'))
+    ax.set_xlim(min_x, max_x)
+    ax.set_ylim(min_y, max_y)
+
+    start_timestamp = frames['timestamp'][0] if len(frames) else 0.0
+
+    def update(frame):
+        record = frames[frame]
+        mean = np.array([record['x'], record['y']])
+        if np.isfinite(mean).all():
+            image.set_data(heatmap.render(mean, record['cov']))
+            device_scatter.set_offsets([mean])
+        for circle, (column, _, _) in zip(router_circles, routers):
+            distance = record['distances'][column]
+            circle.set_radius(0 if np.isnan(distance) else distance)
+        time_text.set_text(f"t = {record['timestamp'] - start_timestamp:.1f}s")
+        # Drawing order when blitting, the routers stay on top of the heatmap
+        return image, *router_circles, *router_artists, device_scatter, time_text
+
+    plt.xlabel('X Position')
+    plt.ylabel('Y Position')
+    plt.title('WiFi Live Real Data Playback')
+
+    if output is None:
+        ani = animation.FuncAnimation(fig, update, frames=len(frames), interval=1000 / fps, blit=True, repeat=False)
+        plt.show()
+        return
+
+    start = time.monotonic()
+    animated_artists = [image, *router_circles, *router_artists, device_scatter, time_text]
+    num_frames = save_frames(render_frames(fig, animated_artists, update, len(frames)), output, fps)
+    print(f"Saved {num_frames} frames to {output} in {time.monotonic() - start:.1f}s")
+    plt.close(fig)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play back a recorded tracking log (live_data/*.bin or *.csv)")
+    parser.add_argument("path")
+    parser.add_argument("--skip", type=int, default=1, help="Only draw every n-th record")
+    parser.add_argument("--fps", type=float, default=10.0)
+    parser.add_argument("--output", default=None, help="Render headless to a .gif or .mp4 instead of showing a window")
+    parser.add_argument("--granularity", type=int, default=300, help="Heatmap cells along each axis")
+    parser.add_argument("--extent", type=float, nargs=4, default=None, metavar=("MIN_X", "MAX_X", "MIN_Y", "MAX_Y"))
+    args = parser.parse_args()
+
+    if args.output is not None:
+        matplotlib.use("Agg")
+
+    from main import access_point_known_positions
+
+    access_point_positions = {mac: position for mac, (position, _) in access_point_known_positions.items()}
+    playback(args.path, access_point_positions, args.skip, args.fps, args.output, args.granularity, args.extent)
@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+
+from trilateration import SIGMA_RSSI
+
+RSSI_DRIFT_RATE = 4.0  # Variance the true RSSI random walks by per second as the device moves (dBm²/s)
+NOISE_SMOOTHING = 0.05  # EWMA weight of each innovation in the per AP noise estimate
+MIN_NOISE_VARIANCE = 1.0  # Beacon RSSI is reported in whole dBm (dBm²)
+SHADOWING_STD = 3.0  # Walls and furniture bias an AP's RSSI at a position, which no amount of smoothing removes (dBm)
+
+class RssiFilterBank:
+    def __init__(self, num_access_points: int,
+                       drift_rate: float = RSSI_DRIFT_RATE,
+                       initial_noise_variance: float = SIGMA_RSSI ** 2,
+                       shadowing_std: float = SHADOWING_STD) -> None:
+        # A scalar Kalman filter (random walk model) per access point smoothing the raw beacon RSSI, with each AP's measurement
+        # noise estimated online from its innovations. State is preallocated (K, ) arrays indexed by registry index
+        self._rssi = np.full(num_access_points, np.nan)
+        self._variance = np.full(num_access_points, np.inf)
+        self._time = np.full(num_access_points, -np.inf)
+        self._noise_variance = np.full(num_access_points, float(initial_noise_variance))
+        self._innovation_variance = np.full(num_access_points, np.nan)
+        self._drift_rate = drift_rate
+        self._shadowing_variance = shadowing_std ** 2
+
+    def __len__(self) -> int:
+        return len(self._rssi)
+
+    @property
+    def rssi(self) -> np.ndarray:
+        # (K, ) smoothed RSSI, NaN until an access point is first heard
+        return self._rssi
+
+    @property
+    def noise_std(self) -> np.ndarray:
+        # (K, ) estimated raw beacon RSSI noise per access point
+        return np.sqrt(self._noise_variance)
+
+    @property
+    def std(self) -> np.ndarray:
+        # (K, ) uncertainty of each smoothed RSSI as an RSSI-derived distance sees it, usable as trilateration's sigma_rssi
+        return np.sqrt(self._variance + self._shadowing_variance)
+
+    def update(self, index: int, rssi: float, timestamp: float) -> float:
+        # Filters one beacon's RSSI into access point `index` and returns its smoothed RSSI. Timestamps per AP must not go
+        # backwards (late readings are the caller's to drop). Scalar maths only, it runs for every beacon
+        noise_variance = self._noise_variance[index]
+        if math.isnan(self._rssi[index]):
+            self._rssi[index] = rssi
+            self._variance[index] = noise_variance
+            self._time[index] = timestamp
+            return rssi
+
+        # Predict: x stays, P += q dt
+        prior = self._rssi[index]
+        prior_variance = self._variance[index] + self._drift_rate * max(0.0, timestamp - self._time[index])
+
+        # Measurement noise from the innovations, E[y²] = P + R
+        innovation = rssi - prior
+        innovation_variance = self._innovation_variance[index]
+        if math.isnan(innovation_variance):
+            innovation_variance = innovation * innovation
+        else:
+            innovation_variance += NOISE_SMOOTHING * (innovation * innovation - innovation_variance)
+        self._innovation_variance[index] = innovation_variance
+        noise_variance = max(MIN_NOISE_VARIANCE, innovation_variance - prior_variance)
+        self._noise_variance[index] = noise_variance
+
+        gain = prior_variance / (prior_variance + noise_variance)
+        smoothed = prior + gain * innovation
+        self._rssi[index] = smoothed
+        self._variance[index] = (1 - gain) * prior_variance
+        self._time[index] = timestamp
+        return smoothed
@@ -0,0 +1,111 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from kf import MAX_ACCELERATION
+from monte_carlo import Scenario, evaluate, simulate_scenario, summarize
+from trilateration import PATH_LOSS_EXPONENT, RSSI_REF, SIGMA_RSSI
+
+# Filter parameters a sweep can vary, with the values the code currently uses
+DEFAULT_PARAMETERS = {
+    "max_acceleration": MAX_ACCELERATION,
+    "rssi_ref": RSSI_REF,
+    "path_loss_exponent": PATH_LOSS_EXPONENT,
+    "sigma_rssi": SIGMA_RSSI,
+    "cov_inflation": 10.0,  # simulate_kalman_filter_live_2d's cov * 10
+}
+
+# Scenario arrays live in shared memory, workers map them read-only instead of each being sent a pickled copy
+_scenario = None
+_shared_memory = []
+
+def _share(array: np.ndarray) -> tuple[SharedMemory, tuple]:
+    shared_memory = SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shared_memory.buf)[...] = array
+    return shared_memory, (shared_memory.name, array.shape, array.dtype.str)
+
+def _attach(name: str, shape: tuple, dtype: str) -> np.ndarray:
+    # The pool's workers share the parent's resource tracker, so the parent alone unlinks the block once the sweep is done
+    shared_memory = SharedMemory(name=name)
+    _shared_memory.append(shared_memory)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shared_memory.buf)
+    array.setflags(write=False)
+    return array
+
+def _init_worker(dt: float, meas_every_steps: int, ap_positions: np.ndarray, states: tuple, rssi: tuple) -> None:
+    global _scenario
+    _scenario = Scenario(dt, meas_every_steps, ap_positions, _attach(*states), _attach(*rssi))
+
+def _evaluate_task(parameters: dict) -> dict:
+    result = evaluate(_scenario,
+                      acceleration_variance=parameters["max_acceleration"] ** 2 / 3.0,
+                      rssi_ref=parameters["rssi_ref"],
+                      path_loss_exponent=parameters["path_loss_exponent"],
+                      sigma_rssi=parameters["sigma_rssi"],
+                      cov_inflation=parameters["cov_inflation"])
+    return {**parameters, **summarize(result)}
+
+def grid_search(values: dict) -> list[dict]:
+    # Every combination of the given values, the defaults for parameters not given
+    names = list(values)
+    return [{**DEFAULT_PARAMETERS, **dict(zip(names, combination))} for combination in itertools.product(*values.values())]
+
+def random_search(ranges: dict, num_samples: int, seed: int = 0) -> list[dict]:
+    # Each sample is drawn uniformly within the (low, high) ranges from its own child seed, so sample i is the same however
+    # many samples are drawn
+    samples = []
+    for sample_seed in np.random.SeedSequence(seed).spawn(num_samples):
+        rng = np.random.default_rng(sample_seed)
+        samples.append({**DEFAULT_PARAMETERS, **{name: float(rng.uniform(low, high)) for name, (low, high) in ranges.items()}})
+    return samples
+
+def run_sweep(scenario: Scenario, parameter_sets: list[dict], max_workers: int | None = None) -> pd.DataFrame:
+    # Evaluates every parameter set against the same scenario across a process pool, one row per parameter set
+    max_workers = max_workers or os.cpu_count()
+    shared = [_share(scenario.states), _share(scenario.rssi)]
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_worker,
+                                 initargs=(scenario.dt, scenario.meas_every_steps, scenario.ap_positions, *(spec for _, spec in shared))) as executor:
+            chunksize = max(1, len(parameter_sets) // (4 * max_workers))
+            rows = list(executor.map(_evaluate_task, parameter_sets, chunksize=chunksize))
+    finally:
+        for shared_memory, _ in shared:
+            shared_memory.close()
+            shared_memory.unlink()
+    return pd.DataFrame(rows)
+
+def _values(text: str) -> list[float]:
+    return [float(value) for value in text.split(",")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep the filter parameters over a Monte Carlo scenario on every core")
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--true-sigma-rssi", type=float, default=SIGMA_RSSI, help="RSSI noise the scenario is generated with (dBm)")
+    parser.add_argument("--random", type=int, default=None, help="Draw this many random samples within the min,max of each list instead of the full grid")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="sweep_results.csv")
+    for name, default in DEFAULT_PARAMETERS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=_values, default=[default], help="Comma separated values")
+    args = parser.parse_args()
+
+    values = {name: getattr(args, name) for name in DEFAULT_PARAMETERS}
+    if args.random is None:
+        parameter_sets = grid_search(values)
+    else:
+        parameter_sets = random_search({name: (min(v), max(v)) for name, v in values.items()}, args.random, seed=args.seed)
+
+    start = time.monotonic()
+    scenario = simulate_scenario(args.runs, args.steps, seed=args.seed, sigma_rssi=args.true_sigma_rssi)
+    results = run_sweep(scenario, parameter_sets, args.workers)
+    results.to_csv(args.output, index=False)
+    print(f"Evaluated {len(results)} parameter sets in {time.monotonic() - start:.1f}s, results saved to {args.output}")
+    print(results.sort_values("rmse").head(10).to_string(index=False))
@@ -0,0 +1,63 @@
+from threading import Thread
+
+from access_point_table import AccessPointTable
+import numpy as np
+
+import unittest
+
+class TestAccessPointTable(unittest.TestCase):
+    def test_add_and_update(self):
+        table = AccessPointTable()
+        slot = table.add("aa:aa:aa:aa:aa:01", "AP 1", 2412, -50.0, timestamp=1.0)
+        table.update(slot, -55.0, timestamp=2.0)
+
+        records = table.snapshot()
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table.slot("aa:aa:aa:aa:aa:01"), slot)
+        self.assertEqual(records['rssi'][slot], -55.0)
+        self.assertEqual(records['frequency'][slot], 2412)
+        self.assertEqual(records['last_updated'][slot], 2.0)
+        self.assertEqual(records['updates'][slot], 2)
+
+    def test_grows_past_initial_capacity(self):
+        table = AccessPointTable(capacity=2)
+        for i in range(5):
+            table.add(f"aa:aa:aa:aa:aa:{i:02x}", f"AP {i}", 2412, -50.0 - i)
+
+        self.assertEqual(len(table), 5)
+        self.assertTrue(np.array_equal(table.snapshot()['rssi'], [-50, -51, -52, -53, -54]))
+
+    def test_snapshot_reuses_buffer(self):
+        table = AccessPointTable()
+        table.add("aa:aa:aa:aa:aa:01", "AP 1", 2412, -50.0)
+        records = table.snapshot()
+        again = table.snapshot(out=records)
+
+        self.assertTrue(np.shares_memory(records, again))
+
+    def test_as_dicts_matches_original_layout(self):
+        table = AccessPointTable()
+        table.add("aa:aa:aa:aa:aa:01", "AP 1", 5180, -61.0)
+        ap = table.as_dicts()["aa:aa:aa:aa:aa:01"]
+
+        self.assertEqual(set(ap.keys()), {'MAC Address', 'Frequency', 'Signal Level (RSSI)', 'SSID', 'Last Updated'})
+        self.assertEqual(ap['SSID'], "AP 1")
+
+    def test_snapshots_are_consistent_under_concurrent_writes(self):
+        table = AccessPointTable(capacity=4)
+        slot = table.add("aa:aa:aa:aa:aa:01", "AP 1", 2412, 0.0, timestamp=0.0)
+
+        def writer():
+            # RSSI and timestamp are always written as a matching pair
+            for i in range(1, 20000):
+                table.update(slot, -float(i % 100), timestamp=float(i % 100))
+                if i % 1000 == 0:
+                    table.add(f"bb:bb:bb:bb:bb:{i // 1000:02x}", "Other", 2437, -70.0)
+
+        thread = Thread(target=writer)
+        thread.start()
+        records = None
+        while thread.is_alive():
+            records = table.snapshot(out=records)
+            self.assertEqual(records['rssi'][slot], -records['last_updated'][slot])
+        thread.join()
@@ -0,0 +1,74 @@
+from calibration import INITIAL_VARIANCE, PathLossCalibrator
+from trilateration import PATH_LOSS_EXPONENT, RSSI_REF, rssi_to_distance
+import numpy as np
+
+import unittest
+
+class TestPathLossCalibrator(unittest.TestCase):
+    def test_starts_at_defaults(self):
+        calibrator = PathLossCalibrator(3)
+
+        self.assertTrue(np.array_equal(calibrator.rssi_ref, np.full(3, RSSI_REF)))
+        self.assertTrue(np.array_equal(calibrator.path_loss_exponent, np.full(3, PATH_LOSS_EXPONENT)))
+        self.assertTrue(np.allclose(calibrator.rssi_to_distance([-70.0, -70.0, np.nan])[:2], rssi_to_distance(-70.0)))
+
+    def test_converges_to_each_access_points_parameters(self):
+        rssi_ref = np.array([-35.0, -45.0, -40.0])
+        path_loss_exponent = np.array([2.2, 3.5, 4.0])
+        calibrator = PathLossCalibrator(3)
+        rng = np.random.default_rng(0)
+
+        for _ in range(3000):
+            distances = rng.uniform(1, 40, size=3)
+            rssi = rssi_ref - 10 * path_loss_exponent * np.log10(distances) + rng.normal(scale=2.0, size=3)
+            calibrator.update(rssi, distances)
+
+        self.assertTrue(np.allclose(calibrator.rssi_ref, rssi_ref, atol=1.0))
+        self.assertTrue(np.allclose(calibrator.path_loss_exponent, path_loss_exponent, atol=0.1))
+        self.assertTrue(np.array_equal(calibrator.observations, [3000, 3000, 3000]))
+
+    def test_long_stationary_run_does_not_wind_up(self):
+        # Every observation at one distance leaves the fit's other direction unobserved, one new distance mustn't swing it any
+        # further than it would a fresh calibrator
+        calibrator = PathLossCalibrator(1)
+        rng = np.random.default_rng(0)
+        for _ in range(20000):
+            calibrator.update([RSSI_REF - 10 * PATH_LOSS_EXPONENT + rng.normal(scale=2.0)], [10.0])
+        self.assertLessEqual(calibrator._P00[0] + calibrator._P11[0], 1.1 * INITIAL_VARIANCE + 1e-9)
+
+        rssi = [RSSI_REF - 10 * PATH_LOSS_EXPONENT * np.log10(3.0) - 6.0]
+        fresh = PathLossCalibrator(1)
+        fresh.update(rssi, [3.0])
+        rssi_ref = calibrator.rssi_ref[0]
+        calibrator.update(rssi, [3.0])
+
+        self.assertLess(abs(calibrator.rssi_ref[0] - rssi_ref), 1.5 * abs(fresh.rssi_ref[0] - RSSI_REF))
+        self.assertGreater(calibrator.path_loss_exponent[0], 2.0)
+
+    def test_covariance_cap_follows_the_prior(self):
+        # A wider prior is capped at its own trace, the first observation isn't cut back to the default's
+        calibrator = PathLossCalibrator(1, initial_variance=100.0)
+        calibrator.update([-60.0], [10.0])
+        fresh = PathLossCalibrator(1, initial_variance=100.0, forgetting_factor=1.0)
+        fresh.update([-60.0], [10.0])
+
+        self.assertGreater(calibrator._P00[0] + calibrator._P11[0], 1.1 * INITIAL_VARIANCE)
+        self.assertLessEqual(calibrator._P00[0] + calibrator._P11[0], 110.0 + 1e-9)
+        self.assertAlmostEqual(calibrator.rssi_ref[0], fresh.rssi_ref[0], delta=0.01)
+
+    def test_skips_unheard_and_too_close_access_points(self):
+        calibrator = PathLossCalibrator(3)
+
+        self.assertEqual(calibrator.update([-60.0, np.nan, -30.0], [10.0, 10.0, 0.5]), 1)
+        self.assertTrue(np.array_equal(calibrator.observations, [1, 0, 0]))
+        self.assertEqual(calibrator.rssi_ref[1], RSSI_REF)
+        self.assertNotEqual(calibrator.rssi_ref[0], RSSI_REF)
+
+    def test_update_from_estimate_waits_for_a_confident_position(self):
+        calibrator = PathLossCalibrator(2)
+        ap_positions = np.array([[0.0, 0.0], [10.0, 0.0]])
+        mean = np.array([3.0, 4.0, 0.0, 0.0])
+
+        self.assertEqual(calibrator.update_from_estimate([-60.0, -65.0], ap_positions, mean, np.eye(4) * 100), 0)
+        self.assertEqual(calibrator.update_from_estimate([-60.0, -65.0], ap_positions, mean, np.eye(4)), 2)
+        self.assertTrue(np.array_equal(calibrator.observations, [1, 1]))
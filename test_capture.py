@@ -0,0 +1,111 @@
+import os
+import tempfile
+from unittest import mock
+
+from scapy.all import RadioTap, Dot11, Dot11Beacon, Dot11Elt, Dot11ProbeReq, wrpcap
+from scapy.utils import PcapNgWriter
+
+from access_point_index import AccessPointSpatialIndex
+from capture import PcapReplaySource, parse_radiotap_beacon, read_capture, track_capture
+from kf import KalmanFilter2D
+from tracker import EventDrivenTracker
+from trilateration import AccessPointRegistry, PATH_LOSS_EXPONENT, RSSI_REF
+import numpy as np
+
+import unittest
+
+ACCESS_POINTS = {
+    "aa:aa:aa:aa:aa:01": ([0, 0], 'AP 1'),
+    "aa:aa:aa:aa:aa:02": ([0, 35], 'AP 2'),
+    "aa:aa:aa:aa:aa:03": ([20, 20], 'AP 3'),
+}
+
+def beacon(sender, rssi, frequency=2437, ssid=b"AP", timestamp=0.0):
+    packet = RadioTap(present='TSFT+Flags+Rate+Channel+dBm_AntSignal', mac_timestamp=123, Rate=2, ChannelFrequency=frequency, dBm_AntSignal=rssi) / \
+             Dot11(type=0, subtype=8, addr1="ff:ff:ff:ff:ff:ff", addr2=sender, addr3=sender) / \
+             Dot11Beacon() / Dot11Elt(ID=0, info=ssid)
+    packet.time = timestamp
+    return packet
+
+class TestRadiotapParser(unittest.TestCase):
+    def test_parses_beacon_fields(self):
+        frame = parse_radiotap_beacon(bytes(beacon("aa:bb:cc:dd:ee:ff", -57, frequency=5180, ssid=b"Office")), timestamp=1.5)
+
+        self.assertEqual(frame.timestamp, 1.5)
+        self.assertEqual(frame.sender, "aa:bb:cc:dd:ee:ff")
+        self.assertEqual(frame.rssi, -57.0)
+        self.assertEqual(frame.frequency, 5180)
+        self.assertEqual(frame.ssid, "Office")
+
+    def test_ignores_other_frames(self):
+        probe = RadioTap(present='dBm_AntSignal', dBm_AntSignal=-40) / Dot11(type=0, subtype=4, addr2="aa:bb:cc:dd:ee:ff") / Dot11ProbeReq()
+
+        self.assertIsNone(parse_radiotap_beacon(bytes(probe)))
+        self.assertIsNone(parse_radiotap_beacon(b"\x00"))
+
+class TestCaptureFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.packets = [beacon(mac, -50 - i, timestamp=100.0 + 0.1 * i) for i, mac in enumerate(ACCESS_POINTS)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _assert_read_back(self, path):
+        packets = list(read_capture(path))
+        self.assertEqual(len(packets), 3)
+        for (timestamp, data), packet in zip(packets, self.packets):
+            self.assertAlmostEqual(timestamp, float(packet.time), places=5)
+            self.assertEqual(data, bytes(packet))
+
+    def test_reads_pcap(self):
+        path = os.path.join(self.directory.name, "beacons.pcap")
+        wrpcap(path, self.packets)
+        self._assert_read_back(path)
+
+    def test_reads_pcapng(self):
+        path = os.path.join(self.directory.name, "beacons.pcapng")
+        with PcapNgWriter(path) as writer:
+            for packet in self.packets:
+                writer.write(packet)
+        self._assert_read_back(path)
+
+    def test_replay_through_tracker(self):
+        registry = AccessPointRegistry(ACCESS_POINTS)
+        true_position = np.array([8.0, 12.0])
+        packets = []
+        for i in range(30):
+            mac, (position, _) = list(ACCESS_POINTS.items())[i % 3]
+            rssi = RSSI_REF - 10 * PATH_LOSS_EXPONENT * np.log10(np.linalg.norm(true_position - position))
+            packets.append(beacon(mac, int(round(rssi)), timestamp=100.0 + 0.1 * i))
+        path = os.path.join(self.directory.name, "walk.pcap")
+        wrpcap(path, packets)
+
+        kf = KalmanFilter2D(10.0, 10.0, 0.0, 0.0, 0.75, fast_update=True)
+        tracker = EventDrivenTracker(registry, AccessPointSpatialIndex(registry), kf, start_time=99.9)
+        fixes = track_capture(PcapReplaySource(path), tracker)
+
+        self.assertEqual(len(fixes), 10)
+        self.assertTrue(np.allclose(fixes[-1][1][:2], true_position, atol=1.0))
+
+    def test_frames_without_timestamps_take_the_previous_one(self):
+        # As pcapng simple packet blocks, only every third beacon carries a capture time (the first two are before any)
+        registry = AccessPointRegistry(ACCESS_POINTS)
+        true_position = np.array([8.0, 12.0])
+        records = []
+        for i in range(30):
+            mac, (position, _) = list(ACCESS_POINTS.items())[i % 3]
+            rssi = RSSI_REF - 10 * PATH_LOSS_EXPONENT * np.log10(np.linalg.norm(true_position - position))
+            records.append((100.0 + 0.1 * i if i % 3 == 2 else float('nan'), bytes(beacon(mac, int(round(rssi))))))
+
+        with mock.patch("capture.read_capture", return_value=iter(records)):
+            timestamps = [frame.timestamp for frame in PcapReplaySource("simple.pcapng").frames()]
+        self.assertEqual(timestamps[:4], [100.2, 100.2, 100.2, 100.2])
+        self.assertTrue(np.all(np.diff(timestamps) >= 0))
+
+        kf = KalmanFilter2D(10.0, 10.0, 0.0, 0.0, 0.75, fast_update=True)
+        tracker = EventDrivenTracker(registry, AccessPointSpatialIndex(registry), kf, start_time=100.0)
+        with mock.patch("capture.read_capture", return_value=iter(records)):
+            fixes = track_capture(PcapReplaySource("simple.pcapng"), tracker)
+        self.assertGreater(len(fixes), 0)
+        self.assertTrue(np.all(np.isfinite(fixes[-1][1])))
@@ -0,0 +1,47 @@
+from scipy.stats import multivariate_normal
+
+from density import GaussianHeatmap
+import numpy as np
+
+import unittest
+
+class TestGaussianHeatmap(unittest.TestCase):
+    def setUp(self):
+        self.heatmap = GaussianHeatmap(0, 60, -5, 40, granularity=300)
+        X, Y = np.meshgrid(np.linspace(0, 60, 300), np.linspace(-5, 40, 300))
+        self.space = np.dstack((X, Y))
+
+    def full_grid(self, mean, cov):
+        distribution = multivariate_normal(mean=mean, cov=cov).pdf(self.space)
+        return distribution / distribution.max()
+
+    def test_matches_full_grid_pdf(self):
+        for mean, cov in [([20.0, 10.0], [[4.0, 1.5], [1.5, 2.0]]),
+                          ([0.5, 39.0], [[10.0, -3.0], [-3.0, 6.0]])]:  # Window clipped by the grid edges
+            grid = self.heatmap.render(np.array(mean), np.array(cov))
+            self.assertLess(np.abs(grid - self.full_grid(mean, cov)).max(), 1e-3)
+
+    def test_clears_previous_window(self):
+        cov = np.eye(2)
+        self.heatmap.render(np.array([10.0, 10.0]), cov)
+        grid = self.heatmap.render(np.array([50.0, 30.0]), cov)
+        self.assertTrue(np.allclose(grid, self.full_grid([50.0, 30.0], cov), atol=1e-3))
+        self.assertEqual(grid[np.abs(self.space[..., 0] - 10) < 5].max(), 0.0)
+
+    def test_accumulate_matches_summed_full_grid_pdfs(self):
+        rng = np.random.default_rng(0)
+        means = rng.uniform([-5, -10], [65, 45], size=(50, 2))  # Some off the grid
+        factors = rng.normal(scale=0.8, size=(50, 2, 2))
+        covs = factors @ factors.transpose(0, 2, 1) + 0.1 * np.eye(2)
+
+        grid = self.heatmap.accumulate(means, covs)
+        # Each Gaussian peak normalised
+        expected = sum(multivariate_normal(mean=mean, cov=cov).pdf(self.space) / multivariate_normal(mean=mean, cov=cov).pdf(mean)
+                       for mean, cov in zip(means, covs))
+        self.assertEqual(grid.dtype, np.float32)
+        self.assertLess(np.abs(grid - expected).max(), 1e-3)
+
+    def test_accumulate_density_integrates_to_one(self):
+        grid = self.heatmap.accumulate([[30.0, 20.0], [10.0, 10.0]], [[[4.0, 1.0], [1.0, 3.0]], [[1.0, 0.0], [0.0, 1.0]]], density=True)
+        cell_area = (60 / 299) * (45 / 299)
+        self.assertAlmostEqual(grid.sum() * cell_area, 2.0, places=2)
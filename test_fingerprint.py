@@ -0,0 +1,58 @@
+import os
+import tempfile
+
+from fingerprint import FingerprintLocator, radio_map_from_log, synthesize_radio_map
+from tracking_log import TrackingLogWriter
+from trilateration import PATH_LOSS_EXPONENT, RSSI_REF, rssi_to_distance
+import numpy as np
+
+import unittest
+
+AP_POSITIONS = np.array([[0.0, 0.0], [0.0, 35.0], [20.0, 20.0], [30.0, 0.0]])
+
+def rssi_at(position):
+    return RSSI_REF - 10 * PATH_LOSS_EXPONENT * np.log10(np.linalg.norm(AP_POSITIONS - position, axis=1))
+
+class TestFingerprintLocator(unittest.TestCase):
+    def setUp(self):
+        self.locator = FingerprintLocator(synthesize_radio_map(AP_POSITIONS, -5, 35, -5, 40, cell_size=0.5), projection_dims=3)
+
+    def test_locates_noiseless_rssi_within_a_cell(self):
+        for true_position in ([8.0, 12.0], [25.3, 4.1], [2.2, 30.7]):
+            position, cov = self.locator.locate(rssi_at(np.array(true_position)))
+
+            self.assertLess(np.linalg.norm(position - true_position), 0.5)
+            self.assertTrue(np.allclose(cov, cov.T))
+            self.assertTrue(np.all(np.linalg.eigvalsh(cov) > 0))
+
+    def test_unheard_access_points_are_left_out_of_the_match(self):
+        # The nearby access point missed a beacon, matching it as unheard would pull the fix far from it
+        true_position = np.array([18.0, 17.0])
+        rssi = rssi_at(true_position)
+        rssi[2] = np.nan
+        position, _ = self.locator.locate(rssi)
+
+        self.assertLess(np.linalg.norm(position - true_position), 0.5)
+
+    def test_too_few_access_points(self):
+        rssi = rssi_at(np.array([8.0, 12.0]))
+        rssi[:2] = np.nan
+        with self.assertRaises(ValueError):
+            self.locator.locate(rssi)
+
+        positions, covs = self.locator.locate_batch(np.stack([rssi, rssi_at(np.array([8.0, 12.0]))]))
+        self.assertTrue(np.isnan(positions[0]).all() and np.isnan(covs[0]).all())
+        self.assertTrue(np.allclose(positions[1], self.locator.locate(rssi_at(np.array([8.0, 12.0])))[0]))
+
+    def test_radio_map_from_calibration_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "calibration.bin")
+            with TrackingLogWriter(path, ["a", "b", "c", "d"]) as writer:
+                for x, y in [(1.2, 1.3), (1.4, 1.1), (5.2, 7.7)]:
+                    writer.append(0.0, x, y, np.eye(2), rssi_to_distance(rssi_at(np.array([x, y]))))
+            radio_map, access_points = radio_map_from_log(path, cell_size=1.0)
+
+        self.assertEqual(access_points, ["a", "b", "c", "d"])
+        self.assertTrue(np.array_equal(radio_map.positions, [[1.5, 1.5], [5.5, 7.5]]))
+        expected = (rssi_at(np.array([1.2, 1.3])) + rssi_at(np.array([1.4, 1.1]))) / 2
+        self.assertTrue(np.allclose(radio_map.rssi[0], expected, atol=1e-3))
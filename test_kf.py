@@ -1,4 +1,4 @@
-from kf import KalmanFilter1D, KalmanFilter2D
+from kf import ExtendedKalmanFilter2D, KalmanFilter1D, KalmanFilter2D, KalmanFilterBank, TRANSITION_CACHE_SIZE
 import numpy as np
 
 import unittest
@@ -109,3 +109,277 @@ class TestKalmanFilter2D(unittest.TestCase):
             det_after = np.linalg.det(kf.cov)
 
             self.assertLess(det_after, det_before)
+
+    def test_predict_matches_uncached_formula(self):
+        kf = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2)
+        x = kf.mean
+        P = kf.cov
+
+        for dt in [0.1, 0.1, 0.25, 0.1]:
+            F = kf.F(dt)
+            G = kf.G(dt)
+            x = F.dot(x)
+            P = F.dot(P).dot(F.T) + G.dot(1.2 * np.eye(2)).dot(G.T)
+            kf.predict(dt=dt)
+
+            self.assertTrue(np.allclose(kf.mean, x))
+            self.assertTrue(np.allclose(kf.cov, P))
+
+    def test_transition_cache_is_bounded(self):
+        kf = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2)
+        for step in range(TRANSITION_CACHE_SIZE * 2):
+            kf.predict(dt=0.01 * (step + 1))
+
+        self.assertEqual(len(kf._transition_cache), TRANSITION_CACHE_SIZE)
+
+    def test_predict_uses_the_exact_dt(self):
+        # Beacon driven predicts are neither multiples of 1ms nor above it
+        kf = KalmanFilter2D(0.0, 0.0, 1.0, 0.0, 1.2)
+        x = kf.mean
+        P = kf.cov
+        for dt in [0.0016, 0.0003, 0.0123, 0.0003]:
+            F = kf.F(dt)
+            G = kf.G(dt)
+            x = F.dot(x)
+            P = F.dot(P).dot(F.T) + G.dot(1.2 * np.eye(2)).dot(G.T)
+            kf.predict(dt=dt)
+
+            self.assertTrue(np.allclose(kf.mean, x, rtol=1e-12, atol=0))
+            self.assertTrue(np.allclose(kf.cov, P, rtol=1e-12, atol=0))
+
+        for _ in range(3000):
+            kf.predict(dt=0.0003)
+        self.assertAlmostEqual(kf.pos_x, 0.0145 + 0.9)
+        self.assertGreater(kf.cov[0, 0], 181.0)
+
+    def test_mean_and_cov_are_not_mutated_by_predict(self):
+        kf = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2)
+        mean = kf.mean
+        cov = kf.cov
+        kf.predict(dt=0.1)
+
+        self.assertFalse(np.allclose(mean, kf.mean))
+        self.assertFalse(np.allclose(cov, kf.cov))
+
+class TestFastUpdate(unittest.TestCase):
+    def test_1d_fast_update_matches_pinv_update(self):
+        kf = KalmanFilter1D(0.2, 0.3, 1.2)
+        kf_fast = KalmanFilter1D(0.2, 0.3, 1.2, fast_update=True)
+        rng = np.random.default_rng(0)
+
+        for _ in range(50):
+            z = rng.normal()
+            for f in (kf, kf_fast):
+                f.predict(dt=0.1)
+                f.update(meas_value=z, meas_variance=0.1)
+
+            self.assertTrue(np.allclose(kf_fast.mean, kf.mean))
+            self.assertTrue(np.allclose(kf_fast.cov, kf.cov))
+
+    def test_2d_fast_update_matches_pinv_update(self):
+        kf = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2)
+        kf_fast = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2, fast_update=True)
+        rng = np.random.default_rng(0)
+
+        for _ in range(50):
+            z = rng.normal(size=2)
+            for f in (kf, kf_fast):
+                f.predict(dt=0.1)
+                f.update(meas_value=z, meas_variance=[[4, 2], [2, 4]])
+
+            self.assertTrue(np.allclose(kf_fast.mean, kf.mean))
+            self.assertTrue(np.allclose(kf_fast.cov, kf.cov))
+
+    def test_fast_update_keeps_covariance_symmetric(self):
+        kf = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2, fast_update=True)
+        for _ in range(200):
+            kf.predict(dt=0.1)
+            kf.update(meas_value=[0.1, 0.2], meas_variance=[[1e-6, 0], [0, 1e-6]])
+
+        self.assertTrue(np.array_equal(kf.cov, kf.cov.T))
+
+    def test_fast_update_falls_back_for_singular_innovation(self):
+        kf = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2)
+        kf_fast = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2, fast_update=True)
+        for f in (kf, kf_fast):
+            f._P[:] = 0
+            f.update(meas_value=[1.0, 1.0], meas_variance=[[1, 1], [1, 1]])
+
+        self.assertTrue(np.allclose(kf_fast.mean, kf.mean))
+        self.assertTrue(np.allclose(kf_fast.cov, kf.cov))
+
+class TestDelayedUpdate(unittest.TestCase):
+    def test_delayed_update_matches_in_order_processing(self):
+        in_order = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2)
+        delayed = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2, history_size=16)
+        rng = np.random.default_rng(0)
+        measurements = [(0.1 * (i + 1), rng.normal(size=2)) for i in range(10)]
+        late_time, late_z = 0.45, rng.normal(size=2)
+
+        previous = 0.0
+        for t, z in sorted(measurements + [(late_time, late_z)], key=lambda m: m[0]):
+            in_order.predict(t - previous)
+            in_order.update(z, [[4, 2], [2, 4]])
+            previous = t
+        for t, z in measurements:
+            delayed.predict(0.1)
+            delayed.update(z, [[4, 2], [2, 4]])
+
+        self.assertTrue(delayed.update_delayed(late_z, [[4, 2], [2, 4]], lag=delayed.time - late_time))
+        self.assertAlmostEqual(delayed.time, 1.0)
+        self.assertTrue(np.allclose(delayed.mean, in_order.mean))
+        self.assertTrue(np.allclose(delayed.cov, in_order.cov))
+
+    def test_delayed_update_between_two_predicts_splits_the_interval(self):
+        # Updates every 5 predicts, the late measurement lands halfway through a predict with no update either side of it
+        in_order = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2)
+        delayed = KalmanFilter2D(0.2, 0.5, 0.3, 0.8, 1.2, history_size=16)
+        rng = np.random.default_rng(0)
+        measurements = {4: rng.normal(size=2), 9: rng.normal(size=2)}
+        late_z = rng.normal(size=2)
+
+        for step in range(10):
+            if step == 2:
+                in_order.predict(0.05)
+                in_order.update(late_z, [[4, 2], [2, 4]])
+                in_order.predict(0.05)
+            else:
+                in_order.predict(0.1)
+            delayed.predict(0.1)
+            if step in measurements:
+                in_order.update(measurements[step], [[4, 2], [2, 4]])
+                delayed.update(measurements[step], [[4, 2], [2, 4]])
+
+        self.assertTrue(delayed.update_delayed(late_z, [[4, 2], [2, 4]], lag=delayed.time - 0.25))
+        self.assertAlmostEqual(delayed.time, 1.0)
+        self.assertTrue(np.allclose(delayed.mean, in_order.mean))
+        self.assertTrue(np.allclose(delayed.cov, in_order.cov))
+
+    def test_measurement_older_than_history_is_rejected(self):
+        kf = KalmanFilter1D(0.2, 0.3, 1.2, history_size=4)
+        for _ in range(10):
+            kf.predict(dt=0.1)
+            kf.update(meas_value=0.0, meas_variance=0.1)
+        mean, cov = kf.mean, kf.cov
+
+        self.assertFalse(kf.update_delayed(meas_value=5.0, meas_variance=0.1, lag=0.5))
+        self.assertFalse(KalmanFilter1D(0.2, 0.3, 1.2).update_delayed(meas_value=5.0, meas_variance=0.1, lag=0.05))
+        self.assertTrue(np.array_equal(kf.mean, mean))
+        self.assertTrue(np.array_equal(kf.cov, cov))
+
+class TestExtendedKalmanFilter2D(unittest.TestCase):
+    def setUp(self):
+        self.ap_positions = np.array([[0.0, 0.0], [0.0, 35.0], [20.0, 20.0]])
+        self.true_position = np.array([8.0, 12.0])
+
+    def test_range_update_only_constrains_the_range_direction(self):
+        kf = ExtendedKalmanFilter2D(10.0, 0.0, 0.0, 0.0, 0.75)
+        kf.update_range(self.ap_positions[0], 8.0, 0.25)
+
+        # The access point lies along x, so only x (and its correlations) are updated
+        self.assertAlmostEqual(kf.mean[1], 0.0)
+        self.assertLess(kf.mean[0], 10.0)
+        self.assertLess(kf.cov[0, 0], 1.0)
+        self.assertEqual(kf.cov[1, 1], 100.0)
+
+    def test_converges_from_single_access_point_ranges(self):
+        kf = ExtendedKalmanFilter2D(10.0, 17.0, 0.0, 0.0, 0.75)
+        rng = np.random.default_rng(0)
+        for i in range(300):
+            kf.predict(dt=0.05)
+            ap_position = self.ap_positions[i % 3]
+            kf.update_range(ap_position, np.linalg.norm(self.true_position - ap_position) + rng.normal(scale=0.5), 0.25)
+
+        self.assertLess(np.linalg.norm(kf.mean[:2] - self.true_position), 0.5)
+        self.assertTrue(np.array_equal(kf.cov, kf.cov.T))
+
+    def test_degenerate_range_leaves_state_and_history_unchanged(self):
+        kf = ExtendedKalmanFilter2D(0.05, 0.0, 0.0, 0.0, 0.75, history_size=16)
+        kf.predict(dt=0.1)
+        mean, cov, history = kf.mean, kf.cov, len(kf._history)
+
+        self.assertFalse(kf.update_range(self.ap_positions[0], 3.0, 0.25))
+        self.assertTrue(np.array_equal(kf.mean, mean))
+        self.assertTrue(np.array_equal(kf.cov, cov))
+        self.assertEqual(len(kf._history), history)
+        self.assertTrue(kf.update_range(self.ap_positions[1], 30.0, 0.25))
+
+    def test_delayed_range_matches_in_order_processing(self):
+        in_order = ExtendedKalmanFilter2D(10.0, 17.0, 0.0, 0.0, 0.75)
+        delayed = ExtendedKalmanFilter2D(10.0, 17.0, 0.0, 0.0, 0.75, history_size=16)
+        ranges = [(self.ap_positions[i % 3], np.linalg.norm(self.true_position - self.ap_positions[i % 3]) + 0.1 * i) for i in range(6)]
+
+        for i, (ap_position, distance) in enumerate(ranges):
+            in_order.predict(dt=0.1)
+            in_order.update_range(ap_position, distance, 0.25)
+            delayed.predict(dt=0.1)
+            if i != 2:
+                delayed.update_range(ap_position, distance, 0.25)
+        self.assertTrue(delayed.update_range_delayed(*ranges[2], 0.25, lag=0.3))
+
+        self.assertTrue(np.allclose(delayed.mean, in_order.mean))
+        self.assertTrue(np.allclose(delayed.cov, in_order.cov))
+
+class TestKalmanFilterBank(unittest.TestCase):
+    def _make_filters(self, count):
+        rng = np.random.default_rng(0)
+        return [KalmanFilter2D(*rng.normal(size=4), rng.uniform(0.5, 2.0)) for _ in range(count)]
+
+    def test_can_construct(self):
+        filters = self._make_filters(5)
+        bank = KalmanFilterBank(filters)
+
+        self.assertEqual(len(bank), 5)
+        self.assertEqual(bank.mean.shape, (5, 4))
+        self.assertEqual(bank.cov.shape, (5, 4, 4))
+
+    def test_matches_individual_filters(self):
+        filters = self._make_filters(5)
+        bank = KalmanFilterBank(self._make_filters(5))
+        rng = np.random.default_rng(1)
+
+        for _ in range(20):
+            z = rng.normal(size=(5, 2))
+            R = np.tile([[4.0, 1.0], [1.0, 3.0]], (5, 1, 1))
+            for kf, z_i, R_i in zip(filters, z, R):
+                kf.predict(dt=0.1)
+                kf.update(meas_value=z_i, meas_variance=R_i)
+            bank.predict(dt=0.1)
+            bank.update(meas_values=z, meas_variances=R)
+
+        # The bank inverts S analytically where the filters use the pseudo-inverse, equal to rounding
+        for i, kf in enumerate(filters):
+            self.assertTrue(np.allclose(bank.mean[i], kf.mean, rtol=1e-9, atol=1e-12))
+            self.assertTrue(np.allclose(bank.cov[i], kf.cov, rtol=1e-9, atol=1e-12))
+
+    def test_singular_innovation_falls_back_to_pseudo_inverse(self):
+        bank = KalmanFilterBank(self._make_filters(2))
+        bank.cov[0] = 0.0
+        mean_before = bank.mean.copy()
+
+        bank.update(meas_values=[[1.0, 2.0], [3.0, 4.0]], meas_variances=np.zeros((2, 2, 2)))
+
+        self.assertTrue(np.all(np.isfinite(bank.mean)))
+        self.assertTrue(np.array_equal(bank.mean[0], mean_before[0]))
+        self.assertTrue(np.allclose(bank.mean[1], [3.0, 4.0, *bank.mean[1, 2:]]))
+
+    def test_masked_update_only_changes_selected_filters(self):
+        bank = KalmanFilterBank(self._make_filters(4))
+        mask = np.array([True, False, True, False])
+        mean_before = bank.mean.copy()
+        cov_before = bank.cov.copy()
+
+        bank.update(meas_values=[[1.0, 2.0], [3.0, 4.0]], meas_variances=np.tile(np.eye(2), (2, 1, 1)), mask=mask)
+
+        self.assertTrue(np.array_equal(bank.mean[~mask], mean_before[~mask]))
+        self.assertTrue(np.array_equal(bank.cov[~mask], cov_before[~mask]))
+        self.assertFalse(np.allclose(bank.mean[mask], mean_before[mask]))
+        self.assertTrue(np.all(np.linalg.det(bank.cov[mask]) < np.linalg.det(cov_before[mask])))
+
+    def test_append_adds_filter(self):
+        bank = KalmanFilterBank(self._make_filters(2))
+        index = bank.append(KalmanFilter2D(1.0, 2.0, 0.0, 0.0, 1.2))
+
+        self.assertEqual(index, 2)
+        self.assertEqual(len(bank), 3)
+        self.assertTrue(np.allclose(bank.mean[2], [1.0, 2.0, 0.0, 0.0]))
@@ -0,0 +1,26 @@
+from monte_carlo import evaluate, simulate_scenario, summarize
+import numpy as np
+
+import unittest
+
+class TestMonteCarlo(unittest.TestCase):
+    def test_seeded_scenarios_are_reproducible(self):
+        first = simulate_scenario(num_runs=20, num_steps=50, seed=3)
+        second = simulate_scenario(num_runs=20, num_steps=50, seed=3)
+        self.assertTrue(np.array_equal(first.states, second.states))
+        self.assertTrue(np.array_equal(first.rssi, second.rssi))
+        self.assertEqual(first.rssi.shape, (5, 20, 3))
+        self.assertFalse(np.array_equal(first.rssi, simulate_scenario(num_runs=20, num_steps=50, seed=4).rssi))
+
+    def test_trajectories_stay_inside_access_points(self):
+        scenario = simulate_scenario(num_runs=100, num_steps=200, acceleration_variance=5.0)
+        positions = scenario.states[..., :2]
+        self.assertTrue((positions >= scenario.ap_positions.min(axis=0)).all())
+        self.assertTrue((positions <= scenario.ap_positions.max(axis=0)).all())
+
+    def test_low_noise_tracks_true_positions(self):
+        scenario = simulate_scenario(num_runs=50, num_steps=200, sigma_rssi=0.01)
+        summary = summarize(evaluate(scenario, sigma_rssi=0.01))
+        self.assertLess(summary["fix_rmse"], 0.1)
+        self.assertLess(summary["rmse"], 0.5)
+        self.assertEqual(summary["fix_rate"], 1.0)
@@ -0,0 +1,52 @@
+from pf import MAX_PARTICLES, ParticleFilter2D
+from trilateration import PATH_LOSS_EXPONENT, RSSI_REF
+import numpy as np
+
+import unittest
+
+AP_POSITIONS = np.array([[0.0, 0.0], [0.0, 35.0], [20.0, 20.0]])
+TRUE_POSITION = np.array([8.0, 12.0])
+
+class TestParticleFilter2D(unittest.TestCase):
+    def test_can_construct(self):
+        pf = ParticleFilter2D(0.2, 0.5, 0.3, 0.8, 1.2, seed=0)
+
+        self.assertEqual(pf.particles.shape, (MAX_PARTICLES, 4))
+        self.assertEqual(pf.particles.dtype, np.float32)
+        self.assertTrue(pf.particles.flags.c_contiguous)
+        self.assertEqual(pf.mean.shape, (4, ))
+        self.assertEqual(pf.cov.shape, (4, 4))
+        self.assertAlmostEqual(pf.weights.sum(), 1.0)
+
+    def test_calling_predict_increases_uncertainty(self):
+        pf = ParticleFilter2D(0.2, 0.5, 0.3, 0.8, 1.2, seed=0)
+        cov = pf.cov
+        pf.predict(dt=1.0)
+
+        self.assertGreater(pf.cov[0, 0], cov[0, 0])
+        self.assertGreater(pf.cov[1, 1], cov[1, 1])
+
+    def test_converges_from_ranges_and_shrinks_particle_count(self):
+        pf = ParticleFilter2D(10.0, 17.0, 0.0, 0.0, 0.75, seed=0)
+        rng = np.random.default_rng(0)
+        for i in range(300):
+            pf.predict(dt=0.05)
+            ap_position = AP_POSITIONS[i % 3]
+            pf.update_range(ap_position, np.linalg.norm(TRUE_POSITION - ap_position) + rng.normal(scale=0.5), 0.25)
+
+        self.assertLess(np.linalg.norm(pf.mean[:2] - TRUE_POSITION), 1.0)
+        # KLD sampling needs far fewer particles once the posterior is compact
+        self.assertLess(len(pf), MAX_PARTICLES // 4)
+
+    def test_two_access_points_keep_both_modes(self):
+        # Two ranges intersect either side of the line between the access points (x = 0), both are kept
+        rssi = RSSI_REF - 10 * PATH_LOSS_EXPONENT * np.log10(np.linalg.norm(AP_POSITIONS - TRUE_POSITION, axis=1))
+        rssi[2] = np.nan
+        pf = ParticleFilter2D(0.0, 17.0, 0.0, 0.0, 0.75, seed=0)
+        for _ in range(20):
+            pf.predict(dt=0.1)
+            pf.update_rssi(rssi, AP_POSITIONS, sigma_rssi=1.0)
+
+        x = pf.particles[:, 0]
+        self.assertGreater(pf.weights[x > 4].sum(), 0.2)
+        self.assertGreater(pf.weights[x < -4].sum(), 0.2)
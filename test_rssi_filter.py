@@ -0,0 +1,39 @@
+from rssi_filter import RssiFilterBank, SHADOWING_STD
+from trilateration import SIGMA_RSSI
+import numpy as np
+
+import unittest
+
+class TestRssiFilterBank(unittest.TestCase):
+    def test_first_reading_passes_through(self):
+        bank = RssiFilterBank(3)
+
+        self.assertEqual(bank.update(1, -60.0, 0.0), -60.0)
+        self.assertTrue(np.array_equal(np.isnan(bank.rssi), [True, False, True]))
+        self.assertAlmostEqual(bank.std[1], np.sqrt(SIGMA_RSSI ** 2 + SHADOWING_STD ** 2))
+
+    def test_smooths_noise_and_estimates_it(self):
+        bank = RssiFilterBank(1)
+        rng = np.random.default_rng(0)
+        raw_errors, smoothed_errors = [], []
+        for i in range(2000):
+            t = 0.1 * i
+            true_rssi = -60 + 5 * np.sin(t / 10)
+            rssi = round(true_rssi + rng.normal(scale=4.0))
+            smoothed = bank.update(0, rssi, t)
+            if i > 100:
+                raw_errors.append(rssi - true_rssi)
+                smoothed_errors.append(smoothed - true_rssi)
+
+        self.assertLess(np.std(smoothed_errors), 0.5 * np.std(raw_errors))
+        self.assertAlmostEqual(bank.noise_std[0], 4.0, delta=1.0)
+        self.assertLess(bank.std[0], np.sqrt(SIGMA_RSSI ** 2 + SHADOWING_STD ** 2))
+
+    def test_trusts_a_new_reading_after_a_long_gap(self):
+        bank = RssiFilterBank(1)
+        for i in range(20):
+            bank.update(0, -60.0, 0.1 * i)
+        self.assertLess(bank.update(0, -50.0, 2.0), -58.0)
+
+        # The true RSSI may have drifted anywhere over 10s
+        self.assertGreater(bank.update(0, -50.0, 12.0), -51.0)
@@ -0,0 +1,31 @@
+from monte_carlo import evaluate, simulate_scenario, summarize
+from sweep import DEFAULT_PARAMETERS, grid_search, random_search, run_sweep
+import numpy as np
+
+import unittest
+
+class TestSweep(unittest.TestCase):
+    def test_grid_search_combinations(self):
+        parameter_sets = grid_search({"cov_inflation": [1.0, 10.0], "path_loss_exponent": [2.0, 3.0, 4.0]})
+        self.assertEqual(len(parameter_sets), 6)
+        self.assertTrue(all(parameters["rssi_ref"] == DEFAULT_PARAMETERS["rssi_ref"] for parameters in parameter_sets))
+
+    def test_random_search_samples_are_deterministic_per_task(self):
+        ranges = {"max_acceleration": (0.5, 3.0), "sigma_rssi": (2.0, 12.0)}
+        self.assertEqual(random_search(ranges, 3, seed=7), random_search(ranges, 5, seed=7)[:3])
+        for parameters in random_search(ranges, 5, seed=7):
+            self.assertTrue(0.5 <= parameters["max_acceleration"] <= 3.0)
+
+    def test_pool_matches_serial_evaluation(self):
+        scenario = simulate_scenario(num_runs=20, num_steps=60, seed=1)
+        parameter_sets = grid_search({"cov_inflation": [1.0, 10.0, 100.0]})
+        results = run_sweep(scenario, parameter_sets, max_workers=2)
+
+        self.assertEqual(len(results), 3)
+        for row, parameters in zip(results.itertuples(), parameter_sets):
+            expected = summarize(evaluate(scenario,
+                                          acceleration_variance=parameters["max_acceleration"] ** 2 / 3.0,
+                                          sigma_rssi=parameters["sigma_rssi"],
+                                          cov_inflation=parameters["cov_inflation"]))
+            self.assertEqual(row.cov_inflation, parameters["cov_inflation"])
+            self.assertTrue(np.isclose(row.rmse, expected["rmse"]))
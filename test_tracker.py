@@ -0,0 +1,167 @@
+from queue import Queue
+import asyncio
+import contextlib
+import io
+import time
+
+from access_point_index import AccessPointSpatialIndex
+from kf import ExtendedKalmanFilter2D, KalmanFilter2D
+from pf import ParticleFilter2D
+from tracker import EventDrivenTracker
+from tracking_server import FakeSnifferClient, SnifferClient, TrackingServer
+from trilateration import AccessPointRegistry, PATH_LOSS_EXPONENT, RSSI_REF
+import numpy as np
+
+import unittest
+
+ACCESS_POINTS = {
+    "aa:aa:aa:aa:aa:01": ([0, 0], 'AP 1'),
+    "aa:aa:aa:aa:aa:02": ([0, 35], 'AP 2'),
+    "aa:aa:aa:aa:aa:03": ([20, 20], 'AP 3'),
+}
+
+def rssi_at(position, ap_position):
+    return RSSI_REF - 10 * PATH_LOSS_EXPONENT * np.log10(np.linalg.norm(np.subtract(position, ap_position)))
+
+class TestEventDrivenTracker(unittest.TestCase):
+    def setUp(self):
+        self.registry = AccessPointRegistry(ACCESS_POINTS)
+        self.kf = KalmanFilter2D(5.0, 5.0, 0.0, 0.0, 0.75)
+        self.queue = Queue()
+        self.tracker = EventDrivenTracker(self.registry, AccessPointSpatialIndex(self.registry), self.kf, self.queue, start_time=0.0)
+
+    def test_predicts_to_observation_time(self):
+        self.tracker.process(0.35, "aa:aa:aa:aa:aa:01", -60.0)
+
+        self.assertEqual(self.tracker.time, 0.35)
+        expected = KalmanFilter2D(5.0, 5.0, 0.0, 0.0, 0.75)
+        expected.predict(0.35)
+        self.assertTrue(np.allclose(self.kf.cov, expected.cov))
+
+    def test_updates_once_a_fresh_set_arrives(self):
+        true_position = [8.0, 12.0]
+        updated = [self.tracker.process(0.1 * (i + 1), mac, rssi_at(true_position, position))
+                   for i, (mac, (position, _)) in enumerate(ACCESS_POINTS.items())]
+
+        self.assertEqual(updated, [False, False, True])
+        self.assertTrue(np.allclose(self.tracker.last_fix[0], true_position))
+
+        # A single new beacon isn't a fresh set
+        self.assertFalse(self.tracker.process(0.5, "aa:aa:aa:aa:aa:01", -55.0))
+
+    def test_late_fix_is_retrodicted(self):
+        kf = KalmanFilter2D(5.0, 5.0, 0.0, 0.0, 0.75, history_size=16)
+        tracker = EventDrivenTracker(self.registry, AccessPointSpatialIndex(self.registry), kf, start_time=0.0)
+        tracker.predict_to(1.0)
+        for mac, (position, _) in ACCESS_POINTS.items():
+            tracker.process(0.6, mac, rssi_at([8.0, 12.0], position))
+
+        # The fix lands at 0.6s and the filter is predicted back to the tracker's time
+        self.assertEqual(tracker.time, 1.0)
+        self.assertAlmostEqual(kf.time, 1.0)
+        expected = KalmanFilter2D(5.0, 5.0, 0.0, 0.0, 0.75)
+        expected.predict(0.6)
+        expected.update(*tracker.last_fix[:2])
+        expected.predict(0.4)
+        self.assertTrue(np.allclose(kf.mean, expected.mean))
+        self.assertTrue(np.allclose(kf.cov, expected.cov))
+
+    def test_range_updates_on_every_beacon(self):
+        for kf in (ExtendedKalmanFilter2D(10.0, 17.0, 0.0, 0.0, 0.75), ParticleFilter2D(10.0, 17.0, 0.0, 0.0, 0.75, seed=0)):
+            tracker = EventDrivenTracker(self.registry, AccessPointSpatialIndex(self.registry), kf, start_time=0.0)
+            updated = [tracker.process(0.05 * (i + 1), mac, rssi_at([8.0, 12.0], position))
+                       for i, (mac, (position, _)) in enumerate(list(ACCESS_POINTS.items()) * 60)]
+
+            self.assertTrue(all(updated))
+            # The particle filter weighs each RSSI at SIGMA_RSSI, which leaves its cloud a few metres wide
+            self.assertLess(np.linalg.norm(kf.mean[:2] - [8.0, 12.0]), 1.0 if isinstance(kf, ExtendedKalmanFilter2D) else 2.0)
+            self.assertEqual(np.count_nonzero(~np.isnan(tracker.last_fix[2])), 1)
+
+    def test_ignores_unknown_access_points(self):
+        self.assertFalse(self.tracker.process(0.1, "ff:ff:ff:ff:ff:ff", -50.0))
+        self.assertEqual(self.tracker.time, 0.0)
+
+    def test_run_consumes_queue_until_end_time(self):
+        start = time.monotonic()
+        tracker = EventDrivenTracker(self.registry, AccessPointSpatialIndex(self.registry), self.kf, self.queue, start_time=start)
+        for mac, (position, _) in ACCESS_POINTS.items():
+            self.queue.put((start + 0.01, mac, rssi_at([8.0, 12.0], position)))
+
+        fixes = []
+        tracker.run(end_time=time.monotonic() + 0.2, on_update=lambda t: fixes.append(t.last_fix))
+
+        self.assertEqual(len(fixes), 1)
+        self.assertTrue(self.queue.empty())
+
+class TestTrackingServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.registry = AccessPointRegistry(ACCESS_POINTS)
+        self.server = TrackingServer(self.registry)
+        await self.server.start(port=0)
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_tracks_devices_from_multiple_sniffers(self):
+        clients = [FakeSnifferClient(self.registry, num_devices=5, seed=seed, port=self.server.port) for seed in range(2)]
+        for client in clients:
+            await client.connect()
+        for client in clients:
+            await client.run(duration=0.3, rate=50.0)
+
+        positions = await clients[0].query()
+        self.assertEqual(len(positions), 10)
+        self.assertGreater(self.server.fixes, 0)
+        for client in clients:
+            await client.close()
+
+    async def test_query_single_device(self):
+        client = SnifferClient(port=self.server.port)
+        await client.connect()
+        for i, (mac, (position, _)) in enumerate(ACCESS_POINTS.items()):
+            await client.send(100.0 + 0.1 * i, "de:vi:ce", mac, rssi_at([8.0, 12.0], position))
+
+        positions = await client.query("de:vi:ce")
+        self.assertEqual(list(positions.keys()), ["de:vi:ce"])
+        self.assertEqual(await client.query("ab:se:nt"), {})
+        await client.close()
+
+    async def test_malformed_batch_is_rejected_and_queries_still_answer(self):
+        client = SnifferClient(port=self.server.port)
+        await client.connect()
+        client._batch.append([100.0, "de:vi:ce", -60.0])
+        await client.flush()
+        client._batch.append([float('nan'), "de:vi:ce", "84:af:ec:7b:f5:99", -60.0])
+        await client.flush()
+        for i, (mac, (position, _)) in enumerate(ACCESS_POINTS.items()):
+            await client.send(100.2 + 0.1 * i, "de:vi:ce", mac, rssi_at([8.0, 12.0], position))
+
+        positions = await asyncio.wait_for(client.query(), timeout=5.0)
+        self.assertEqual(len(client.errors), 2)
+        self.assertEqual(list(positions.keys()), ["de:vi:ce"])
+        self.assertEqual(self.server.observations_processed, 3)
+        await client.close()
+
+    async def test_query_does_not_wait_on_batches_still_in_flight(self):
+        # Under sustained load some other client's batch is always unfinished, modelled as one taken off the queue but never
+        # marked done
+        await self.server._batches.put([])
+        await self.server._batches.get()
+        client = SnifferClient(port=self.server.port)
+        await client.connect()
+        for i, (mac, (position, _)) in enumerate(ACCESS_POINTS.items()):
+            await client.send(100.0 + 0.1 * i, "de:vi:ce", mac, rssi_at([8.0, 12.0], position))
+
+        positions = await asyncio.wait_for(client.query(), timeout=5.0)
+        self.assertEqual(list(positions.keys()), ["de:vi:ce"])
+        await client.close()
+
+    async def test_message_that_is_not_an_object_drops_the_client(self):
+        reader, writer = await asyncio.open_connection(port=self.server.port)
+        writer.write(b"[1, 2]\n")
+        await writer.drain()
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(await asyncio.wait_for(reader.read(), timeout=5.0), b"")
+        self.assertIn("Dropping client", output.getvalue())
+        writer.close()
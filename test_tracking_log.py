@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+from tracking_log import TrackingLogWriter, read_tracking_log
+import numpy as np
+
+import unittest
+
+ACCESS_POINTS = ["aa:aa:aa:aa:aa:01", "aa:aa:aa:aa:aa:02", "aa:aa:aa:aa:aa:03"]
+
+class TestTrackingLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "log.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        with TrackingLogWriter(self.path, ACCESS_POINTS, chunk_records=4) as writer:
+            for i in range(10):
+                writer.append(float(i), i + 0.5, -i, np.eye(2) * i, [1.0, np.nan, i])
+            writer.append(10.0, 0.0, 0.0, np.eye(2), {"aa:aa:aa:aa:aa:02": 7.0})
+
+        records, access_points = read_tracking_log(self.path)
+        self.assertIsInstance(records, np.memmap)
+        self.assertEqual(access_points, ACCESS_POINTS)
+        self.assertEqual(len(records), 11)
+        self.assertTrue(np.array_equal(records['timestamp'], np.arange(11)))
+        self.assertTrue(np.array_equal(records['cov'][3], np.eye(2) * 3))
+        self.assertTrue(np.array_equal(records['distances'][3], [1.0, np.nan, 3.0], equal_nan=True))
+        self.assertTrue(np.array_equal(records['distances'][10], [np.nan, 7.0, np.nan], equal_nan=True))
+
+    def test_flushes_full_chunks_before_close(self):
+        writer = TrackingLogWriter(self.path, ACCESS_POINTS, chunk_records=4, flush_interval=np.inf)
+        for i in range(6):
+            writer.append(float(i), 0.0, 0.0, np.eye(2))
+
+        # Only the first chunk is on disk, as it would be after a crash
+        records, _ = read_tracking_log(self.path)
+        self.assertEqual(len(records), 4)
+        self.assertTrue(np.isnan(records['distances']).all())
+
+        writer.close()
+        self.assertEqual(len(read_tracking_log(self.path)[0]), 6)
+
+    def test_ignores_partial_record(self):
+        with TrackingLogWriter(self.path, ACCESS_POINTS) as writer:
+            writer.append(1.0, 2.0, 3.0, np.eye(2))
+        with open(self.path, 'ab') as file:
+            file.write(b"\0" * 5)
+
+        records, _ = read_tracking_log(self.path)
+        self.assertEqual(len(records), 1)
+        self.assertEqual((records['x'][0], records['y'][0]), (2.0, 3.0))
@@ -0,0 +1,153 @@
+from access_point_index import AccessPointSpatialIndex
+from trilateration import AccessPointRegistry, PATH_LOSS_EXPONENT, rssi_to_distance, trilaterate_batch
+import numpy as np
+
+import unittest
+
+def reference_trilaterate(rssi, ap_positions):
+    # The original per-fix main.trilaterate solver
+    positions = np.array(ap_positions, dtype=float)
+    distances = rssi_to_distance(np.array(rssi, dtype=float))
+
+    A = -2 * (positions[:-1] - positions[-1])
+    b = distances[:-1]**2 - distances[-1]**2 + np.sum(positions[-1]**2) - np.sum(positions[:-1]**2, axis=1)
+    estimated_position = np.linalg.lstsq(A, b, rcond=None)[0]
+
+    J = np.array([
+        [2 * (estimated_position[0] - x), 2 * (estimated_position[1] - y)]
+        for x, y in positions
+    ])
+    distance_noise = (np.log(10) / (10 * PATH_LOSS_EXPONENT)) * distances * 10
+    R = np.diag(distance_noise ** 2)
+    J_inv = np.linalg.pinv(J.T @ J) @ J.T
+    return estimated_position, J_inv @ R @ J_inv.T
+
+class TestTrilaterateBatch(unittest.TestCase):
+    def setUp(self):
+        self.ap_positions = np.array([[0, 0], [0, 35], [20, 20], [40, 5], [30, 40]], dtype=float)
+        rng = np.random.default_rng(0)
+        self.rssi = rng.uniform(-80, -45, size=(50, len(self.ap_positions)))
+
+    def test_matches_per_fix_solver(self):
+        positions, covs = trilaterate_batch(self.rssi, self.ap_positions)
+
+        self.assertEqual(positions.shape, (50, 2))
+        self.assertEqual(covs.shape, (50, 2, 2))
+        for row, position, cov in zip(self.rssi, positions, covs):
+            expected_position, expected_cov = reference_trilaterate(row, self.ap_positions)
+            self.assertTrue(np.allclose(position, expected_position))
+            self.assertTrue(np.allclose(cov, expected_cov))
+
+    def test_rows_use_their_own_visible_access_points(self):
+        rssi = self.rssi.copy()
+        rssi[::2, 1] = np.nan
+        rssi[1::3, 4] = np.nan
+        positions, covs = trilaterate_batch(rssi, self.ap_positions)
+
+        for row, position, cov in zip(rssi, positions, covs):
+            visible = ~np.isnan(row)
+            expected_position, expected_cov = reference_trilaterate(row[visible], self.ap_positions[visible])
+            self.assertTrue(np.allclose(position, expected_position))
+            self.assertTrue(np.allclose(cov, expected_cov))
+
+    def test_rows_with_fewer_than_three_access_points_are_nan(self):
+        rssi = self.rssi[:2].copy()
+        rssi[0, 2:] = np.nan
+        positions, covs = trilaterate_batch(rssi, self.ap_positions)
+
+        self.assertTrue(np.all(np.isnan(positions[0])))
+        self.assertTrue(np.all(np.isnan(covs[0])))
+        self.assertTrue(np.all(np.isfinite(positions[1])))
+
+    def test_recovers_exact_position_from_noiseless_rssi(self):
+        true_position = np.array([12.0, 17.0])
+        distances = np.linalg.norm(self.ap_positions - true_position, axis=1)
+        rssi = -40 - 10 * PATH_LOSS_EXPONENT * np.log10(distances)
+        positions, _ = trilaterate_batch(rssi[np.newaxis], self.ap_positions)
+
+        self.assertTrue(np.allclose(positions[0], true_position))
+
+class TestAccessPointRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = AccessPointRegistry({
+            "aa:aa:aa:aa:aa:01": ([0, 0], 'AP 1'),
+            "aa:aa:aa:aa:aa:02": ([0, 35], 'AP 2'),
+            "aa:aa:aa:aa:aa:03": ([20, 20], 'AP 3'),
+            "aa:aa:aa:aa:aa:04": ([40, 5], 'AP 4'),
+        })
+
+    def test_assigns_dense_indices(self):
+        self.assertEqual(len(self.registry), 4)
+        self.assertEqual(self.registry.index("aa:aa:aa:aa:aa:03"), 2)
+        self.assertEqual(self.registry.positions.shape, (4, 2))
+        self.assertTrue(self.registry.positions.flags.c_contiguous)
+
+    def test_rssi_vector_ignores_unknown_access_points(self):
+        rssi = self.registry.rssi_vector([
+            {'MAC Address': "aa:aa:aa:aa:aa:02", 'Signal Level (RSSI)': -50.0},
+            {'MAC Address': "ff:ff:ff:ff:ff:ff", 'Signal Level (RSSI)': -60.0},
+        ])
+
+        self.assertTrue(np.array_equal(np.isnan(rssi), [True, False, True, True]))
+        self.assertEqual(rssi[1], -50.0)
+
+    def test_matches_batch_solver_for_each_subset(self):
+        rng = np.random.default_rng(0)
+        rssi = rng.uniform(-80, -45, size=(20, 4))
+        rssi[::3, 0] = np.nan
+        rssi[1::3, 3] = np.nan
+        positions, covs = trilaterate_batch(rssi, self.registry.positions)
+
+        for row, expected_position, expected_cov in zip(rssi, positions, covs):
+            position, cov = self.registry.trilaterate(row)
+            self.assertTrue(np.allclose(position, expected_position))
+            self.assertTrue(np.allclose(cov, expected_cov))
+
+        # Three distinct visible subsets were seen
+        self.assertEqual(self.registry._factorize.cache_info().currsize, 3)
+
+    def test_per_access_point_path_loss_matches_batch_solver(self):
+        rssi_ref = np.array([-35.0, -40.0, -45.0, -38.0])
+        path_loss_exponent = np.array([2.0, 2.5, 3.0, 3.5])
+        rssi = np.array([[-70.0, np.nan, -60.0, -65.0], [-75.0, -55.0, -62.0, -68.0]])
+        positions, covs = trilaterate_batch(rssi, self.registry.positions, rssi_ref, path_loss_exponent)
+
+        for row, expected_position, expected_cov in zip(rssi, positions, covs):
+            position, cov = self.registry.trilaterate(row, rssi_ref=rssi_ref, path_loss_exponent=path_loss_exponent)
+            self.assertTrue(np.allclose(position, expected_position))
+            self.assertTrue(np.allclose(cov, expected_cov))
+
+    def test_raises_with_fewer_than_three_access_points(self):
+        with self.assertRaises(ValueError):
+            self.registry.trilaterate([-50.0, -60.0, np.nan, np.nan])
+
+class TestAccessPointSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        # A 10 x 10 grid of access points 10m apart
+        grid = [[x, y] for x in range(0, 100, 10) for y in range(0, 100, 10)]
+        self.registry = AccessPointRegistry({f"aa:aa:aa:aa:{i // 256:02x}:{i % 256:02x}": (position, f"AP {i}") for i, position in enumerate(grid)})
+        self.index = AccessPointSpatialIndex(self.registry)
+
+    def test_selects_nearby_access_points(self):
+        selected = self.index.select(mean=[42.0, 47.0], cov=np.eye(2), num_access_points=4)
+
+        self.assertEqual(len(selected), 4)
+        self.assertTrue(np.all(np.diff(selected) > 0))
+        distances = np.linalg.norm(self.registry.positions[selected] - [42.0, 47.0], axis=1)
+        self.assertTrue(np.all(distances < 20))
+
+    def test_selection_surrounds_the_device(self):
+        selected = self.index.select(mean=[45.0, 45.0], num_access_points=4)
+        offsets = self.registry.positions[selected] - [45.0, 45.0]
+
+        # Access points on both sides in x and y rather than in a line
+        self.assertTrue(np.any(offsets[:, 0] < 0) and np.any(offsets[:, 0] > 0))
+        self.assertTrue(np.any(offsets[:, 1] < 0) and np.any(offsets[:, 1] > 0))
+
+    def test_only_selects_visible_access_points(self):
+        visible = np.zeros(len(self.registry), dtype=bool)
+        visible[::3] = True
+        selected = self.index.select(mean=[45.0, 45.0], visible=visible)
+
+        self.assertTrue(len(selected) > 0)
+        self.assertTrue(np.all(visible[selected]))
@@ -0,0 +1,175 @@
+from queue import Queue
+import struct
+import time
+
+from scapy.all import RadioTap, Dot11, Dot11Beacon, Dot11Elt
+from access_point_table import AccessPointTable
+from capture import BeaconFrame
+from channel_hopper import NLMSG_ERROR, ChannelScheduler, Nl80211ChannelSwitcher, frequency_to_channel
+from iw_scan import parse_iw_scan
+from wifi_sniffer import WifiSniffer
+
+import unittest
+
+AP_MAC = "aa:bb:cc:dd:ee:ff"
+
+def netlink_message(message_type, sequence, payload=b""):
+    return struct.pack("IHHII", 16 + len(payload), message_type, 0, sequence, 0) + payload + b"\0" * (-len(payload) % 4)
+
+class FakeNetlinkSocket:
+    def __init__(self, replies):
+        self.replies = list(replies)
+
+    def send(self, data):
+        pass
+
+    def recv(self, size):
+        return self.replies.pop(0)
+
+def fake_switcher(replies):
+    switcher = Nl80211ChannelSwitcher.__new__(Nl80211ChannelSwitcher)
+    switcher._socket = FakeNetlinkSocket(replies)
+    switcher._sequence = 0
+    switcher._ifindex = 3
+    switcher._family = 0x1c
+    return switcher
+
+def beacon(sender=AP_MAC, rssi=-42, ssid=b"AP"):
+    packet = RadioTap(present='dBm_AntSignal', dBm_AntSignal=rssi) / \
+             Dot11(type=0, subtype=8, addr1="ff:ff:ff:ff:ff:ff", addr2=sender, addr3=sender) / \
+             Dot11Beacon() / Dot11Elt(ID=0, info=ssid)
+    return RadioTap(bytes(packet))
+
+class TestWifiSniffer(unittest.TestCase):
+    def setUp(self):
+        self.sniffer = WifiSniffer("wlan0", observation_queue=Queue(maxsize=1), log_every=0)
+        self.sniffer.access_point_table.add(AP_MAC, "AP", 2412, -60.0)
+        self.sniffer.running = True
+
+    def test_bpf_filter_only_passes_known_beacons(self):
+        self.assertEqual(self.sniffer.bpf_filter(), f"type mgt subtype beacon and (wlan addr2 {AP_MAC})")
+        self.sniffer.known_macs = []
+        self.assertEqual(self.sniffer.bpf_filter(), "type mgt subtype beacon")
+
+    def test_callbacks_update_table_and_queue(self):
+        for callback in (self.sniffer._packet_callback, self.sniffer._fast_packet_callback):
+            callback(beacon(rssi=-42))
+
+        records = self.sniffer.access_point_table.snapshot()
+        self.assertEqual(records['rssi'][0], -42.0)
+        _, mac, rssi = self.sniffer.observation_queue.get_nowait()
+        self.assertEqual((mac, rssi), (AP_MAC, -42.0))
+
+        # The queue only holds one observation so the second was dropped
+        self.assertEqual(self.sniffer.packets_seen, 2)
+        self.assertEqual(self.sniffer.observations_dropped, 1)
+
+    def test_capture_timestamps_are_rebased_onto_the_monotonic_clock(self):
+        start = time.monotonic()
+        self.sniffer._beacon_frame_callback(BeaconFrame(1.7e9, AP_MAC, -50.0, 2412, "AP"))
+        self.sniffer._beacon_frame_callback(BeaconFrame(1.7e9 + 2.0, AP_MAC, -51.0, 2412, "AP"))
+        self.sniffer._beacon_frame_callback(BeaconFrame(float('nan'), AP_MAC, -52.0, 2412, "AP"))
+
+        records = self.sniffer.access_point_table.snapshot()
+        self.assertGreaterEqual(records['last_updated'][0] - 2.0, start)
+        self.assertLessEqual(records['last_updated'][0] - 2.0, time.monotonic())
+        timestamp, _, _ = self.sniffer.observation_queue.get_nowait()
+        self.assertAlmostEqual(records['last_updated'][0] - timestamp, 2.0)
+
+    def test_fast_callback_ignores_unknown_senders(self):
+        self.sniffer._fast_packet_callback(beacon(sender="11:22:33:44:55:66"))
+
+        self.assertTrue(self.sniffer.observation_queue.empty())
+        self.assertEqual(self.sniffer.packets_seen, 1)
+
+IW_SCAN = """BSS aa:aa:aa:aa:aa:01(on wlan0) -- associated
+\tlast seen: 120 ms ago
+\tfreq: 2437
+\tsignal: -48.00 dBm
+\tSSID: Office
+\tDS Parameter set: channel 6
+BSS aa:aa:aa:aa:aa:02(on wlan0)
+\tfreq: 5180
+\tsignal: -61.00 dBm
+\tSSID: 
+\tHT operation:
+\t\t * primary channel: 36
+BSS aa:aa:aa:aa:aa:03(on wlan0)
+\tfreq: 5180
+\tsignal: -70.00 dBm
+\tSSID: Lab 5G
+\tHT operation:
+\t\t * primary channel: 36
+"""
+
+class TestIwScanParser(unittest.TestCase):
+    def test_parses_each_bss_block(self):
+        access_points = list(parse_iw_scan(IW_SCAN.splitlines(keepends=True)))
+
+        # The hidden SSID is skipped rather than taking the next block's SSID
+        self.assertEqual([ap['MAC Address'] for ap in access_points], ["aa:aa:aa:aa:aa:01", "aa:aa:aa:aa:aa:03"])
+        office, lab = access_points
+        self.assertEqual((office['Frequency'], office['Signal Level (RSSI)'], office['SSID']), (2437, -48.0, "Office"))
+        self.assertEqual((office['Channel'], office['Last Seen (ms)']), (6, 120))
+        self.assertEqual((lab['SSID'], lab['Channel'], lab['Last Seen (ms)']), ("Lab 5G", 36, 0))
+
+class TestChannelScheduler(unittest.TestCase):
+    def setUp(self):
+        self.table = AccessPointTable()
+        self.table.add("aa:aa:aa:aa:aa:01", "AP 1", 2412, -50.0, timestamp=0.0)  # Channel 1
+        self.table.add("aa:aa:aa:aa:aa:02", "AP 2", 2437, -50.0, timestamp=0.0)  # Channel 6
+        self.table.add("aa:aa:aa:aa:aa:03", "AP 3", 5180, -50.0, timestamp=0.0)  # Channel 36
+        self.table.add("ff:ff:ff:ff:ff:ff", "Unknown", 2462, -50.0, timestamp=0.0)  # Channel 11
+
+    def test_frequency_to_channel(self):
+        for frequency, channel in [(2412, 1), (2437, 6), (2484, 14), (5180, 36), (5745, 149), (4920, 184)]:
+            self.assertEqual(frequency_to_channel(frequency), channel)
+
+        # 6GHz channel numbers overlap the other bands', and frequencies that aren't a channel centre have no channel
+        self.assertEqual(frequency_to_channel(5955), 1)
+        self.assertIsNone(frequency_to_channel(5925))
+        self.assertIsNone(frequency_to_channel(2413))
+
+    def test_only_visits_channels_of_known_access_points(self):
+        scheduler = ChannelScheduler(self.table, ["aa:aa:aa:aa:aa:01", "aa:aa:aa:aa:aa:02", "aa:aa:aa:aa:aa:03"])
+        frequencies = {scheduler.next_frequency(now=1.0 + 0.1 * i) for i in range(9)}
+
+        self.assertEqual(frequencies, {2412, 2437, 5180})
+
+    def test_6ghz_access_point_keeps_its_frequency(self):
+        self.table.add("aa:aa:aa:aa:aa:04", "AP 4", 5955, -50.0, timestamp=0.0)  # 6GHz channel 1
+        scheduler = ChannelScheduler(self.table, ["aa:aa:aa:aa:aa:01", "aa:aa:aa:aa:aa:04"])
+        frequencies = {scheduler.next_frequency(now=1.0 + 0.1 * i) for i in range(4)}
+
+        self.assertEqual(frequencies, {2412, 5955})
+
+    def test_prefers_channel_with_stalest_access_point(self):
+        scheduler = ChannelScheduler(self.table, ["aa:aa:aa:aa:aa:01", "aa:aa:aa:aa:aa:02", "aa:aa:aa:aa:aa:03"])
+        self.table.update(self.table.slot("aa:aa:aa:aa:aa:01"), -50.0, timestamp=9.9)
+        self.table.update(self.table.slot("aa:aa:aa:aa:aa:03"), -50.0, timestamp=9.0)
+
+        self.assertEqual(scheduler.next_frequency(now=10.0), 2437)
+
+    def test_silent_access_point_does_not_hold_the_channel(self):
+        scheduler = ChannelScheduler(self.table, ["aa:aa:aa:aa:aa:01", "aa:aa:aa:aa:aa:02"])
+        self.table.update(self.table.slot("aa:aa:aa:aa:aa:02"), -50.0, timestamp=9.0)
+
+        # AP 1 never beacons again, but once its channel was just visited AP 2 is the stalest
+        self.assertEqual(scheduler.next_frequency(now=10.0), 2412)
+        self.assertEqual(scheduler.next_frequency(now=10.1), 2437)
+
+class TestNl80211ChannelSwitcher(unittest.TestCase):
+    def test_waits_for_the_ack_of_its_own_request(self):
+        # A late ACK for an earlier request, then this request's reply and ACK in a later datagram
+        switcher = fake_switcher([netlink_message(NLMSG_ERROR, 0, struct.pack("i", 0)),
+                                  netlink_message(0x1c, 1, b"reply") + netlink_message(NLMSG_ERROR, 1, struct.pack("i", 0))])
+
+        self.assertEqual(switcher._request(0x1c, 2, b"")[16:], b"reply")
+        self.assertEqual(switcher._socket.replies, [])
+
+    def test_error_reply_raises(self):
+        switcher = fake_switcher([netlink_message(NLMSG_ERROR, 1, struct.pack("i", -16))])
+
+        with self.assertRaises(OSError) as raised:
+            switcher.set_frequency(2412)
+        self.assertEqual(raised.exception.errno, 16)
@@ -0,0 +1,179 @@
+import time
+from queue import Empty, Queue
+from typing import Callable
+
+import numpy as np
+
+from access_point_index import AccessPointSpatialIndex
+from calibration import PathLossCalibrator
+from kf import BaseKalmanFilter, ExtendedKalmanFilter2D
+from pf import ParticleFilter2D
+from rssi_filter import RssiFilterBank
+from trilateration import AccessPointRegistry, PATH_LOSS_EXPONENT, RSSI_REF, SIGMA_RSSI, distance_variance, rssi_to_distance
+
+MIN_FRESH_ACCESS_POINTS = 3  # New readings needed since the last fix before trilaterating again
+MAX_RSSI_AGE = 1.0  # Seconds a reading is considered recent enough to trilaterate with
+IDLE_TIMEOUT = 1.0  # Longest a blocked queue read waits before checking whether to stop
+
+class EventDrivenTracker:
+    def __init__(self, registry: AccessPointRegistry,
+                       access_point_index: AccessPointSpatialIndex,
+                       kalman_filter: BaseKalmanFilter | ParticleFilter2D,
+                       observation_queue: Queue | None = None,
+                       start_time: float | None = None,
+                       locate: Callable[[np.ndarray], tuple[np.ndarray, np.ndarray]] | None = None,
+                       calibrator: PathLossCalibrator | None = None,
+                       rssi_filter: RssiFilterBank | None = None) -> None:
+        self._registry = registry
+        self._access_point_index = access_point_index
+        self._kalman_filter = kalman_filter
+        self._observation_queue = observation_queue
+
+        # Alternative position source (e.g. FingerprintLocator.locate) given every recent RSSI in registry order, trilateration
+        # against the best geometry access points when None
+        self._locate = locate
+
+        # Per access point path loss fitted online against the filtered positions, used for trilateration when given
+        self._calibrator = calibrator
+        # The calibrator's (K, ) parameter views, updated in place
+        self._path_loss = {} if calibrator is None else {"rssi_ref": calibrator.rssi_ref, "path_loss_exponent": calibrator.path_loss_exponent}
+
+        # Per access point smoothing of the raw beacon RSSI, whose variance then weights each access point's distance
+        self._rssi_filter = rssi_filter
+
+        # Latest RSSI and time.monotonic() it was heard per registry access point
+        self._rssi = np.full(len(registry), np.nan)
+        self._rssi_time = np.full(len(registry), -np.inf)
+
+        # Time of the filter state and of the last trilateration fix
+        self._time = time.monotonic() if start_time is None else start_time
+        self._last_fix_time = self._time
+        self._last_fix = None
+
+    @property
+    def kalman_filter(self) -> BaseKalmanFilter | ParticleFilter2D:
+        return self._kalman_filter
+
+    @property
+    def time(self) -> float:
+        return self._time
+
+    @property
+    def last_fix(self) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+        # (position, covariance, rssi used) of the latest fix
+        return self._last_fix
+
+    def predict_to(self, timestamp: float) -> None:
+        # Variable dt - the filter is predicted to exactly when the observation arrived
+        dt = timestamp - self._time
+        if dt > 0:
+            self._kalman_filter.predict(dt)
+            self._time = timestamp
+
+    def process(self, timestamp: float, mac: str, rssi: float) -> bool:
+        # Returns True when the observation completed a fresh set (or for an ExtendedKalmanFilter2D or ParticleFilter2D, any
+        # observation) and the filter was updated
+        if mac not in self._registry:
+            return False
+
+        index = self._registry.index(mac)
+        if timestamp < self._rssi_time[index]:
+            # A newer reading from this access point has already been processed
+            return False
+        if self._rssi_filter is not None:
+            rssi = self._rssi_filter.update(index, rssi, timestamp)
+        self._rssi[index] = rssi
+        self._rssi_time[index] = timestamp
+        self.predict_to(timestamp)
+        if isinstance(self._kalman_filter, ParticleFilter2D):
+            return self._update_rssi(index, timestamp)
+        if isinstance(self._kalman_filter, ExtendedKalmanFilter2D):
+            return self._update_range(index, timestamp)
+
+        recent = self._rssi_time > timestamp - MAX_RSSI_AGE
+        fresh = recent & (self._rssi_time > self._last_fix_time)
+        if np.count_nonzero(fresh) < MIN_FRESH_ACCESS_POINTS:
+            return False
+
+        rssi_vector = np.where(recent, self._rssi, np.nan)
+        try:
+            if self._locate is not None:
+                position, cov = self._locate(rssi_vector)
+            else:
+                selected = self._access_point_index.select(self._kalman_filter.mean, self._kalman_filter.cov, visible=recent)
+                rssi_vector[np.setdiff1d(np.arange(len(rssi_vector)), selected)] = np.nan
+                sigma_rssi = SIGMA_RSSI if self._rssi_filter is None else self._rssi_filter.std
+                position, cov = self._registry.trilaterate(rssi_vector, sigma_rssi, **self._path_loss)
+        except ValueError:
+            # Not enough of the recent access points are in range of the current estimate
+            return False
+
+        # Observations relayed late (e.g. from another sniffer) are retrodicted into the filter's history when it keeps one
+        lag = self._time - timestamp
+        if lag > 0 and self._kalman_filter.history_size > 0:
+            if not self._kalman_filter.update_delayed(position, cov, lag):
+                return False
+        else:
+            self._kalman_filter.update(position, cov)
+        self._last_fix_time = max(self._last_fix_time, timestamp)
+        self._last_fix = (position, cov, rssi_vector)
+        if self._calibrator is not None:
+            self._calibrate(np.where(recent, self._rssi, np.nan))
+        return True
+
+    def _update_range(self, index: int, timestamp: float) -> bool:
+        # Tightly coupled - this access point's range goes straight into the filter, no trilateration fix is needed
+        if self._calibrator is not None:
+            rssi_ref, path_loss_exponent = self._calibrator.parameters[index]
+        else:
+            rssi_ref, path_loss_exponent = RSSI_REF, PATH_LOSS_EXPONENT
+        sigma_rssi = SIGMA_RSSI if self._rssi_filter is None else self._rssi_filter.std[index]
+        distance = rssi_to_distance(self._rssi[index], rssi_ref, path_loss_exponent)
+        variance = distance_variance(distance, path_loss_exponent, sigma_rssi)
+
+        ap_position = self._registry.positions[index]
+        lag = self._time - timestamp
+        if lag > 0 and self._kalman_filter.history_size > 0:
+            if not self._kalman_filter.update_range_delayed(ap_position, distance, variance, lag):
+                return False
+        elif not self._kalman_filter.update_range(ap_position, distance, variance):
+            return False
+        self._single_access_point_fix(index, timestamp)
+        return True
+
+    def _update_rssi(self, index: int, timestamp: float) -> bool:
+        # Particle filters weigh this access point's RSSI directly, its noise is Gaussian in dBm where a range's isn't
+        rssi_vector = np.full(len(self._rssi), np.nan)
+        rssi_vector[index] = self._rssi[index]
+        sigma_rssi = SIGMA_RSSI if self._rssi_filter is None else self._rssi_filter.std
+        self._kalman_filter.update_rssi(rssi_vector, self._registry.positions, sigma_rssi=sigma_rssi, **self._path_loss)
+        self._single_access_point_fix(index, timestamp)
+        return True
+
+    def _single_access_point_fix(self, index: int, timestamp: float) -> None:
+        # Bookkeeping after a range or RSSI update from one access point, its RSSI alone is the fix's
+        rssi_vector = np.full(len(self._rssi), np.nan)
+        rssi_vector[index] = self._rssi[index]
+        self._last_fix_time = max(self._last_fix_time, timestamp)
+        self._last_fix = (self._kalman_filter.mean[:2], self._kalman_filter.cov[:2, :2], rssi_vector)
+        if self._calibrator is not None:
+            self._calibrate(rssi_vector)
+
+    def _calibrate(self, rssi: np.ndarray) -> None:
+        # Every recent RSSI against its access point's distance from the filtered (not the raw fix) position
+        self._calibrator.update_from_estimate(rssi, self._registry.positions, self._kalman_filter.mean, self._kalman_filter.cov)
+
+    def run(self, end_time: float, on_update: Callable[["EventDrivenTracker"], None] | None = None) -> None:
+        # Blocks on the queue until end_time (time.monotonic()), so no CPU is used while no beacons arrive
+        while True:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                break
+
+            try:
+                timestamp, mac, rssi = self._observation_queue.get(timeout=min(IDLE_TIMEOUT, remaining))
+            except Empty:
+                continue
+
+            if self.process(timestamp, mac, rssi) and on_update is not None:
+                on_update(self)
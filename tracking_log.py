@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+# File layout: MAGIC, header length (uint32), JSON header (record dtype and access point labels) padded to HEADER_ALIGNMENT,
+# then raw fixed size records appended chunk by chunk. Nothing is ever rewritten, so a crash loses at most the unflushed chunk
+MAGIC = b"WIFILOG1"
+HEADER_ALIGNMENT = 64
+
+CHUNK_RECORDS = 1024  # Records buffered in memory between flushes
+FLUSH_INTERVAL = 5.0  # Longest records are held before flushing (s)
+
+def tracking_log_dtype(num_access_points: int) -> np.dtype:
+    return np.dtype([
+        ('timestamp', np.float64),
+        ('x', np.float64),
+        ('y', np.float64),
+        ('cov', np.float64, (2, 2)),
+        ('distances', np.float32, (num_access_points,)),  # m, NaN for access points without a distance
+    ])
+
+class TrackingLogWriter:
+    def __init__(self, path: str, access_points: list[str],
+                       chunk_records: int = CHUNK_RECORDS,
+                       flush_interval: float = FLUSH_INTERVAL) -> None:
+        self._path = path
+        self._access_points = list(access_points)
+        self._buffer = np.zeros(chunk_records, dtype=tracking_log_dtype(len(self._access_points)))
+        self._buffered = 0
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        self.records_written = 0
+
+        header = json.dumps({"access_points": self._access_points, "dtype": self._buffer.dtype.descr}).encode()
+        header += b" " * (-(len(MAGIC) + 4 + len(header)) % HEADER_ALIGNMENT)
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self._file.flush()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def access_points(self) -> list[str]:
+        return self._access_points
+
+    def append(self, timestamp: float, x: float, y: float, cov: np.ndarray, distances: np.ndarray | dict | None = None) -> None:
+        # distances are either in access point order or keyed by access point label
+        record = self._buffer[self._buffered]
+        record['timestamp'] = timestamp
+        record['x'] = x
+        record['y'] = y
+        record['cov'] = cov
+        if isinstance(distances, dict):
+            record['distances'] = [distances.get(access_point, np.nan) for access_point in self._access_points]
+        else:
+            record['distances'] = np.nan if distances is None else distances
+        self._buffered += 1
+
+        if self._buffered == len(self._buffer) or time.monotonic() - self._last_flush > self._flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffered:
+            self._file.write(self._buffer[:self._buffered].tobytes())
+            self.records_written += self._buffered
+            self._buffered = 0
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self) -> "TrackingLogWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def read_tracking_log(path: str) -> tuple[np.ndarray, list[str]]:
+    # Memory maps the records (nothing is read until it's used), returns (records, access point labels)
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a tracking log")
+        (header_length,) = struct.unpack("<I", file.read(4))
+        header = json.loads(file.read(header_length))
+
+    dtype = np.dtype([tuple(field) for field in header["dtype"]])
+    offset = len(MAGIC) + 4 + header_length
+    # A partially written final record (crash mid flush) is ignored
+    num_records = (os.path.getsize(path) - offset) // dtype.itemsize
+    if num_records == 0:
+        return np.zeros(0, dtype=dtype), header["access_points"]
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(num_records,)), header["access_points"]
+
+def tracking_log_to_csv(path: str, csv_path: str) -> None:
+    # The original CSV layout - timestamp, x, y and a distance column per access point
+    import pandas as pd
+
+    records, access_points = read_tracking_log(path)
+    columns = {"timestamp": records['timestamp'], "x": records['x'], "y": records['y']}
+    columns.update({access_point: records['distances'][:, i] for i, access_point in enumerate(access_points)})
+    pd.DataFrame(columns).to_csv(csv_path, index=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise a binary tracking log, optionally exporting it to CSV")
+    parser.add_argument("path")
+    parser.add_argument("--csv", default=None, help="CSV file to export to")
+    args = parser.parse_args()
+
+    records, access_points = read_tracking_log(args.path)
+    print(f"{len(records)} records, access points: {', '.join(access_points)}")
+    if len(records):
+        print(f"Timestamps {records['timestamp'][0]:.3f} to {records['timestamp'][-1]:.3f}")
+    if args.csv is not None:
+        tracking_log_to_csv(args.path, args.csv)
+        print(f"Data saved to {args.csv}")
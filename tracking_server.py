@@ -0,0 +1,280 @@
+import argparse
+import asyncio
+import json
+import math
+import time
+
+import numpy as np
+
+from access_point_index import AccessPointSpatialIndex
+from kf import ACCELERATION_VARIANCE, KalmanFilter2D, OOSM_HISTORY_SIZE
+from rssi_filter import RssiFilterBank
+from tracker import EventDrivenTracker
+from trilateration import AccessPointRegistry, PATH_LOSS_EXPONENT, RSSI_REF
+
+# Messages are newline delimited JSON
+#   sniffer -> server: {"type": "observations", "observations": [[timestamp, device MAC, AP MAC, RSSI], ...]}
+#   client  -> server: {"type": "query", "device": MAC} (omit device for every tracked device)
+#   server  -> client: {"type": "positions", "positions": {MAC: {"x": ..., "y": ..., "cov": [[...]], "time": ...}}}
+#   server  -> client: {"type": "error", "error": ...} for a batch that was rejected
+HOST = '127.0.0.1'
+PORT = 8765
+
+MAX_QUEUED_BATCHES = 256  # Readers stop reading their sockets (TCP backpressure) once this many batches are waiting
+MAX_LINE_BYTES = 4 * 1024 * 1024
+BATCH_SIZE = 256  # Observations per message sent by a sniffer client
+BATCH_INTERVAL = 0.05  # Longest a sniffer client holds observations before sending (s)
+
+def validate_observations(observations) -> list:
+    # Raises ValueError unless every observation is [timestamp, device MAC, AP MAC, RSSI], so one bad batch is rejected
+    # whole before it reaches the worker
+    if not isinstance(observations, list):
+        raise ValueError(f"Observations must be a list, got {type(observations).__name__}")
+    for observation in observations:
+        if not isinstance(observation, list) or len(observation) != 4:
+            raise ValueError(f"Malformed observation {observation!r}")
+        timestamp, device, mac, rssi = observation
+        if not isinstance(device, str) or not isinstance(mac, str):
+            raise ValueError(f"Malformed observation {observation!r}")
+        # json.loads accepts NaN and Infinity, a NaN timestamp would stop the device's tracker ever updating again
+        if any(isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) for value in (timestamp, rssi)):
+            raise ValueError(f"Malformed observation {observation!r}")
+    return observations
+
+class TrackingServer:
+    def __init__(self, registry: AccessPointRegistry, max_queued_batches: int = MAX_QUEUED_BATCHES) -> None:
+        self._registry = registry
+        self._access_point_index = AccessPointSpatialIndex(registry)
+        self._batches = asyncio.Queue(maxsize=max_queued_batches)
+        self._trackers = {}
+        self._server = None
+        self._worker = None
+
+        self.observations_processed = 0
+        self.fixes = 0
+
+    def _tracker(self, device: str, timestamp: float) -> EventDrivenTracker:
+        tracker = self._trackers.get(device)
+        if tracker is None:
+            # New devices start at the centre of the access points with the default (large) uncertainty
+            x, y = self._registry.positions.mean(axis=0)
+            kalman_filter = KalmanFilter2D(initial_x=x,
+                                           initial_y=y,
+                                           initial_v_x=0.0,
+                                           initial_v_y=0.0,
+                                           acceleration_variance=ACCELERATION_VARIANCE,
+                                           fast_update=True,
+                                           history_size=OOSM_HISTORY_SIZE)
+            tracker = EventDrivenTracker(self._registry, self._access_point_index, kalman_filter, start_time=timestamp,
+                                         rssi_filter=RssiFilterBank(len(self._registry)))
+            self._trackers[device] = tracker
+        return tracker
+
+    def process_batch(self, observations: list) -> None:
+        for timestamp, device, mac, rssi in observations:
+            if self._tracker(device, timestamp).process(timestamp, mac, rssi):
+                self.fixes += 1
+        self.observations_processed += len(observations)
+
+    def positions(self, device: str | None = None) -> dict:
+        devices = self._trackers.keys() if device is None else [device] if device in self._trackers else []
+        positions = {}
+        for mac in devices:
+            kalman_filter = self._trackers[mac].kalman_filter
+            positions[mac] = {"x": kalman_filter.pos_x,
+                              "y": kalman_filter.pos_y,
+                              "cov": kalman_filter.cov[:2, :2].tolist(),
+                              "time": self._trackers[mac].time}
+        return positions
+
+    async def _process_batches(self) -> None:
+        while True:
+            item = await self._batches.get()
+            try:
+                if isinstance(item, asyncio.Future):
+                    # A query's marker, every batch queued before it has been applied
+                    if not item.done():
+                        item.set_result(None)
+                else:
+                    self.process_batch(item)
+            except Exception as error:
+                # Batches are validated on arrival, but the worker must outlive any it can't process or queries never return
+                print(f"Dropping batch: {error!r}")
+            finally:
+                self._batches.task_done()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if not isinstance(message, dict):
+                    raise TypeError(f"Messages must be JSON objects, got {type(message).__name__}")
+                if message["type"] == "observations":
+                    try:
+                        observations = validate_observations(message["observations"])
+                    except ValueError as error:
+                        writer.write(json.dumps({"type": "error", "error": str(error)}).encode() + b"\n")
+                        await writer.drain()
+                        continue
+                    # Waits while the queue is full, which stops this client's socket being read
+                    await self._batches.put(observations)
+                elif message["type"] == "query":
+                    # Answer once everything received before the query has been applied. Only those batches are waited
+                    # for, queue.join() would also wait on every batch other clients keep sending under sustained load
+                    applied = asyncio.get_running_loop().create_future()
+                    await self._batches.put(applied)
+                    await applied
+                    response = {"type": "positions", "positions": self.positions(message.get("device"))}
+                    writer.write(json.dumps(response).encode() + b"\n")
+                    await writer.drain()
+        except (ConnectionError, json.JSONDecodeError, KeyError, TypeError, ValueError) as error:
+            print(f"Dropping client: {error!r}")
+        finally:
+            writer.close()
+
+    async def start(self, host: str = HOST, port: int = PORT) -> None:
+        self._worker = asyncio.create_task(self._process_batches())
+        self._server = await asyncio.start_server(self._handle_client, host, port, limit=MAX_LINE_BYTES)
+        print(f"Tracking server listening on {host}:{self.port}")
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+        self._worker.cancel()
+
+class SnifferClient:
+    def __init__(self, host: str = HOST, port: int = PORT,
+                       batch_size: int = BATCH_SIZE,
+                       batch_interval: float = BATCH_INTERVAL) -> None:
+        self._host = host
+        self._port = port
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._batch = []
+        self._last_flush = time.monotonic()
+        self._reader = None
+        self._writer = None
+        self.errors = []  # Messages of the server's rejected batch replies
+
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self._host, self._port, limit=MAX_LINE_BYTES)
+
+    async def send(self, timestamp: float, device: str, mac: str, rssi: float) -> None:
+        # Observations are batched per client and sent when the batch fills or gets old
+        self._batch.append([timestamp, device, mac, rssi])
+        if len(self._batch) >= self._batch_size or time.monotonic() - self._last_flush > self._batch_interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self._batch:
+            self._writer.write(json.dumps({"type": "observations", "observations": self._batch}).encode() + b"\n")
+            self._batch = []
+        self._last_flush = time.monotonic()
+        # Blocks while the server isn't reading (backpressure)
+        await self._writer.drain()
+
+    async def query(self, device: str | None = None) -> dict:
+        await self.flush()
+        message = {"type": "query"} if device is None else {"type": "query", "device": device}
+        self._writer.write(json.dumps(message).encode() + b"\n")
+        await self._writer.drain()
+        while True:
+            response = json.loads(await self._reader.readline())
+            if response["type"] != "error":
+                return response["positions"]
+            self.errors.append(response["error"])
+
+    async def close(self) -> None:
+        await self.flush()
+        self._writer.close()
+        await self._writer.wait_closed()
+
+class FakeSnifferClient(SnifferClient):
+    def __init__(self, registry: AccessPointRegistry,
+                       num_devices: int,
+                       seed: int,
+                       sigma_rssi: float = 2.0,
+                       **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._registry = registry
+        self._rng = np.random.default_rng(seed)
+        self._sigma_rssi = sigma_rssi
+        self._devices = [f"fe:{seed % 256:02x}:00:00:{i // 256:02x}:{i % 256:02x}" for i in range(num_devices)]
+
+        # Devices random walk inside the bounding box of the access points
+        self._low = registry.positions.min(axis=0)
+        self._high = registry.positions.max(axis=0)
+        self._positions = self._rng.uniform(self._low, self._high, size=(num_devices, 2))
+
+    @property
+    def devices(self) -> list[str]:
+        return self._devices
+
+    async def run(self, duration: float, rate: float) -> int:
+        # Each device hears `rate` beacons per second from random access points, returns observations sent
+        sent = 0
+        end_time = time.monotonic() + duration
+        while time.monotonic() < end_time:
+            tick_start = time.monotonic()
+            self._positions = np.clip(self._positions + self._rng.normal(scale=0.05, size=self._positions.shape), self._low, self._high)
+            aps = self._rng.integers(len(self._registry), size=len(self._devices))
+            distances = np.maximum(np.linalg.norm(self._positions - self._registry.positions[aps], axis=1), 0.1)
+            rssis = RSSI_REF - 10 * PATH_LOSS_EXPONENT * np.log10(distances) + self._rng.normal(scale=self._sigma_rssi, size=len(aps))
+
+            timestamp = time.time()
+            for device, ap, rssi in zip(self._devices, aps, rssis):
+                await self.send(timestamp, device, self._registry.macs[ap], float(rssi))
+            sent += len(self._devices)
+
+            await asyncio.sleep(max(0.0, 1.0 / rate - (time.monotonic() - tick_start)))
+        await self.flush()
+        return sent
+
+async def load_test(registry: AccessPointRegistry, num_clients: int, num_devices: int, duration: float, rate: float) -> None:
+    server = TrackingServer(registry)
+    await server.start(port=0)
+
+    clients = [FakeSnifferClient(registry, num_devices, seed=seed, port=server.port) for seed in range(num_clients)]
+    for client in clients:
+        await client.connect()
+
+    start = time.monotonic()
+    sent = sum(await asyncio.gather(*(client.run(duration, rate) for client in clients)))
+    positions = await clients[0].query()
+    elapsed = time.monotonic() - start
+
+    print(f"{num_clients} clients sent {sent} observations in {elapsed:.1f}s ({sent / elapsed:.0f}/s)")
+    print(f"Server processed {server.observations_processed} observations, {server.fixes} fixes, tracking {len(positions)} devices")
+
+    for client in clients:
+        await client.close()
+    await server.stop()
+
+if __name__ == "__main__":
+    from main import access_point_known_positions
+
+    parser = argparse.ArgumentParser(description="Central tracking server for multiple WiFi sniffers")
+    parser.add_argument("mode", choices=["serve", "load-test"])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--clients", type=int, default=4, help="Fake sniffers for load-test")
+    parser.add_argument("--devices", type=int, default=250, help="Devices per fake sniffer for load-test")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run load-test for")
+    parser.add_argument("--rate", type=float, default=10.0, help="Beacons per device per second for load-test")
+    args = parser.parse_args()
+
+    registry = AccessPointRegistry(access_point_known_positions)
+
+    async def serve():
+        server = TrackingServer(registry)
+        await server.start(args.host, args.port)
+        await asyncio.Event().wait()
+
+    if args.mode == "serve":
+        asyncio.run(serve())
+    else:
+        asyncio.run(load_test(registry, args.clients, args.devices, args.duration, args.rate))
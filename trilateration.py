@@ -0,0 +1,183 @@
+from functools import lru_cache
+
+import numpy as np
+
+# Constants for RSSI to distance conversion - ML could learn accurate values or fit regression to real data
+RSSI_REF = -40  # Reference RSSI at 1m
+PATH_LOSS_EXPONENT = 3  # Typical values range from 2 to 4
+SIGMA_RSSI = 10  # Estimated RSSI noise in dBm
+
+# Above this condition number a 2x2 normal matrix is treated as singular and pseudo-inverted instead
+MAX_NORMAL_CONDITION = 1e12
+
+# Number of visible access point combinations whose least squares factorization is kept
+SUBSET_CACHE_SIZE = 1024
+
+def rssi_to_distance(rssi, rssi_ref=RSSI_REF, path_loss_exponent=PATH_LOSS_EXPONENT):
+    return 10 ** ((rssi_ref - rssi) / (10 * path_loss_exponent))
+
+def distance_variance(distances, path_loss_exponent=PATH_LOSS_EXPONENT, sigma_rssi=SIGMA_RSSI):
+    # Variance of an RSSI-derived distance from the RSSI noise, linearised: dd/drssi = -ln(10) d / (10 n)
+    return ((np.log(10) / (10 * path_loss_exponent)) * distances * sigma_rssi) ** 2
+
+def _inverse_2x2(A: np.ndarray) -> np.ndarray:
+    # Analytic inverse of a stack of 2x2 matrices (M, 2, 2), cond(A) estimated as ||A||_F^2 / |det(A)|
+    a, b, c, d = A[:, 0, 0], A[:, 0, 1], A[:, 1, 0], A[:, 1, 1]
+    det = a * d - b * c
+    well_conditioned = np.abs(det) * MAX_NORMAL_CONDITION > np.sum(A ** 2, axis=(1, 2))
+
+    safe_det = np.where(well_conditioned, det, 1.0)
+    A_inv = np.stack([np.stack([d, -b], axis=-1), np.stack([-c, a], axis=-1)], axis=1) / safe_det[:, np.newaxis, np.newaxis]
+
+    # Pseudo-inverse only the (rare) singular ones for stability
+    singular = ~well_conditioned & np.all(np.isfinite(A), axis=(1, 2))
+    if np.any(singular):
+        A_inv[singular] = np.linalg.pinv(A[singular])
+    return A_inv
+
+def _position_covariance(estimated_positions: np.ndarray,
+                         ap_positions: np.ndarray,
+                         visible: np.ndarray,
+                         distances: np.ndarray,
+                         path_loss_exponent,
+                         sigma_rssi) -> np.ndarray:
+    # Compute Jacobian, zero for missing access points
+    J = 2 * (estimated_positions[:, np.newaxis] - ap_positions[np.newaxis])
+    J *= visible[:, :, np.newaxis]
+
+    # Measurement noise covariance (assuming small Gaussian noise on RSSI-derived distances)
+    R = np.where(visible, distance_variance(distances, path_loss_exponent, sigma_rssi), 0.0)
+
+    # cov = J_inv R J_invt with J_inv = (Jt J)^-1 Jt
+    JtJ_inv = _inverse_2x2(np.einsum('mki,mkj->mij', J, J))
+    JtRJ = np.einsum('mki,mk,mkj->mij', J, R, J)
+    return JtJ_inv @ JtRJ @ JtJ_inv.transpose(0, 2, 1)
+
+def trilaterate_batch(rssi: np.ndarray,
+                      ap_positions: np.ndarray,
+                      rssi_ref=RSSI_REF,
+                      path_loss_exponent=PATH_LOSS_EXPONENT,
+                      sigma_rssi=SIGMA_RSSI) -> tuple[np.ndarray, np.ndarray]:
+    # rssi is (M, K) for M devices/epochs and K known access points at ap_positions (K, 2), NaN where not heard
+    # rssi_ref, path_loss_exponent can be per AP (K, ) and sigma_rssi per measurement (M, K)
+    # Returns positions (M, 2) and covariances (M, 2, 2), NaN for rows with fewer than three access points
+    rssi = np.atleast_2d(np.asarray(rssi, dtype=float))
+    ap_positions = np.asarray(ap_positions, dtype=float)
+    num_rows, num_aps = rssi.shape
+
+    visible = ~np.isnan(rssi)
+    distances = np.where(visible, rssi_to_distance(rssi, rssi_ref, path_loss_exponent), 0.0)
+
+    # Per row, subtract the last visible access point's circle equation from the others (as in main.trilaterate)
+    reference = num_aps - 1 - np.argmax(visible[:, ::-1], axis=1)
+    rows = np.arange(num_rows)
+    reference_positions = ap_positions[reference]
+    reference_distances = distances[rows, reference]
+
+    # Constructing A and b for least squares Ax = b, rows of missing access points (and the reference) are zero
+    A = -2 * (ap_positions[np.newaxis] - reference_positions[:, np.newaxis])
+    A *= visible[:, :, np.newaxis]
+    b = distances**2 - reference_distances[:, np.newaxis]**2 + np.sum(reference_positions**2, axis=1)[:, np.newaxis] - np.sum(ap_positions**2, axis=1)[np.newaxis]
+    b *= visible
+
+    # Least squares via the stacked normal equations (At A) x = At b
+    AtA = np.einsum('mki,mkj->mij', A, A)
+    Atb = np.einsum('mki,mk->mi', A, b)
+    estimated_positions = np.einsum('mij,mj->mi', _inverse_2x2(AtA), Atb)
+
+    covs = _position_covariance(estimated_positions, ap_positions, visible, distances, path_loss_exponent, sigma_rssi)
+
+    too_few = np.sum(visible, axis=1) < 3
+    estimated_positions[too_few] = np.nan
+    covs[too_few] = np.nan
+    return estimated_positions, covs
+
+class AccessPointRegistry:
+    def __init__(self, access_point_known_positions: dict) -> None:
+        # access_point_known_positions maps MAC -> ([x, y], SSID) as in main.py, MACs get dense indices in insertion order
+        self._macs = list(access_point_known_positions.keys())
+        self._indices = {mac: index for index, mac in enumerate(self._macs)}
+        self._ssids = [ssid for _, ssid in access_point_known_positions.values()]
+        self._positions = np.ascontiguousarray([position for position, _ in access_point_known_positions.values()], dtype=float)
+        self._positions.setflags(write=False)
+        self._squared_norms = np.sum(self._positions**2, axis=1)
+
+        # LRU cache of visible subset (sorted tuple of indices) -> factorization, per registry
+        self._factorize = lru_cache(maxsize=SUBSET_CACHE_SIZE)(self._factorize_subset)
+
+    def __len__(self) -> int:
+        return len(self._macs)
+
+    def __contains__(self, mac: str) -> bool:
+        return mac in self._indices
+
+    def index(self, mac: str) -> int:
+        return self._indices[mac]
+
+    @property
+    def macs(self) -> list[str]:
+        return self._macs
+
+    @property
+    def ssids(self) -> list[str]:
+        return self._ssids
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self._positions
+
+    def rssi_vector(self, access_points) -> np.ndarray:
+        # (K, ) RSSI in registry order from sniffer access point dicts, NaN for unknown/unheard access points
+        rssi = np.full(len(self), np.nan)
+        for ap in access_points:
+            index = self._indices.get(ap['MAC Address'])
+            if index is not None:
+                rssi[index] = ap['Signal Level (RSSI)']
+        return rssi
+
+    def indices(self, macs: list[str]) -> np.ndarray:
+        # Registry index for each MAC, -1 for unknown access points
+        return np.array([self._indices.get(mac, -1) for mac in macs], dtype=int)
+
+    def _factorize_subset(self, subset: tuple[int, ...]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # The last access point in the subset is the reference, as in trilaterate_batch
+        subset = np.array(subset)
+        positions = self._positions[subset]
+        A = -2 * (positions[:-1] - positions[-1])
+        A_pinv = np.linalg.pinv(A)
+        b_offset = self._squared_norms[subset[-1]] - self._squared_norms[subset[:-1]]
+        for array in (subset, A_pinv, b_offset):
+            array.setflags(write=False)
+        return subset, A_pinv, b_offset
+
+    def trilaterate(self, rssi: np.ndarray,
+                          sigma_rssi=SIGMA_RSSI,
+                          rssi_ref=RSSI_REF,
+                          path_loss_exponent=PATH_LOSS_EXPONENT) -> tuple[np.ndarray, np.ndarray]:
+        # Single fix from a (K, ) RSSI vector in registry order, NaN for unheard access points
+        # sigma_rssi, rssi_ref, path_loss_exponent can be per AP (K, ), e.g. an RssiFilterBank's std or a PathLossCalibrator's fits
+        rssi = np.asarray(rssi, dtype=float)
+        visible = ~np.isnan(rssi)
+        if np.count_nonzero(visible) < 3:
+            raise ValueError("At least three access points are required for 2D trilateration")
+
+        subset, A_pinv, b_offset = self._factorize(tuple(np.flatnonzero(visible)))
+        if np.ndim(sigma_rssi) > 0:
+            sigma_rssi = sigma_rssi[subset]
+        if np.ndim(rssi_ref) > 0:
+            rssi_ref = rssi_ref[subset]
+        if np.ndim(path_loss_exponent) > 0:
+            path_loss_exponent = path_loss_exponent[subset]
+        distances = rssi_to_distance(rssi[subset], rssi_ref, path_loss_exponent)
+
+        # Least squares x = A^+ b with only b depending on the measurements
+        b = distances[:-1]**2 - distances[-1]**2 + b_offset
+        estimated_position = A_pinv.dot(b)
+
+        cov = _position_covariance(estimated_position[np.newaxis],
+                                   self._positions[subset],
+                                   np.ones((1, len(subset)), dtype=bool),
+                                   distances[np.newaxis],
+                                   path_loss_exponent,
+                                   sigma_rssi)
+        return estimated_position, cov[0]
@@ -1,56 +1,123 @@
+import math
 import os
-import re
 import subprocess
+import tempfile
 import time
-from datetime import datetime
+from queue import Full, Queue
 from threading import Thread, Event
 
 from scapy.all import sniff, Dot11Beacon, Dot11ProbeReq, Dot11ProbeResp
 
+from access_point_table import AccessPointTable
+from capture import BeaconFrame, CaptureSource
+from channel_hopper import DWELL_SECONDS, ChannelScheduler, channel_switcher
+from iw_scan import parse_iw_scan
+
+RATE_WINDOW_SECONDS = 1.0  # Packets per second is measured over windows of this length
+
 class WifiSniffer:
-    def __init__(self, interface):
-        self._access_points = {}
+    def __init__(self, interface,
+                       observation_queue: Queue | None = None,
+                       fast_capture: bool = False,
+                       known_macs: list[str] | None = None,
+                       log_every: int = 1,
+                       adaptive_hopping: bool = False,
+                       capture_source: CaptureSource | None = None):
+        self._access_points = AccessPointTable()
         self.interface = interface
+        # Optional queue of (time.monotonic(), MAC, RSSI) beacon observations for event-driven tracking
+        self.observation_queue = observation_queue
+        # Fast capture has the kernel filter to beacons from known_macs (default every looked up AP) and skips dissection
+        self.fast_capture = fast_capture
+        self.known_macs = known_macs
+        # Print every n-th beacon/probe packet, 0 to disable
+        self.log_every = log_every
+        # Only hop to channels hosting known access points, staying longest where RSSI is stalest
+        self.adaptive_hopping = adaptive_hopping
+        # Read beacons from this source (e.g. a pcap replay) instead of sniffing the interface live
+        self.capture_source = capture_source
+        # Capture timestamps (pcap epoch seconds) are rebased onto time.monotonic() at the first timestamped frame, so the
+        # access point table and observations keep one clock. The last rebased time stands in for frames without one
+        self._capture_offset = None
+        self._last_capture_time = None
         self.running = False
         self.stop_event = Event()
+
+        # Sniffer saturation counters
+        self.packets_seen = 0
+        self.observations_dropped = 0
+        self._packets_per_second = 0.0
+        self._rate_window_start = time.monotonic()
+        self._rate_window_packets = 0
     
     @property
     def access_points(self) -> dict:
+        # Dict copy of a consistent snapshot, use access_point_table.snapshot() in hot loops
+        return self._access_points.as_dicts()
+
+    @property
+    def access_point_table(self) -> AccessPointTable:
         return self._access_points
+
+    @property
+    def packets_per_second(self) -> float:
+        # Rate over the last complete window
+        return self._packets_per_second
+
+    def bpf_filter(self) -> str:
+        # Management beacon frames transmitted by the known access points only
+        macs = self.known_macs if self.known_macs is not None else self._access_points.macs
+        if not macs:
+            return "type mgt subtype beacon"
+        return "type mgt subtype beacon and (" + " or ".join(f"wlan addr2 {mac}" for mac in macs) + ")"
+
+    def _count_packet(self, timestamp: float) -> None:
+        self.packets_seen += 1
+        self._rate_window_packets += 1
+        elapsed = timestamp - self._rate_window_start
+        if elapsed >= RATE_WINDOW_SECONDS:
+            self._packets_per_second = self._rate_window_packets / elapsed
+            self._rate_window_start = timestamp
+            self._rate_window_packets = 0
+
+    def _publish(self, timestamp: float, sender: str, rssi: float) -> None:
+        if self.observation_queue is not None:
+            try:
+                self.observation_queue.put_nowait((timestamp, sender, rssi))
+            except Full:
+                self.observations_dropped += 1 # Tracker is behind, drop rather than block the capture thread
+
+    def _log(self, message: str) -> None:
+        if self.log_every and self.packets_seen % self.log_every == 0:
+            print(message)
     
     def get_wifi_info(self):
-        # Run the iwlist command to scan for networks
+        # Run the iw command to scan for networks, parsing each BSS as it's printed
         print(f"Running 'iw dev {self.interface} scan' subprocess")
-        result = subprocess.run(['iw', 'dev', self.interface, 'scan'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        # stderr goes to a file rather than a pipe, an unread pipe filling up would block iw before stdout closes
+        with tempfile.TemporaryFile(mode='w+') as errors:
+            process = subprocess.Popen(['iw', 'dev', self.interface, 'scan'], stdout=subprocess.PIPE, stderr=errors, text=True)
+            networks = []
 
-        if result.returncode != 0:
-            print(f"Error: {result.stderr}")
-            return
+            for ap_info in parse_iw_scan(process.stdout):
+                # Last seen is how long before the scan finished the access point was heard
+                timestamp = time.monotonic() - ap_info['Last Seen (ms)'] / 1000
+                self._access_points.add(ap_info['MAC Address'], ap_info['SSID'], ap_info['Frequency'], ap_info['Signal Level (RSSI)'], timestamp)
+                networks.append(ap_info)
+                print(f"[Lookup   ]: RSSI: {ap_info['Signal Level (RSSI)']} dBm, Sender: {ap_info['MAC Address']}, SSID: {ap_info['SSID']}, Channel: {ap_info['Channel']}")
 
-        # Use regex to find Frequency for each AP
-        scan_data = result.stdout
-        networks = []
-
-        # Regex pattern to extract information
-        ap_pattern = r"(?s)BSS ([0-9a-f:]+).*?freq: (\d+).*?signal: (-?\d+.\d+) dBm.*?SSID: *([^\r\n]*\S)"
-
-        matches = re.findall(ap_pattern, scan_data, re.DOTALL)
-
-        for match in matches:
-            ap_info = {
-                'MAC Address': match[0],
-                'Frequency': int(match[1]), # Frequency in MHz
-                'Signal Level (RSSI)': float(match[2]),  # RSSI in dBm
-                'SSID': match[3],
-                'Last Updated': datetime.now()
-            }
-            self._access_points[match[0]] = ap_info
-            networks.append(ap_info)
-            print(f"[Lookup   ]: RSSI: {match[2]} dBm, Sender: {match[0]}, SSID: {match[3]}")
+            if process.wait() != 0:
+                errors.seek(0)
+                print(f"Error: {errors.read()}")
+                return networks
         print(f"{'-'*10} Lookup Complete {'-'*10}")
         return networks
     
     def _channel_hopper(self):
+        if self.adaptive_hopping:
+            self._adaptive_channel_hopper()
+            return
+
         channels_2g = list(range(1, 14))
         channels_5g = list(range(36, 65, 4)) #+ list(range(100, 141, 4)) + list(range(149, 166, 4))
         channels = channels_2g + channels_5g
@@ -60,10 +127,70 @@ class WifiSniffer:
                 os.system(f"iw dev {self.interface} set channel {channel}")
                 time.sleep(0.1)
 
+    def _adaptive_channel_hopper(self):
+        scheduler = ChannelScheduler(self._access_points, self.known_macs)
+        switcher = channel_switcher(self.interface)
+        current_frequency = None
+        try:
+            while not self.stop_event.is_set():
+                # A bad hop is reported and retried next dwell, it mustn't end the thread
+                try:
+                    frequency = scheduler.next_frequency()
+                    if frequency is not None and frequency != current_frequency:
+                        switcher.set_frequency(frequency)
+                        current_frequency = frequency
+                except (OSError, ValueError) as error:
+                    print(f"Error hopping channel: {error}")
+                self.stop_event.wait(DWELL_SECONDS)
+        finally:
+            switcher.close()
+
+    def _capture_time(self, capture_timestamp: float, now: float) -> float:
+        if math.isnan(capture_timestamp):
+            timestamp = now if self._last_capture_time is None else self._last_capture_time
+        else:
+            if self._capture_offset is None:
+                self._capture_offset = now - capture_timestamp
+            timestamp = capture_timestamp + self._capture_offset
+        self._last_capture_time = timestamp
+        return timestamp
+
+    def _beacon_frame_callback(self, frame: BeaconFrame):
+        # Access points can't be looked up with a scan when replaying, so they're added from their own beacons
+        now = time.monotonic()
+        self._count_packet(now)
+        timestamp = self._capture_time(frame.timestamp, now)
+        if math.isnan(frame.rssi):
+            return
+        slot = self._access_points.slot(frame.sender)
+        if slot is None:
+            self._access_points.add(frame.sender, frame.ssid, frame.frequency, frame.rssi, timestamp)
+        else:
+            self._access_points.update(slot, frame.rssi, timestamp, frequency=frame.frequency or None)
+        self._publish(timestamp, frame.sender, frame.rssi)
+        self._log(f"[Beacon   ]: RSSI: {frame.rssi} dBm, Sender: {frame.sender}, SSID: {frame.ssid}")
+
+    def _fast_packet_callback(self, packet):
+        if not self.running:
+            raise KeyboardInterrupt # This stops `sniff()`
+
+        # The BPF filter only lets through beacons from known access points, so no layer checks or SSID decoding
+        timestamp = time.monotonic()
+        self._count_packet(timestamp)
+        sender = packet.addr2
+        slot = self._access_points.slot(sender)
+        if slot is not None:
+            rssi = float(packet.dBm_AntSignal)
+            self._access_points.update(slot, rssi, timestamp)
+            self._publish(timestamp, sender, rssi)
+            self._log(f"[Beacon   ]: RSSI: {rssi} dBm, Sender: {sender}")
+
     def _packet_callback(self, packet):
         if not self.running:
             raise KeyboardInterrupt # This stops `sniff()`
         
+        timestamp = time.monotonic()
+        self._count_packet(timestamp)
         rssi = packet.dBm_AntSignal
         ssid = getattr(packet, "info", b"Hidden SSID").decode(errors="ignore")  # Handle missing SSID
         sender = packet.addr2
@@ -72,11 +199,11 @@ class WifiSniffer:
         match packet:
             case _ if packet.haslayer(Dot11Beacon):
                 packetType = "Beacon   "
-                if ssid != "Hidden SSID" and sender in self._access_points.keys():
+                slot = self._access_points.slot(sender)
+                if ssid != "Hidden SSID" and slot is not None:
                     # TODO Update Frequency in case it changes
-                    self._access_points[sender]['Signal Level (RSSI)'] = float(rssi)
-                    self._access_points[sender]['SSID'] = ssid
-                    self._access_points[sender]['Last Updated'] = datetime.now()
+                    self._access_points.update(slot, float(rssi), timestamp, ssid=ssid)
+                    self._publish(timestamp, sender, float(rssi))
             case _ if packet.haslayer(Dot11ProbeReq):
                 packetType = "ProbeReq "
             case _ if packet.haslayer(Dot11ProbeResp):
@@ -85,14 +212,32 @@ class WifiSniffer:
                 packetType = "Other    "
         
         if packetType != "Other    ":
-            print(f"[{packetType}]: RSSI: {rssi} dBm, Sender: {sender}, Receiver: {receiver}, SSID: {ssid}")
+            self._log(f"[{packetType}]: RSSI: {rssi} dBm, Sender: {sender}, Receiver: {receiver}, SSID: {ssid}")
+
+    def _run_capture_source(self):
+        print(f"Reading from capture source {type(self.capture_source).__name__}...")
+        for frame in self.capture_source.frames():
+            if not self.running:
+                break
+            self._beacon_frame_callback(frame)
+        self.capture_source.close()
+        print("Capture source finished.")
 
     def _run_sniffer(self):
+        if self.capture_source is not None:
+            self._run_capture_source()
+            return
+
         try:
             print("Starting channel hopper...")
             Thread(target=self._channel_hopper, daemon=True).start()
             print(f"Sniffing on interface {self.interface}...")
-            sniff(iface=self.interface, prn=self._packet_callback, store=0, monitor=True)
+            if self.fast_capture:
+                bpf_filter = self.bpf_filter()
+                print(f"Fast capture with filter: {bpf_filter}")
+                sniff(iface=self.interface, prn=self._fast_packet_callback, filter=bpf_filter, store=0, monitor=True)
+            else:
+                sniff(iface=self.interface, prn=self._packet_callback, store=0, monitor=True)
         except KeyboardInterrupt:
             print("Sniffing stopped.")
 